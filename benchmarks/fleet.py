@@ -0,0 +1,352 @@
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+NAMESPACE = uuid.UUID('5f3e43b5-6a0c-4f0b-9c59-6f0ce6b2c1a4')
+
+MANUFACTURERS = ['Samsung', 'Lenovo', 'Zebra', 'Honeywell', 'Shenzhen']
+TAGS = ['kiosk', 'warehouse', 'retail', 'pos', 'signage', 'field']
+
+
+def stable_id(kind: str, index) -> str:
+    return str(uuid.uuid5(NAMESPACE, f"{kind}-{index}"))
+
+
+def timestamp(offset_days: int = 0) -> str:
+    return (datetime(2019, 6, 1) + timedelta(days=offset_days)).isoformat() + 'Z'
+
+
+class Fleet(object):
+    """
+    Deterministic synthetic Esper tenant. Devices are materialized on demand from their index, so a
+    fleet of 100k devices only keeps a few small lookup tables in memory.
+    """
+
+    def __init__(self,
+                 devices: int = 1000,
+                 groups: int = 10,
+                 applications: int = 20,
+                 versions: int = 3,
+                 command_duration: float = 2.0,
+                 failure_rate: float = 0.02,
+                 seed: int = 0):
+        self.enterprise_id = stable_id('enterprise', seed)
+        self.device_count = devices
+        self.command_duration = command_duration
+        self.failure_rate = failure_rate
+        self.seed = seed
+
+        self.device_ids = [stable_id('device', i) for i in range(devices)]
+        self.device_index = {device_id: i for i, device_id in enumerate(self.device_ids)}
+        self.device_names = {self.device_name(i).lower(): i for i in range(devices)}
+        self.aliases = {}
+
+        # Group 0 is the default group holding the whole fleet
+        self.groups = {}
+        self.add_group('All devices', range(devices))
+        for g in range(groups):
+            self.add_group(f'Group {g + 1}', range(g, devices, max(groups, 1)))
+
+        self.applications = {}
+        self.versions = {}
+        for a in range(applications):
+            self.add_application(f'Bench App {a + 1}', f'io.esper.bench.app{a + 1}',
+                                 [str(100 + v) for v in range(versions)])
+
+        self.commands = {}
+        self.group_commands = {}
+        self.pipelines = {}
+        self.stages = {}
+        self.operations = {}
+        self.executions = {}
+        self.remoteadb_sessions = {}
+
+    # Devices
+
+    def device_name(self, i: int) -> str:
+        return f'ESR-BNC-{i:06d}'
+
+    def device_status(self, i: int) -> int:
+        # ~90% ACTIVE, the rest INACTIVE or DISABLED
+        bucket = (i * 7919 + self.seed) % 100
+        if bucket < 90:
+            return 1
+        return 60 if bucket < 97 else 20
+
+    def device_tags(self, i: int):
+        return [TAGS[i % len(TAGS)], TAGS[(i // len(TAGS)) % len(TAGS)]]
+
+    def device(self, i: int) -> dict:
+        device_id = self.device_ids[i]
+        status = self.device_status(i)
+        return {
+            'id': device_id,
+            'url': f'/api/enterprise/{self.enterprise_id}/device/{device_id}/',
+            'device_name': self.device_name(i),
+            'alias_name': self.aliases.get(i, ''),
+            'policy_name': 'Default policy',
+            'status': status,
+            'state': status,
+            'suid': f'{i:016x}',
+            'enterprise': self.enterprise_id,
+            'groups': [group_id for group_id, group in self.groups.items() if i in group['members']][:4],
+            'tags': self.device_tags(i),
+            'api_level': 26 + i % 4,
+            'template_name': 'Bench template',
+            'is_gms': bool(i % 2),
+            'hardwareInfo': {
+                'manufacturer': MANUFACTURERS[i % len(MANUFACTURERS)],
+                'brand': MANUFACTURERS[i % len(MANUFACTURERS)].lower(),
+                'serialNumber': f'SN{i:08d}'
+            },
+            'networkInfo': {
+                'imei1': f'35{i:013d}'
+            },
+            'softwareInfo': {},
+            'provisioned_on': timestamp(i % 365)
+        }
+
+    def find_device(self, name: str):
+        name = name.lower()
+        if name in self.device_names:
+            return self.device_names[name]
+
+        for i, alias in self.aliases.items():
+            if alias.lower() == name:
+                return i
+        return None
+
+    def filter_devices(self, params: dict):
+        """Return the ordered device indexes matching the `get_all_devices` query parameters"""
+        if params.get('name'):
+            i = self.find_device(params['name'])
+            candidates = [] if i is None else [i]
+        elif params.get('group'):
+            group = self.groups.get(params['group'])
+            candidates = sorted(group['members']) if group else []
+        else:
+            candidates = range(self.device_count)
+
+        state = params.get('state')
+        search = (params.get('search') or '').lower()
+        serial = params.get('serial')
+        imei = params.get('imei')
+        tags = params.get('tags')
+
+        if not (state or search or serial or imei or tags):
+            return candidates
+
+        matched = []
+        for i in candidates:
+            if state and self.device_status(i) != int(state):
+                continue
+            if search and search not in self.device_name(i).lower() and search not in self.device_ids[i]:
+                continue
+            if serial and serial != f'SN{i:08d}':
+                continue
+            if imei and imei != f'35{i:013d}':
+                continue
+            if tags and tags not in self.device_tags(i):
+                continue
+            matched.append(i)
+
+        return matched
+
+    def installs(self, i: int, params: dict):
+        installs = []
+        for a, application in enumerate(self.applications.values()):
+            if (i + a) % 3 == 0:
+                continue
+
+            versions = application['versions']
+            version = self.versions[versions[(i + a) % len(versions)]]
+            state = 'INSTALL_SUCCESS' if (i + a) % 17 else 'INSTALL_FAILED'
+
+            if params.get('package_name') and params['package_name'] != application['package_name']:
+                continue
+            if params.get('application_name') and params['application_name'] != application['application_name']:
+                continue
+            if params.get('install_state') and params['install_state'] != state:
+                continue
+
+            installs.append({
+                'id': stable_id('install', f'{i}-{a}'),
+                'application': {
+                    'application_name': application['application_name'],
+                    'package_name': application['package_name'],
+                    'version': {
+                        'version_code': version['version_code'],
+                        'build_number': version['build_number']
+                    },
+                    'is_enabled': True
+                },
+                'install_state': state,
+                'enterprise': self.enterprise_id,
+                'device': self.device_ids[i]
+            })
+
+        return installs
+
+    def status_event(self, i: int) -> dict:
+        data = {
+            'powerManagementEvent': {'batteryStatus': {'batteryLevel': 20 + i % 80, 'batteryTemperature': 30}},
+            'dataUsageStats': {'totalDataDownload': i * 13 % 9000, 'totalDataUpload': i * 7 % 4000},
+            'memoryEvents': [{'countInMb': 1024}, {'countInMb': 8192}],
+            'networkEvent': {'wifiNetworkInfo': {'linkSpeed': 72, 'signalStrength': -50}}
+        }
+        return {
+            'id': stable_id('status', i),
+            'data': repr(data),
+            'device': self.device_ids[i],
+            'enterprise': self.enterprise_id,
+            'created_on': timestamp()
+        }
+
+    # Groups
+
+    def add_group(self, name: str, members=()) -> dict:
+        group_id = stable_id('group', f'{len(self.groups)}-{name}')
+        self.groups[group_id] = {'id': group_id, 'name': name, 'members': set(members)}
+        return self.groups[group_id]
+
+    def group(self, group_id: str) -> dict:
+        group = self.groups[group_id]
+        return {
+            'id': group['id'],
+            'name': group['name'],
+            'device_count': len(group['members']),
+            'enterprise': self.enterprise_id
+        }
+
+    # Applications
+
+    def add_application(self, name: str, package: str, version_codes) -> dict:
+        application_id = stable_id('application', package)
+        application = {
+            'id': application_id,
+            'application_name': name,
+            'package_name': package,
+            'developer': 'Esper Bench',
+            'category': 'Tools',
+            'content_rating': 0.0,
+            'compatibility': None,
+            'enterprise': self.enterprise_id,
+            'versions': []
+        }
+        self.applications[application_id] = application
+
+        for version_code in version_codes:
+            self.add_version(application, version_code)
+
+        return application
+
+    def add_version(self, application: dict, version_code: str, size: int = 2 * 1024 * 1024) -> dict:
+        version_id = stable_id('version', f"{application['package_name']}-{version_code}")
+        self.versions[version_id] = {
+            'id': version_id,
+            'version_code': version_code,
+            'version_name': f'1.0.{version_code}',
+            'build_number': version_code,
+            'size_in_mb': size / (1024.0 * 1024.0),
+            'size': size,
+            'hash_string': stable_id('hash', version_id),
+            'release_track': 'Production',
+            'installed_count': 0,
+            'permissions': [],
+            'enterprise': self.enterprise_id,
+            'application': application['id']
+        }
+        if version_id not in application['versions']:
+            application['versions'].append(version_id)
+        return self.versions[version_id]
+
+    def application(self, application_id: str) -> dict:
+        application = dict(self.applications[application_id])
+        application['versions'] = [self.version(version_id) for version_id in application['versions']]
+        return application
+
+    def version(self, version_id: str) -> dict:
+        version = dict(self.versions[version_id])
+        version.pop('size')
+        return version
+
+    # Commands
+
+    def _progress(self, created: float, salt: str):
+        """Deterministic command outcome for a device, based on the time elapsed since creation"""
+        rng = random.Random(f'{self.seed}-{salt}')
+        finishes_at = created + rng.uniform(0.1, 1.0) * self.command_duration
+        if time.time() < finishes_at:
+            return 'in_progress'
+        return 'failed' if rng.random() < self.failure_rate else 'success'
+
+    def create_command(self, i: int, request: dict) -> dict:
+        command_id = str(uuid.uuid4())
+        self.commands[command_id] = {
+            'id': command_id,
+            'command': request.get('command'),
+            'command_args': request.get('command_args') or {},
+            'device': self.device_ids[i],
+            'enterprise': self.enterprise_id,
+            'created': time.time()
+        }
+        return self.command(command_id)
+
+    def command(self, command_id: str) -> dict:
+        command = self.commands[command_id]
+        progress = self._progress(command['created'], command_id)
+        state = {
+            'in_progress': 'Command In Progress',
+            'success': 'Command Success',
+            'failed': 'Command Failure'
+        }[progress]
+        if self.device_status(self.device_index[command['device']]) != 1:
+            state = 'Command Initiated'
+
+        return {
+            'id': command['id'],
+            'command': command['command'],
+            'command_args': command['command_args'],
+            'state': state,
+            'details': '',
+            'enterprise': command['enterprise'],
+            'device': command['device']
+        }
+
+    def create_group_command(self, group_id: str, request: dict) -> dict:
+        command_id = str(uuid.uuid4())
+        self.group_commands[command_id] = {
+            'id': command_id,
+            'command': request.get('command'),
+            'command_args': request.get('command_args') or {},
+            'group': group_id,
+            'members': sorted(self.groups[group_id]['members']),
+            'created': time.time()
+        }
+        return self.group_command(command_id)
+
+    def group_command(self, command_id: str) -> dict:
+        command = self.group_commands[command_id]
+        details = {'success': [], 'failed': [], 'inactive': [], 'in_progress': []}
+        for i in command['members']:
+            entry = {'id': self.device_ids[i], 'name': self.device_name(i)}
+            if self.device_status(i) != 1:
+                details['inactive'].append(entry)
+            else:
+                details[self._progress(command['created'], f'{command_id}-{i}')].append(entry)
+
+        if details['in_progress']:
+            state = 'Command Initiated'
+        else:
+            state = 'Command Failure' if details['failed'] else 'Command Success'
+
+        return {
+            'id': command['id'],
+            'command': command['command'],
+            'command_args': command['command_args'],
+            'state': state,
+            'details': repr(details),
+            'enterprise': self.enterprise_id,
+            'group': command['group']
+        }
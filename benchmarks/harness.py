@@ -0,0 +1,175 @@
+"""
+End-to-end CLI benchmarks against the local mock Esper API.
+
+    python -m benchmarks.harness --devices 100000 --latency-ms 20 --repeat 3
+
+Every command runs as a fresh `espercli` process with its own HOME, so the numbers include
+interpreter start-up and imports just like a user's shell would see.
+"""
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+from tabulate import tabulate
+from tinydb import TinyDB
+
+from benchmarks.fleet import Fleet
+from benchmarks.mock_api import MockEsperAPI, MockServer
+from esper.ext.db_wrapper import DBWrapper
+
+# (label, argv). `{group}`, `{device}`, `{application}` and `{version}` are filled from the fleet.
+DEFAULT_SCENARIOS = [
+    ('enterprise show', ['enterprise', 'show']),
+    ('device list', ['device', 'list']),
+    ('device list (1000)', ['device', 'list', '-l', '1000']),
+    ('device show', ['device', 'show', '{device}']),
+    ('installs list', ['installs', 'list', '-d', '{device}']),
+    ('group list', ['group', 'list']),
+    ('group devices', ['group', 'devices', '-g', '{group}', '-l', '1000']),
+    ('group add', ['group', 'add', '-g', '{group}', '-d', '{device}']),
+    ('app list', ['app', 'list']),
+    ('version list', ['version', 'list', '-a', '{application}']),
+]
+
+
+def run_command(argv, env: dict) -> dict:
+    """
+    Run one CLI invocation and measure it
+    :param argv: CLI arguments, without the program name
+    :param env: Environment for the child process
+    :return: Wall time, exit status and peak RSS of the child
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'esper.main', *argv], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+
+    stderr = process.stderr.read().decode('utf-8', 'replace')
+    process.stderr.close()
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak_rss = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+    return {
+        'wall_s': elapsed,
+        'exit_code': process.returncode,
+        'peak_rss_mb': peak_rss / (1024.0 * 1024.0),
+        'stderr': stderr
+    }
+
+
+def prepare_home(fleet: Fleet) -> str:
+    """Create a throwaway HOME with credentials for the mock enterprise"""
+    home = tempfile.mkdtemp(prefix='esper-bench-')
+    db_dir = os.path.join(home, '.esper', 'db')
+    os.makedirs(db_dir)
+
+    db = DBWrapper(TinyDB(os.path.join(db_dir, 'creds.json')))
+    db.set_configure({
+        'environment': 'bench',
+        'api_key': 'bench-token',
+        'enterprise_id': fleet.enterprise_id
+    })
+    return home
+
+
+def expand(argv, fleet: Fleet):
+    group_id = list(fleet.groups)[1] if len(fleet.groups) > 1 else list(fleet.groups)[0]
+    application_id = next(iter(fleet.applications), '')
+    values = {
+        'group': fleet.groups[group_id]['name'],
+        'device': fleet.device_name(0),
+        'application': application_id,
+        'version': fleet.applications[application_id]['versions'][0] if application_id else ''
+    }
+    return [arg.format(**values) for arg in argv]
+
+
+def run_benchmarks(fleet: Fleet, scenarios, latency_ms: float = 0.0, jitter_ms: float = 0.0, repeat: int = 1):
+    api = MockEsperAPI(fleet, latency_ms=latency_ms, jitter_ms=jitter_ms)
+    results = []
+
+    with MockServer(api) as server:
+        env = dict(os.environ)
+        env.update({'ESPER_API_HOST': server.url, 'HOME': prepare_home(fleet)})
+
+        for label, argv in scenarios:
+            argv = expand(argv, fleet)
+            for run in range(repeat):
+                before = api.request_count
+                measured = run_command(argv, env)
+                measured.update({
+                    'command': label,
+                    'run': run + 1,
+                    'argv': argv,
+                    'requests': api.request_count - before
+                })
+                results.append(measured)
+
+    return results
+
+
+def summarize(results):
+    rows = []
+    by_command = {}
+    for result in results:
+        by_command.setdefault(result['command'], []).append(result)
+
+    for command, runs in by_command.items():
+        walls = sorted(r['wall_s'] for r in runs)
+        rows.append({
+            'COMMAND': command,
+            'RUNS': len(runs),
+            'FAILED': sum(1 for r in runs if r['exit_code'] != 0),
+            'REQUESTS': max(r['requests'] for r in runs),
+            'MIN S': round(walls[0], 3),
+            'MEDIAN S': round(walls[len(walls) // 2], 3),
+            'MAX S': round(walls[-1], 3),
+            'PEAK RSS MB': round(max(r['peak_rss_mb'] for r in runs), 1)
+        })
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark espercli commands against a local mock API')
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--applications', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency added to every API response')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Random +/- jitter on top of the latency')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per command')
+    parser.add_argument('--command', action='append', dest='commands', metavar='ARGS',
+                        help='Benchmark this command line instead of the default set (repeatable)')
+    parser.add_argument('--json', dest='json_file', help='Also write the raw measurements to this file')
+    args = parser.parse_args()
+
+    scenarios = DEFAULT_SCENARIOS
+    if args.commands:
+        scenarios = [(command, shlex.split(command)) for command in args.commands]
+
+    fleet = Fleet(devices=args.devices, groups=args.groups, applications=args.applications)
+    results = run_benchmarks(fleet, scenarios, args.latency_ms, args.jitter_ms, args.repeat)
+
+    print(f"{args.devices} devices, {args.latency_ms}ms latency, {args.repeat} run(s) per command\n")
+    print(tabulate(summarize(results), headers='keys', tablefmt='plain'))
+
+    for result in results:
+        if result['exit_code'] != 0:
+            print(f"\n{result['command']} exited with {result['exit_code']}:\n{result['stderr']}", file=sys.stderr)
+            break
+
+    if args.json_file:
+        with open(args.json_file, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
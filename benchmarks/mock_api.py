@@ -0,0 +1,683 @@
+"""
+Local stand-in for the Esper API, backed by a synthetic fleet.
+
+    python -m benchmarks.mock_api --devices 100000 --latency-ms 20 --port 8000
+    ESPER_API_HOST=http://127.0.0.1:8000 espercli device list
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+from benchmarks.fleet import Fleet, stable_id, timestamp
+from esper.ext.apk import read_manifest
+
+ID = r'(?P<{}>[0-9a-fA-F-]{{36}})'
+ENTERPRISE = r'/api(?:/v[01])?/enterprise/' + ID.format('enterprise_id')
+
+
+def route(method: str, pattern: str):
+    def decorator(func):
+        func.route = (method, re.compile('^' + pattern.replace('{enterprise}', ENTERPRISE) + '/?$'))
+        return func
+
+    return decorator
+
+
+class MockEsperAPI(object):
+    """Request router and handlers. Handlers return `(status, payload)` tuples."""
+
+    def __init__(self, fleet: Fleet, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_limit: float = 0.0):
+        self.fleet = fleet
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.host = None
+
+        # Requests per second answered before replying 429, like the real tenant limits; 0 for no limit
+        self.rate_limit = rate_limit
+        self.window = (0, 0)
+        self.throttled_count = 0
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.requests_by_route = {}
+
+        self.routes = []
+        for name in dir(self):
+            handler = getattr(self, name)
+            if hasattr(handler, 'route'):
+                method, pattern = handler.route
+                self.routes.append((method, pattern, handler))
+
+    def dispatch(self, method: str, path: str, params: dict, body: dict):
+        for route_method, pattern, handler in self.routes:
+            if route_method != method:
+                continue
+
+            match = pattern.match(path)
+            if match:
+                with self.lock:
+                    if self.rate_limit and not path.startswith('/__mock__'):
+                        second, count = self.window
+                        now = int(time.time())
+                        count = count + 1 if second == now else 1
+                        self.window = (now, count)
+                        if count > self.rate_limit:
+                            self.throttled_count += 1
+                            return 429, {'message': 'Request was throttled.'}
+
+                    self.request_count += 1
+                    key = f'{method} {handler.__name__}'
+                    self.requests_by_route[key] = self.requests_by_route.get(key, 0) + 1
+
+                if self.latency_ms or self.jitter_ms:
+                    time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0)
+
+                kwargs = match.groupdict()
+                kwargs.pop('enterprise_id', None)
+                with self.lock:
+                    return handler(params, body, **kwargs)
+
+        return 404, {'message': f'No route for {method} {path}'}
+
+    @staticmethod
+    def paginate(items, params: dict, render=lambda item: item):
+        limit = int(params.get('limit', 20))
+        offset = int(params.get('offset', 0))
+        page = items[offset:offset + limit]
+        return 200, {
+            'count': len(items),
+            'next': None,
+            'previous': None,
+            'results': [render(item) for item in page]
+        }
+
+    # Internal
+
+    @route('GET', '/__mock__/stats')
+    def stats(self, params, body):
+        return 200, {
+            'requests': self.request_count,
+            'throttled': self.throttled_count,
+            'by_route': dict(self.requests_by_route)
+        }
+
+    @route('GET', r'/__mock__/files/(?P<version_id>[0-9a-fA-F-]{36})\.apk')
+    def download_file(self, params, body, version_id):
+        version = self.fleet.versions.get(version_id)
+        if not version:
+            return 404, {'message': 'Not found'}
+        return 200, b'\0' * version['size']
+
+    # Token and enterprise
+
+    @route('GET', '/api/v1/token-info')
+    def token_info(self, params, body):
+        return 200, {
+            'id': 1,
+            'enterprise': self.fleet.enterprise_id,
+            'user': 'bench@esper.io',
+            'developer_app': 'bench',
+            'token': 'bench-token',
+            'expires_on': timestamp(3650),
+            'scope': ['read', 'write'],
+            'created_on': timestamp(),
+            'updated_on': timestamp()
+        }
+
+    @route('GET', '{enterprise}')
+    def enterprise(self, params, body):
+        return 200, {
+            'id': self.fleet.enterprise_id,
+            'name': 'Bench Enterprise',
+            'short_code': 'bench',
+            'registered_name': 'Bench Enterprise Inc.',
+            'registered_address': '1 Bench Way',
+            'location': 'Bellevue',
+            'zipcode': '98004',
+            'contact_person': 'Bench',
+            'contact_number': '+10000000000',
+            'contact_email': 'bench@esper.io',
+            'emm': {},
+            'is_active': True
+        }
+
+    # Devices
+
+    @route('GET', '{enterprise}/device')
+    def list_devices(self, params, body):
+        return self.paginate(self.fleet.filter_devices(params), params, self.fleet.device)
+
+    @route('GET', '{enterprise}/device/' + ID.format('device_id'))
+    def get_device(self, params, body, device_id):
+        if device_id not in self.fleet.device_index:
+            return 404, {'message': 'Not found'}
+        return 200, self.fleet.device(self.fleet.device_index[device_id])
+
+    @route('GET', '{enterprise}/device/' + ID.format('device_id') + '/install')
+    def list_installs(self, params, body, device_id):
+        if device_id not in self.fleet.device_index:
+            return 404, {'message': 'Not found'}
+        return self.paginate(self.fleet.installs(self.fleet.device_index[device_id], params), params)
+
+    @route('GET', '{enterprise}/device/' + ID.format('device_id') + '/status')
+    def device_status(self, params, body, device_id):
+        if device_id not in self.fleet.device_index:
+            return 404, {'message': 'Not found'}
+        return self.paginate([self.fleet.status_event(self.fleet.device_index[device_id])], params)
+
+    @route('POST', '{enterprise}/device/' + ID.format('device_id') + '/command')
+    def run_command(self, params, body, device_id):
+        if device_id not in self.fleet.device_index:
+            return 404, {'message': 'Not found'}
+        return 201, self.fleet.create_command(self.fleet.device_index[device_id], body)
+
+    @route('GET', '{enterprise}/device/' + ID.format('device_id') + '/command/' + ID.format('command_id'))
+    def get_command(self, params, body, device_id, command_id):
+        if command_id not in self.fleet.commands:
+            return 404, {'message': 'Not found'}
+        return 200, self.fleet.command(command_id)
+
+    # Groups
+
+    @route('GET', '{enterprise}/devicegroup')
+    def list_groups(self, params, body):
+        groups = list(self.fleet.groups)
+        if params.get('name'):
+            groups = [g for g in groups if self.fleet.groups[g]['name'] == params['name']]
+        return self.paginate(groups, params, self.fleet.group)
+
+    @route('POST', '{enterprise}/devicegroup')
+    def create_group(self, params, body):
+        if any(group['name'] == body.get('name') for group in self.fleet.groups.values()):
+            return 400, {'message': 'Group with this name already exists.', 'errors': ['name']}
+
+        members = [self.fleet.device_index[d] for d in body.get('device_ids') or [] if d in self.fleet.device_index]
+        group = self.fleet.add_group(body.get('name'), members)
+        return 201, self.fleet.group(group['id'])
+
+    @route('GET', '{enterprise}/devicegroup/' + ID.format('group_id'))
+    def get_group(self, params, body, group_id):
+        if group_id not in self.fleet.groups:
+            return 404, {'message': 'Not found'}
+        return 200, self.fleet.group(group_id)
+
+    @route('PATCH', '{enterprise}/devicegroup/' + ID.format('group_id'))
+    def update_group(self, params, body, group_id):
+        if group_id not in self.fleet.groups:
+            return 404, {'message': 'Not found'}
+
+        group = self.fleet.groups[group_id]
+        if body.get('name'):
+            group['name'] = body['name']
+        if body.get('device_ids') is not None:
+            group['members'] = {self.fleet.device_index[d] for d in body['device_ids']
+                                if d in self.fleet.device_index}
+        return 200, self.fleet.group(group_id)
+
+    @route('DELETE', '{enterprise}/devicegroup/' + ID.format('group_id'))
+    def delete_group(self, params, body, group_id):
+        if self.fleet.groups.pop(group_id, None) is None:
+            return 404, {'message': 'Not found'}
+        return 204, None
+
+    @route('POST', '{enterprise}/devicegroup/' + ID.format('group_id') + '/command')
+    def run_group_command(self, params, body, group_id):
+        if group_id not in self.fleet.groups:
+            return 404, {'message': 'Not found'}
+        return 201, self.fleet.create_group_command(group_id, body)
+
+    @route('GET', '{enterprise}/devicegroup/' + ID.format('group_id') + '/command/' + ID.format('command_id'))
+    def get_group_command(self, params, body, group_id, command_id):
+        if command_id not in self.fleet.group_commands:
+            return 404, {'message': 'Not found'}
+        return 200, self.fleet.group_command(command_id)
+
+    # Applications
+
+    def _version(self, version_id):
+        version = self.fleet.version(version_id)
+        version['app_file'] = f'{self.host}/__mock__/files/{version_id}.apk'
+        return version
+
+    @route('GET', '{enterprise}/application')
+    def list_applications(self, params, body):
+        applications = list(self.fleet.applications.values())
+        if params.get('application_name'):
+            applications = [a for a in applications if params['application_name'] in a['application_name']]
+        if params.get('package_name'):
+            applications = [a for a in applications if a['package_name'] == params['package_name']]
+        return self.paginate([a['id'] for a in applications], params, self.fleet.application)
+
+    @route('POST', '{enterprise}/application/upload')
+    def upload_application(self, params, body):
+        package = body.get('package_name') or f'io.esper.bench.upload{len(self.fleet.applications) + 1}'
+        version_code = body.get('version_code') or '1'
+
+        existing = [a for a in self.fleet.applications.values() if a['package_name'] == package]
+        if existing:
+            application = existing[0]
+            self.fleet.add_version(application, version_code, size=body.get('size') or 1024)
+        else:
+            application = self.fleet.add_application(body.get('filename') or package, package, [version_code])
+
+        return 201, {'application': self.fleet.application(application['id'])}
+
+    @route('GET', '{enterprise}/application/' + ID.format('application_id'))
+    def get_application(self, params, body, application_id):
+        if application_id not in self.fleet.applications:
+            return 404, {'message': 'Not found'}
+        return 200, self.fleet.application(application_id)
+
+    @route('DELETE', '{enterprise}/application/' + ID.format('application_id'))
+    def delete_application(self, params, body, application_id):
+        application = self.fleet.applications.pop(application_id, None)
+        if not application:
+            return 404, {'message': 'Not found'}
+        for version_id in application['versions']:
+            self.fleet.versions.pop(version_id, None)
+        return 204, None
+
+    @route('GET', '{enterprise}/application/' + ID.format('application_id') + '/version')
+    def list_versions(self, params, body, application_id):
+        if application_id not in self.fleet.applications:
+            return 404, {'message': 'Not found'}
+        versions = self.fleet.applications[application_id]['versions']
+        if params.get('version_code'):
+            versions = [v for v in versions if self.fleet.versions[v]['version_code'] == params['version_code']]
+        if params.get('build_number'):
+            versions = [v for v in versions if self.fleet.versions[v]['build_number'] == params['build_number']]
+        return self.paginate(versions, params, self._version)
+
+    @route('GET', '{enterprise}/application/' + ID.format('application_id') + '/version/' + ID.format('version_id'))
+    def get_version(self, params, body, application_id, version_id):
+        if version_id not in self.fleet.versions:
+            return 404, {'message': 'Not found'}
+        return 200, self._version(version_id)
+
+    @route('DELETE', '{enterprise}/application/' + ID.format('application_id') + '/version/' +
+           ID.format('version_id'))
+    def delete_version(self, params, body, application_id, version_id):
+        if self.fleet.versions.pop(version_id, None) is None:
+            return 404, {'message': 'Not found'}
+        self.fleet.applications[application_id]['versions'].remove(version_id)
+        return 204, None
+
+    # Telemetry
+
+    @route('GET', r'/api/graph/(?P<category>\w+)/(?P<metric>\w+)')
+    def telemetry(self, params, body, category, metric):
+        return 200, {'data': [{'x': timestamp(d), 'y': d * 3 % 100} for d in range(24)]}
+
+    # Pipelines
+
+    def _pipeline(self, pipeline_id):
+        pipeline = dict(self.fleet.pipelines[pipeline_id])
+        pipeline['stages'] = [self._stage(s) for s in self.fleet.stages
+                              if self.fleet.stages[s]['pipeline'] == pipeline_id]
+        return pipeline
+
+    def _stage(self, stage_id):
+        stage = dict(self.fleet.stages[stage_id])
+        stage['operations'] = [dict(o) for o in self.fleet.operations.values() if o['stage'] == stage_id]
+        return stage
+
+    @route('GET', '{enterprise}/pipeline')
+    def list_pipelines(self, params, body):
+        return self.paginate(list(self.fleet.pipelines), params, self._pipeline)
+
+    @route('POST', '{enterprise}/pipeline')
+    def create_pipeline(self, params, body):
+        pipeline_id = str(uuid.uuid4())
+        self.fleet.pipelines[pipeline_id] = {
+            'id': pipeline_id,
+            'name': body.get('name'),
+            'description': body.get('description'),
+            'trigger': body.get('trigger'),
+            'version': 1,
+            'enterprise': self.fleet.enterprise_id
+        }
+        return 201, self._pipeline(pipeline_id)
+
+    @route('GET', '{enterprise}/pipeline/' + ID.format('pipeline_id'))
+    def get_pipeline(self, params, body, pipeline_id):
+        if pipeline_id not in self.fleet.pipelines:
+            return 404, {'message': 'Not found'}
+        return 200, self._pipeline(pipeline_id)
+
+    @route('PATCH', '{enterprise}/pipeline/' + ID.format('pipeline_id'))
+    def update_pipeline(self, params, body, pipeline_id):
+        if pipeline_id not in self.fleet.pipelines:
+            return 404, {'message': 'Not found'}
+        pipeline = self.fleet.pipelines[pipeline_id]
+        pipeline.update({k: v for k, v in body.items() if k in ('name', 'description', 'trigger')})
+        pipeline['version'] += 1
+        return 200, self._pipeline(pipeline_id)
+
+    @route('DELETE', '{enterprise}/pipeline/' + ID.format('pipeline_id'))
+    def delete_pipeline(self, params, body, pipeline_id):
+        if self.fleet.pipelines.pop(pipeline_id, None) is None:
+            return 404, {'message': 'Not found'}
+        return 204, None
+
+    @route('GET', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage')
+    def list_stages(self, params, body, pipeline_id):
+        stages = [s for s, stage in self.fleet.stages.items() if stage['pipeline'] == pipeline_id]
+        return self.paginate(stages, params, self._stage)
+
+    @route('POST', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage')
+    def create_stage(self, params, body, pipeline_id):
+        if pipeline_id not in self.fleet.pipelines:
+            return 404, {'message': 'Not found'}
+
+        ordering = int(body.get('ordering') or 0)
+        if any(s['pipeline'] == pipeline_id and s['ordering'] == ordering for s in self.fleet.stages.values()):
+            return 400, {'message': 'The fields pipeline, ordering must make a unique set.', 'errors': ['ordering']}
+
+        stage_id = str(uuid.uuid4())
+        self.fleet.stages[stage_id] = {
+            'id': stage_id,
+            'name': body.get('name'),
+            'description': body.get('description'),
+            'ordering': ordering,
+            'version': 1,
+            'pipeline': pipeline_id
+        }
+        return 201, self._stage(stage_id)
+
+    @route('GET', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage/' + ID.format('stage_id'))
+    def get_stage(self, params, body, pipeline_id, stage_id):
+        if stage_id not in self.fleet.stages:
+            return 404, {'message': 'Not found'}
+        return 200, self._stage(stage_id)
+
+    @route('PATCH', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage/' + ID.format('stage_id'))
+    def update_stage(self, params, body, pipeline_id, stage_id):
+        if stage_id not in self.fleet.stages:
+            return 404, {'message': 'Not found'}
+        stage = self.fleet.stages[stage_id]
+        stage.update({k: v for k, v in body.items() if k in ('name', 'description')})
+        if body.get('ordering'):
+            stage['ordering'] = int(body['ordering'])
+        stage['version'] += 1
+        return 200, self._stage(stage_id)
+
+    @route('DELETE', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage/' + ID.format('stage_id'))
+    def delete_stage(self, params, body, pipeline_id, stage_id):
+        if self.fleet.stages.pop(stage_id, None) is None:
+            return 404, {'message': 'Not found'}
+        for operation_id in [o for o, op in self.fleet.operations.items() if op['stage'] == stage_id]:
+            self.fleet.operations.pop(operation_id)
+        return 204, None
+
+    @route('GET', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage/' + ID.format('stage_id') +
+           '/operation')
+    def list_operations(self, params, body, pipeline_id, stage_id):
+        operations = [o for o in self.fleet.operations.values() if o['stage'] == stage_id]
+        return self.paginate(operations, params)
+
+    @route('POST', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage/' + ID.format('stage_id') +
+           '/operation')
+    def create_operation(self, params, body, pipeline_id, stage_id):
+        if stage_id not in self.fleet.stages:
+            return 404, {'message': 'Not found'}
+
+        operation_id = str(uuid.uuid4())
+        self.fleet.operations[operation_id] = {
+            'id': operation_id,
+            'name': body.get('name'),
+            'description': body.get('description'),
+            'action': body.get('action'),
+            'action_args': body.get('action_args'),
+            'stage': stage_id
+        }
+        return 201, dict(self.fleet.operations[operation_id])
+
+    @route('PATCH', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage/' + ID.format('stage_id') +
+           '/operation/' + ID.format('operation_id'))
+    def update_operation(self, params, body, pipeline_id, stage_id, operation_id):
+        if operation_id not in self.fleet.operations:
+            return 404, {'message': 'Not found'}
+        operation = self.fleet.operations[operation_id]
+        operation.update({k: v for k, v in body.items() if k in ('name', 'description', 'action', 'action_args')})
+        return 200, dict(operation)
+
+    @route('DELETE', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/stage/' + ID.format('stage_id') +
+           '/operation/' + ID.format('operation_id'))
+    def delete_operation(self, params, body, pipeline_id, stage_id, operation_id):
+        if self.fleet.operations.pop(operation_id, None) is None:
+            return 404, {'message': 'Not found'}
+        return 204, None
+
+    def _execution(self, execution_id):
+        execution = dict(self.fleet.executions[execution_id])
+        elapsed = time.time() - execution.pop('created')
+        stages = sorted((s for s in self.fleet.stages.values() if s['pipeline'] == execution['pipeline']),
+                        key=lambda s: s['ordering'])
+
+        if execution['state'] == 'RUNNING':
+            finished = int(elapsed / max(self.fleet.command_duration, 0.001))
+            if finished >= len(stages):
+                execution['state'] = 'COMPLETED'
+                execution['status'] = 'SUCCESS'
+            execution['stage_runs'] = [
+                {'stage': s['id'], 'name': s['name'], 'ordering': s['ordering'],
+                 'state': 'COMPLETED' if n < finished else ('RUNNING' if n == finished else 'PENDING')}
+                for n, s in enumerate(stages)
+            ]
+        return execution
+
+    @route('GET', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/execute')
+    def list_executions(self, params, body, pipeline_id):
+        executions = [e for e, ex in self.fleet.executions.items() if ex['pipeline'] == pipeline_id]
+        return self.paginate(executions, params, self._execution)
+
+    @route('POST', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/execute')
+    def execute_pipeline(self, params, body, pipeline_id):
+        if pipeline_id not in self.fleet.pipelines:
+            return 404, {'message': 'Not found'}
+
+        execution_id = str(uuid.uuid4())
+        self.fleet.executions[execution_id] = {
+            'id': execution_id,
+            'name': self.fleet.pipelines[pipeline_id]['name'],
+            'description': self.fleet.pipelines[pipeline_id]['description'],
+            'state': 'RUNNING',
+            'status': 'IN_PROGRESS',
+            'reason': None,
+            'pipeline': pipeline_id,
+            'created': time.time()
+        }
+        return 201, self._execution(execution_id)
+
+    @route('GET', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/execute/' + ID.format('execution_id'))
+    def get_execution(self, params, body, pipeline_id, execution_id):
+        if execution_id not in self.fleet.executions:
+            return 404, {'message': 'Not found'}
+        return 200, self._execution(execution_id)
+
+    @route('POST', '{enterprise}/pipeline/' + ID.format('pipeline_id') + '/execute/' +
+           ID.format('execution_id') + r'/(?P<action>stop|continue|terminate)')
+    def execution_action(self, params, body, pipeline_id, execution_id, action):
+        if execution_id not in self.fleet.executions:
+            return 404, {'message': 'Not found'}
+
+        execution = self.fleet.executions[execution_id]
+        execution['reason'] = body.get('reason')
+        if action == 'continue':
+            execution['state'] = 'RUNNING'
+        else:
+            execution['state'] = 'STOPPED' if action == 'stop' else 'TERMINATED'
+            execution['status'] = 'FAILURE'
+        return 200, self._execution(execution_id)
+
+    # Remote ADB
+
+    @route('POST', '{enterprise}/device/' + ID.format('device_id') + '/remoteadb')
+    def create_remoteadb(self, params, body, device_id):
+        if device_id not in self.fleet.device_index:
+            return 404, {'message': 'Not found'}
+
+        session_id = str(uuid.uuid4())
+        self.fleet.remoteadb_sessions[session_id] = {
+            'id': session_id,
+            'device': device_id,
+            'client_certificate': body.get('client_certificate'),
+            'created': time.time()
+        }
+        return 201, {'id': session_id, 'state': 'Initiated'}
+
+    @route('GET', '{enterprise}/device/' + ID.format('device_id') + '/remoteadb/' + ID.format('session_id'))
+    def get_remoteadb(self, params, body, device_id, session_id):
+        session = self.fleet.remoteadb_sessions.get(session_id)
+        if not session:
+            return 404, {'message': 'Not found'}
+
+        payload = {'id': session_id, 'state': 'Initiated'}
+        if time.time() - session['created'] >= self.fleet.command_duration:
+            payload.update({
+                'state': 'Connected',
+                'ip': session.get('relay_ip'),
+                'client_port': session.get('relay_port'),
+                'device_certificate': session.get('device_certificate')
+            })
+        return 200, payload
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this keep-alive clients stall on delayed ACKs
+    disable_nagle_algorithm = True
+    api = None
+
+    def _handle(self, method):
+        parsed = urlparse(self.path)
+        params = dict(parse_qsl(parsed.query))
+
+        body = {}
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if raw and 'application/json' in content_type:
+            body = json.loads(raw)
+        elif raw and 'x-www-form-urlencoded' in content_type:
+            body = dict(parse_qsl(raw.decode('utf-8')))
+        elif raw and 'multipart/form-data' in content_type:
+            filename = re.search(rb'filename="([^"]+)"', raw)
+            body = {'filename': filename.group(1).decode('utf-8') if filename else None, 'size': len(raw)}
+
+            # Read package and version from the uploaded APK like the real server does
+            content = raw.split(b'\r\n\r\n', 1)[-1]
+            manifest = read_manifest(io.BytesIO(content[:content.rfind(b'\r\n--')]))
+            if manifest:
+                body['package_name'] = manifest['package']
+                body['version_code'] = manifest['version_code']
+
+        status, payload = self.api.dispatch(method, parsed.path, params, body)
+
+        if isinstance(payload, bytes):
+            data, content_type = payload, 'application/vnd.android.package-archive'
+        else:
+            data, content_type = (json.dumps(payload).encode('utf-8') if payload is not None else b''), \
+                                 'application/json'
+
+        etag = None
+        if method == 'GET' and status == 200 and content_type == 'application/json':
+            etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+            if self.headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(object):
+    """Runs the mock API on a background thread"""
+
+    def __init__(self, api: MockEsperAPI, host: str = '127.0.0.1', port: int = 0):
+        handler = type('BoundMockRequestHandler', (MockRequestHandler,), {'api': api})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.api = api
+        self.url = f'http://{host}:{self.httpd.server_port}'
+        api.host = self.url
+        self._thread = None
+
+    def start(self) -> 'MockServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-esper-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Esper API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--applications', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Requests per second before answering 429')
+    parser.add_argument('--command-duration', type=float, default=2.0,
+                        help='Seconds until synthetic commands and executions complete')
+    parser.add_argument('--failure-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    fleet = Fleet(devices=args.devices, groups=args.groups, applications=args.applications,
+                  command_duration=args.command_duration, failure_rate=args.failure_rate)
+    api = MockEsperAPI(fleet, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_limit=args.rate_limit)
+    server = MockServer(api, args.host, args.port)
+
+    print(f'Mock Esper API for enterprise {fleet.enterprise_id} listening on {server.url}')
+    print(f'export ESPER_API_HOST={server.url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+Throughput and latency benchmarks of the secure ADB relays, without a device.
+
+    python -m benchmarks.relay_bench --size-mb 64 --pings 2000 --repeat 3
+
+A local mutual-TLS endpoint stands in for the Esper TCP relay, with certificates made by `esper.ext.certs`
+exactly like `secureadb connect` makes them. It echoes small packets back, swallows an upload or streams a
+download. A synthetic ADB client connects to the relay under test and drives each scenario:
+
+    ADB client --TCP--> relay under test --mutual TLS--> echo/sink/source endpoint
+
+The endpoint and the client run in a child process, so the CPU time of this process is what the relay (and the
+client side of TLS) costs. Every relay implementation is measured in turn; `--save` and `--compare` keep a
+baseline and fail when a run regresses beyond `--tolerance`. `--log-file` and `--log-level` measure the relays with
+logging on, written by a background thread like espercli does, or on the relay threads with `--sync-log`.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from tabulate import tabulate
+
+from esper.core.log_handler import start_queue_logging
+from esper.ext.certs import create_self_signed_cert, create_self_signed_cert_root
+from esper.ext.mediator import Mediator
+from esper.ext.relay import Relay
+
+CHUNK = 64 * 1024
+# An ADB packet header is 24 bytes; a shell keystroke or a small sync request is not much more
+PING_SIZE = 64
+WARMUP_PINGS = 50
+# A relay that stalls fails its scenario instead of hanging the run
+SCENARIO_TIMEOUT = 120
+
+log = logging.getLogger('relay-bench')
+
+
+def make_certs(directory: str) -> dict:
+    """
+    Certificates of both TLS ends, each self-signed: the endpoint's stands in for the device certificate that
+    `secureadb connect` trusts, the client's is made the way `secureadb connect` makes it
+    :param directory: Where to write the PEM files
+    :return: Paths by role
+    """
+    paths = {name: os.path.join(directory, f'{name}.pem') for name in
+             ('device_cert', 'device_key', 'client_cert', 'client_key')}
+
+    create_self_signed_cert_root(paths['device_cert'], paths['device_key'])
+    create_self_signed_cert(paths['client_cert'], paths['client_key'])
+    return paths
+
+
+def client_context(certs: dict) -> ssl.SSLContext:
+    """Client side TLS context, set up like `SecureADB.setup_ssl_connection`"""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.verify_mode = ssl.CERT_REQUIRED
+    context.check_hostname = False
+    context.load_verify_locations(cafile=certs['device_cert'])
+    context.load_cert_chain(certfile=certs['client_cert'], keyfile=certs['client_key'])
+    return context
+
+
+def endpoint_context(certs: dict) -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.verify_mode = ssl.CERT_REQUIRED
+    context.load_verify_locations(cafile=certs['client_cert'])
+    context.load_cert_chain(certfile=certs['device_cert'], keyfile=certs['device_key'])
+    return context
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, CHUNK))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+# Device side: TLS endpoint and ADB client, in the child process
+
+def serve_endpoint(conn: ssl.SSLSocket, scenario: str, size: int) -> None:
+    """Answer one relayed connection: echo packets, swallow `size` bytes then ack, or send `size` bytes"""
+    try:
+        if scenario == 'latency':
+            while True:
+                data = conn.recv(CHUNK)
+                if not data:
+                    break
+                conn.sendall(data)
+        elif scenario == 'upload':
+            received = 0
+            while received < size:
+                data = conn.recv(CHUNK)
+                if not data:
+                    return
+                received += len(data)
+            conn.sendall(b'k')
+        elif scenario == 'download':
+            block = b'\xa5' * CHUNK
+            sent = 0
+            while sent < size:
+                part = block[:min(CHUNK, size - sent)]
+                conn.sendall(part)
+                sent += len(part)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def drive_client(port: int, scenario: str, size: int, pings: int) -> dict:
+    """Play the ADB client of one scenario through the relay listening on `port`"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        if scenario == 'latency':
+            packet = b'\x5a' * PING_SIZE
+            rtts = []
+            for i in range(WARMUP_PINGS + pings):
+                started = time.perf_counter()
+                sock.sendall(packet)
+                recv_exactly(sock, PING_SIZE)
+                if i >= WARMUP_PINGS:
+                    rtts.append(time.perf_counter() - started)
+            return {'rtts': rtts}
+
+        started = time.perf_counter()
+        if scenario == 'upload':
+            block = b'\x5a' * CHUNK
+            sent = 0
+            while sent < size:
+                part = block[:min(CHUNK, size - sent)]
+                sock.sendall(part)
+                sent += len(part)
+            recv_exactly(sock, 1)
+        else:
+            recv_exactly(sock, size)
+        return {'seconds': time.perf_counter() - started}
+    finally:
+        sock.close()
+
+
+def device_side(pipe, certs: dict, scenario: str, size: int, pings: int) -> None:
+    """Child process: TLS endpoint plus ADB client. Reports the client's measurements through `pipe`."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    pipe.send(listener.getsockname()[1])
+
+    def accept():
+        raw, _ = listener.accept()
+        raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = endpoint_context(certs).wrap_socket(raw, server_side=True)
+        serve_endpoint(conn, scenario, size)
+
+    server = threading.Thread(target=accept, daemon=True)
+    server.start()
+
+    try:
+        relay_port = pipe.recv()
+        pipe.send(drive_client(relay_port, scenario, size, pings))
+    except Exception as e:
+        pipe.send({'error': repr(e)})
+    finally:
+        server.join(timeout=5)
+        listener.close()
+
+
+# Relay side, in this process
+
+def start_relay(implementation: str, secure_sock: ssl.SSLSocket) -> tuple:
+    """
+    Start a relay implementation on a connected TLS socket
+    :return: (listener port, thread running the relay)
+    """
+    if implementation in ('relay', 'relay-latency'):
+        mode = 'latency' if implementation == 'relay-latency' else 'bulk'
+        relay = Relay(relay_conn=secure_sock, relay_addr=secure_sock.getsockname(), log=log, mode=mode)
+        _, port = relay.get_listener_address()
+
+        def run():
+            relay.accept_connection()
+            relay.start_relay()
+            relay.cleanup_connections()
+    else:
+        relay = Mediator(secure_conn=secure_sock, secure_addr=secure_sock.getsockname(), log=log)
+        _, port = relay.setup_listener()
+        run = relay.run_forever
+
+    thread = threading.Thread(target=run, name=f'bench-{implementation}', daemon=True)
+    thread.start()
+    return port, thread
+
+
+def run_scenario(implementation: str, certs: dict, scenario: str, size: int, pings: int) -> dict:
+    """
+    Measure one scenario through one relay implementation
+    :return: Client measurements plus the CPU seconds this process spent while it ran
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=device_side, args=(child, certs, scenario, size, pings), daemon=True)
+    process.start()
+
+    try:
+        endpoint_port = parent.recv()
+        # Socket options of the relay leg are up to the relay, like in `secureadb connect`
+        raw = socket.create_connection(('127.0.0.1', endpoint_port))
+        secure_sock = client_context(certs).wrap_socket(raw, server_side=False)
+
+        cpu = time.process_time()
+        port, thread = start_relay(implementation, secure_sock)
+        parent.send(port)
+        if not parent.poll(SCENARIO_TIMEOUT):
+            raise RuntimeError(f'{implementation} {scenario}: no result after {SCENARIO_TIMEOUT}s')
+        result = parent.recv()
+        thread.join(timeout=10)
+        result['cpu_s'] = time.process_time() - cpu
+    finally:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+
+    if 'error' in result:
+        raise RuntimeError(f"{implementation} {scenario}: {result['error']}")
+    return result
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_benchmarks(implementations, size_mb: float, pings: int, repeat: int = 1) -> list:
+    """
+    :return: One result per implementation, with the best throughput and CPU and the median latency of the runs
+    """
+    size = int(size_mb * 1024 * 1024)
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix='esper-relay-bench-') as directory:
+        certs = make_certs(directory)
+
+        for implementation in implementations:
+            up, down, cpu, p50, p99 = [], [], [], [], []
+            for _ in range(repeat):
+                upload = run_scenario(implementation, certs, 'upload', size, pings)
+                download = run_scenario(implementation, certs, 'download', size, pings)
+                latency = run_scenario(implementation, certs, 'latency', size, pings)
+
+                up.append(size_mb / upload['seconds'])
+                down.append(size_mb / download['seconds'])
+                cpu.append((upload['cpu_s'] + download['cpu_s']) / (2 * size / 1024.0 ** 3))
+                p50.append(percentile(latency['rtts'], 0.5) * 1000)
+                p99.append(percentile(latency['rtts'], 0.99) * 1000)
+
+            results.append({
+                'relay': implementation,
+                'upload_mb_s': round(max(up), 1),
+                'download_mb_s': round(max(down), 1),
+                'rtt_p50_ms': round(statistics.median(p50), 3),
+                'rtt_p99_ms': round(statistics.median(p99), 3),
+                'cpu_s_per_gb': round(min(cpu), 2),
+            })
+
+    return results
+
+
+def regressions(results: list, baseline: list, tolerance: float) -> list:
+    """
+    Metrics that got worse than the baseline by more than `tolerance` (a fraction)
+    :return: Human readable descriptions
+    """
+    higher_is_better = ('upload_mb_s', 'download_mb_s')
+    lower_is_better = ('rtt_p50_ms', 'rtt_p99_ms', 'cpu_s_per_gb')
+    previous = {result['relay']: result for result in baseline}
+
+    found = []
+    for result in results:
+        before = previous.get(result['relay'])
+        if not before:
+            continue
+        for key in higher_is_better:
+            if result[key] < before[key] * (1 - tolerance):
+                found.append(f"{result['relay']} {key}: {result[key]} < {before[key]}")
+        for key in lower_is_better:
+            if result[key] > before[key] * (1 + tolerance):
+                found.append(f"{result['relay']} {key}: {result[key]} > {before[key]}")
+    return found
+
+
+IMPLEMENTATIONS = ('relay', 'relay-latency', 'mediator')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the secure ADB relays over a loopback mutual-TLS endpoint')
+    parser.add_argument('--relay', action='append', dest='relays', choices=IMPLEMENTATIONS,
+                        help='Relay implementation to measure (repeatable), default all')
+    parser.add_argument('--size-mb', type=float, default=64, help='Bytes moved in each direction')
+    parser.add_argument('--pings', type=int, default=2000, help='Small packets for the round-trip latency')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per relay')
+    parser.add_argument('--save', dest='save_file', help='Write the results to this file, e.g. as a baseline')
+    parser.add_argument('--compare', dest='baseline_file', help='Fail if worse than the results in this file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression against the baseline')
+    parser.add_argument('--log-file', help='Log the relays to this file, like espercli does')
+    parser.add_argument('--log-level', default='info', choices=('debug', 'info', 'warning'),
+                        help='Level of the --log-file')
+    parser.add_argument('--sync-log', action='store_true',
+                        help='Write the --log-file on the relay threads instead of a background writer')
+    args = parser.parse_args()
+
+    listener = None
+    if args.log_file:
+        handler = logging.FileHandler(args.log_file)
+        handler.setFormatter(logging.Formatter('%(asctime)s (%(levelname)s) %(name)s : %(message)s'))
+        handler.setLevel(args.log_level.upper())
+        log.setLevel(args.log_level.upper())
+        log.addHandler(handler)
+        if not args.sync_log:
+            listener = start_queue_logging(log, handler)
+
+    try:
+        results = run_benchmarks(args.relays or IMPLEMENTATIONS, args.size_mb, args.pings, args.repeat)
+    finally:
+        if listener:
+            listener.stop()
+
+    print(f"{args.size_mb:g} MB each way, {args.pings} x {PING_SIZE} byte pings, {args.repeat} run(s) per relay\n")
+    print(tabulate([{key.upper().replace('_', ' '): value for key, value in result.items()} for result in results],
+                   headers='keys', tablefmt='plain'))
+
+    if args.save_file:
+        with open(args.save_file, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline_file:
+        with open(args.baseline_file) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        if found:
+            print('\nRegressions:\n  ' + '\n  '.join(found), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
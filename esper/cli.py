@@ -0,0 +1,35 @@
+"""
+`espercli` entry point. Forwards the command to a running `espercli daemon` when there is one, and runs
+it in-process otherwise. Only the standard library is imported before that decision, and shell completion
+(`espercli __complete`) is answered from the local name index without loading the app at all.
+"""
+import sys
+
+from esper.ext.daemon import DaemonError, forward, is_forwardable
+
+
+def main():
+    argv = sys.argv[1:]
+
+    if argv[:1] == ['__complete']:
+        from esper.ext.completion import complete_command
+        sys.exit(complete_command(argv[1:]))
+
+    if is_forwardable(argv):
+        try:
+            reply = forward(argv)
+        except DaemonError as e:
+            sys.stderr.write(f"ERROR: {e}\n")
+            sys.exit(1)
+
+        if reply is not None:
+            sys.stdout.write(reply.get('stdout', ''))
+            sys.stderr.write(reply.get('stderr', ''))
+            sys.exit(reply.get('exit_code', 1))
+
+    from esper.main import main as run_in_process
+    run_in_process()
+
+
+if __name__ == '__main__':
+    main()
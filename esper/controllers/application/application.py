@@ -1,5 +1,8 @@
+import json
 import os
+import queue
 import random
+import threading
 import time
 from pathlib import Path
 
@@ -9,10 +12,18 @@ from esperclient.rest import ApiException
 from tqdm import tqdm
 
 from esper.controllers.enums import OutputFormat
-from esper.ext.api_client import APIClient
+from esper.ext.api_client import APIClient, get_session
+from esper.ext.apk import read_manifest, sha256_file
+from esper.ext.bulk import get_workers, run_concurrently
 from esper.ext.db_wrapper import DBWrapper
+from esper.ext.download_cache import download_cache
+from esper.ext.listing import APPLICATIONS, fetch_results
+from esper.ext.throttle import settings as throttle_settings
+from esper.ext.upload import APIException as UploadException, find_application_files, upload_application
 from esper.ext.utils import validate_creds_exists, parse_error_message
 
+DOWNLOAD_CHUNK = 64 * 1024
+
 
 class Application(Controller):
     class Meta:
@@ -48,6 +59,10 @@ class Application(Controller):
               'action': 'store',
               'default': 0,
               'dest': 'offset'}),
+            (['-f', '--fields'],
+             {'help': f"Comma separated fields to show, out of {', '.join(APPLICATIONS.columns)}",
+              'action': 'store',
+              'dest': 'fields'}),
             (['-j', '--json'],
              {'help': 'Render result in Json format',
               'action': 'store_true',
@@ -61,6 +76,13 @@ class Application(Controller):
         application_client = APIClient(db.get_configure()).get_application_api_client()
         enterprise_id = db.get_enterprise_id()
 
+        try:
+            columns = APPLICATIONS.select(self.app.pargs.fields)
+        except ValueError as e:
+            self.app.log.error(f"[application-list] {e}")
+            self.app.render(f"ERROR: {e}\n")
+            return
+
         name = self.app.pargs.name
         package = self.app.pargs.package
         limit = self.app.pargs.limit
@@ -77,42 +99,19 @@ class Application(Controller):
 
         try:
             # Find applications in an enterprise
-            response = application_client.get_all_applications(enterprise_id, limit=limit, offset=offset, **kwargs)
+            count, results = fetch_results(application_client.get_all_applications, enterprise_id, limit=limit,
+                                           offset=offset, **kwargs)
         except ApiException as e:
             self.app.log.error(f"[application-list] Failed to list applications: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
             return
 
-        self.app.render(f"Total Number of Applications: {response.count}")
+        self.app.render(f"Total Number of Applications: {count}")
+        applications = APPLICATIONS.rows(results, columns, json_keys=self.app.pargs.json)
         if not self.app.pargs.json:
-            applications = []
-
-            label = {
-                'id': "ID",
-                'name': "NAME",
-                'package': "PACKAGE NAME"
-            }
-
-            for application in response.results:
-                applications.append(
-                    {
-                        label['id']: application.id,
-                        label['name']: application.application_name,
-                        label['package']: application.package_name
-                    }
-                )
             self.app.render(applications, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
         else:
-            applications = []
-            for application in response.results:
-                applications.append(
-                    {
-                        'id': application.id,
-                        'name': application.application_name,
-                        'package': application.package_name
-                    }
-                )
-            self.app.render(applications, format=OutputFormat.JSON.value)
+            self.app.render([application.as_dict() for application in applications], format=OutputFormat.JSON.value)
 
     def _application_basic_response(self, application, format=OutputFormat.TABULATED):
         valid_keys = ['id', 'application_name', 'package_name', 'developer', 'category', 'content_rating',
@@ -168,12 +167,269 @@ class Application(Controller):
             renderable = self._application_basic_response(response, OutputFormat.JSON)
             self.app.render(renderable, format=OutputFormat.JSON.value)
 
+    def _find_uploaded_version(self, application_client, db, enterprise_id, application_file, sha256):
+        """
+        Look for an earlier upload of the same APK, first by content hash in the local upload index, then by
+        package name and version code among the versions known to the server
+        :return: (application, version) dicts of the existing version, or (None, None)
+        """
+        with self._db_lock:
+            upload = db.get_upload(enterprise_id, sha256)
+
+        if upload:
+            try:
+                application = application_client.get_application(upload['application_id'], enterprise_id)
+                version = application_client.get_app_version(upload['version_id'], upload['application_id'],
+                                                             enterprise_id)
+                return application.to_dict(), version.to_dict()
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+                self.app.log.debug(f"[application-upload] Version {upload['version_id']} no longer exists")
+                with self._db_lock:
+                    db.unset_upload(enterprise_id, sha256)
+
+        manifest = read_manifest(application_file)
+        if not manifest or not manifest.get('package') or not manifest.get('version_code'):
+            self.app.log.debug(f"[application-upload] Could not read the manifest of {application_file}")
+            return None, None
+
+        search_response = application_client.get_all_applications(enterprise_id, package_name=manifest['package'],
+                                                                  limit=1, offset=0)
+        if not search_response.results:
+            return None, None
+
+        application = search_response.results[0]
+        # Android's versionCode is what Esper reports as build_number
+        versions = application_client.get_app_versions(application.id, enterprise_id,
+                                                       build_number=manifest['version_code'], limit=1, offset=0)
+        if not versions.results:
+            return None, None
+
+        return application.to_dict(), versions.results[0].to_dict()
+
+    def _upload_file(self, db, application_client, application_file, sha256, on_progress=None):
+        """
+        Upload one application file unless it was uploaded before. Transport errors, throttling and server
+        errors are retried with backoff; before each retry the server is checked again, in case the failed
+        attempt did create the version.
+        :return: (application, version, uploaded)
+        """
+        with self._db_lock:
+            configure = db.get_configure()
+            enterprise_id = db.get_enterprise_id()
+        force = self.app.pargs.force
+
+        attempt = 0
+        while True:
+            if not force or attempt > 0:
+                application, version = self._find_uploaded_version(application_client, db, enterprise_id,
+                                                                    application_file, sha256)
+                if application:
+                    uploaded = False
+                    break
+
+            try:
+                response = upload_application(configure['environment'], enterprise_id, configure['api_key'],
+                                              application_file, on_progress)
+            except (UploadException, requests.RequestException) as e:
+                retryable = not isinstance(e, UploadException) or e.status is None or e.status == 429 or \
+                            e.status >= 500
+                if not retryable or attempt >= self.app.pargs.retries:
+                    raise
+                attempt += 1
+                self.app.log.warning(f"[application-upload] Upload of {application_file} failed, retrying "
+                                     f"({attempt}/{self.app.pargs.retries}): {e}")
+                time.sleep(random.uniform(0, min(throttle_settings.backoff_max,
+                                                 throttle_settings.backoff_base * 2 ** attempt)))
+                continue
+
+            application = response.get('application') or {}
+            versions = application.get('versions') or []
+            version = versions[0] if versions else None
+            uploaded = True
+            break
+
+        if version:
+            with self._db_lock:
+                db.set_upload(enterprise_id, sha256, {'application_id': application['id'], 'version_id': version['id']})
+
+        return application, version, uploaded
+
+    def _upload_response(self, application, version, uploaded, format=OutputFormat.TABULATED):
+        valid_keys = ['id', 'application_name', 'package_name', 'developer', 'category', 'content_rating',
+                      'compatibility']
+
+        if format == OutputFormat.TABULATED:
+            title = "TITLE"
+            details = "DETAILS"
+            renderable = [{title: k, details: v} for k, v in application.items() if k in valid_keys]
+
+            if version:
+                renderable.append({title: 'version_id', details: version.get('id')})
+                renderable.append({title: 'version_code', details: version.get('version_code')})
+                renderable.append({title: 'build_number', details: version.get('build_number')})
+            renderable.append({title: 'uploaded', details: uploaded})
+        else:
+            renderable = {k: v for k, v in application.items() if k in valid_keys}
+            if version:
+                renderable['version_id'] = version.get('id')
+                renderable['version_code'] = version.get('version_code')
+                renderable['build_number'] = version.get('build_number')
+            renderable['uploaded'] = uploaded
+
+        return renderable
+
+    def _upload_one(self, db, application_client, application_file):
+        try:
+            with tqdm(total=os.path.getsize(application_file), unit='B', unit_scale=True, miniters=1,
+                      desc='Uploading......', unit_divisor=1024, disable=None) as pbar:
+                pbar.set_postfix(file=Path(application_file).name, refresh=False)
+
+                def on_progress(sent):
+                    pbar.update(sent - pbar.n)
+
+                application, version, uploaded = self._upload_file(db, application_client, application_file,
+                                                                   sha256_file(application_file), on_progress)
+        except ApiException as e:
+            self.app.log.error(f"[application-upload] Failed to upload an application: {e}")
+            self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+            return
+        except (UploadException, requests.RequestException, OSError) as e:
+            self.app.log.error(f"[application-upload] Failed to upload an application: {e}")
+            self.app.render(f"ERROR: {e}\n")
+            return
+
+        if not self.app.pargs.json:
+            if not uploaded:
+                self.app.render(f"Skipped upload, {Path(application_file).name} is already uploaded\n")
+            renderable = self._upload_response(application, version, uploaded)
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        else:
+            renderable = self._upload_response(application, version, uploaded, OutputFormat.JSON)
+            self.app.render(renderable, format=OutputFormat.JSON.value)
+
+    def _upload_many(self, db, application_client, files):
+        workers = get_workers(self.app.pargs.workers)
+        sizes = {application_file: os.path.getsize(application_file) for application_file in files}
+
+        # Identical files are uploaded once; the copies share the result of the first one
+        hashes = {}
+        for application_file, sha256, error in run_concurrently(sha256_file, files, workers):
+            if error is not None:
+                raise error
+            hashes[application_file] = sha256
+        first_files = {}
+        for application_file in files:
+            first_files.setdefault(hashes[application_file], application_file)
+        unique_files = list(first_files.values())
+
+        # One bar for all bytes, and one per upload in flight below it
+        positions = queue.Queue()
+        for position in range(1, min(workers, len(unique_files)) + 1):
+            positions.put(position)
+
+        total = tqdm(total=sum(sizes[application_file] for application_file in unique_files), unit='B',
+                     unit_scale=True, unit_divisor=1024, disable=None, desc=f'Uploading {len(unique_files)} files')
+
+        def upload(application_file):
+            position = positions.get()
+            sent = [0]
+            try:
+                with tqdm(total=sizes[application_file], unit='B', unit_scale=True, unit_divisor=1024, leave=False,
+                          position=position, desc=Path(application_file).name[:30], disable=None) as pbar:
+
+                    def on_progress(done):
+                        pbar.update(done - pbar.n)
+                        total.update(done - sent[0])
+                        sent[0] = done
+
+                    result = self._upload_file(db, application_client, application_file, hashes[application_file],
+                                               on_progress)
+                    # Skipped files count as done
+                    total.update(sizes[application_file] - sent[0])
+                    return result
+            finally:
+                positions.put(position)
+
+        results = {}
+        with total:
+            for application_file, result, error in run_concurrently(upload, unique_files, workers):
+                results[hashes[application_file]] = application_file, result, error
+
+        manifest = {}
+        for application_file in files:
+            first_file, result, error = results[hashes[application_file]]
+            if error is not None:
+                message = parse_error_message(self.app, error) if isinstance(error, ApiException) else str(error)
+                if first_file == application_file:
+                    self.app.log.error(f"[application-upload] Failed to upload {application_file}: {message}")
+                manifest[application_file] = {'error': message}
+                continue
+
+            application, version, uploaded = result
+            manifest[application_file] = {
+                'application_id': application.get('id'),
+                'package_name': application.get('package_name'),
+                'version_id': version.get('id') if version else None,
+                'version_code': version.get('version_code') if version else None,
+                'build_number': version.get('build_number') if version else None,
+                'sha256': hashes[application_file],
+                'uploaded': uploaded and first_file == application_file
+            }
+
+        if self.app.pargs.manifest:
+            with open(self.app.pargs.manifest, 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+        failed = [application_file for application_file, entry in manifest.items() if 'error' in entry]
+        if failed:
+            self.app.exit_code = 1
+
+        if not self.app.pargs.json:
+            self.app.render(f"Uploaded {sum(1 for entry in manifest.values() if entry.get('uploaded'))}, "
+                            f"skipped {sum(1 for entry in manifest.values() if entry.get('uploaded') is False)}, "
+                            f"failed {len(failed)} of {len(files)} files")
+            renderable = [
+                {
+                    'FILE': application_file,
+                    'APPLICATION ID': entry.get('application_id'),
+                    'VERSION ID': entry.get('version_id'),
+                    'UPLOADED': entry.get('uploaded'),
+                    'ERROR': entry.get('error')
+                }
+                for application_file, entry in manifest.items()
+            ]
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        else:
+            self.app.render(manifest, format=OutputFormat.JSON.value)
+
     @ex(
         help='Upload application',
         arguments=[
             (['application_file'],
-             {'help': 'Application file',
+             {'help': 'Application file, or directories and glob patterns of files to upload concurrently',
+              'nargs': '+',
               'action': 'store'}),
+            (['-f', '--force'],
+             {'help': 'Upload even if the same APK or version was uploaded before',
+              'action': 'store_true',
+              'dest': 'force'}),
+            (['-r', '--retries'],
+             {'help': 'Retries of a failed upload, default 2',
+              'action': 'store',
+              'type': int,
+              'default': 2,
+              'dest': 'retries'}),
+            (['-w', '--workers'],
+             {'help': 'Concurrent uploads of a bulk upload, default max_concurrency from esper.yml',
+              'action': 'store',
+              'type': int,
+              'dest': 'workers'}),
+            (['-m', '--manifest'],
+             {'help': 'Write a JSON manifest of file to application and version ids of a bulk upload',
+              'action': 'store',
+              'dest': 'manifest'}),
             (['-j', '--json'],
              {'help': 'Render result in Json format',
               'action': 'store_true',
@@ -181,56 +437,29 @@ class Application(Controller):
         ]
     )
     def upload(self):
-        application_file = self.app.pargs.application_file
+        sources = self.app.pargs.application_file
 
         validate_creds_exists(self.app)
         db = DBWrapper(self.app.creds)
         application_client = APIClient(db.get_configure()).get_application_api_client()
-        enterprise_id = db.get_enterprise_id()
+        self._db_lock = threading.Lock()
 
-        try:
-            filesize = os.path.getsize(application_file)
-            random_no = random.randint(1, 50)
-            with tqdm(total=int(filesize), unit='B', unit_scale=True, miniters=1, desc='Uploading......',
-                      unit_divisor=1024) as pbar:
-                for i in range(100):
-                    if i == random_no:
-                        response = application_client.upload(enterprise_id, application_file)
-
-                    time.sleep(0.07)
-                    pbar.set_postfix(file=Path(application_file).name, refresh=False)
-                    pbar.update(int(filesize / 100))
-
-            application = response.application
-        except ApiException as e:
-            self.app.log.error(f"[application-upload] Failed to upload an application: {e}")
-            self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+        files = find_application_files(sources)
+        if not files:
+            self.app.log.debug(f"[application-upload] No application files found in {' '.join(sources)}")
+            self.app.render(f"No application files found in {' '.join(sources)}\n")
             return
 
-        valid_keys = ['id', 'application_name', 'package_name', 'developer', 'category', 'content_rating',
-                      'compatibility']
-
-        if not self.app.pargs.json:
-            title = "TITLE"
-            details = "DETAILS"
-            renderable = [{title: k, details: v} for k, v in application.to_dict().items() if k in valid_keys]
-
-            if application and application.versions and len(application.versions) > 0:
-                version = application.versions[0]
-                renderable.append({title: 'version_id', details: version.id})
-                renderable.append({title: 'version_code', details: version.version_code})
-                renderable.append({title: 'build_number', details: version.build_number})
+        missing = [application_file for application_file in files if not os.path.isfile(application_file)]
+        if missing:
+            self.app.log.debug(f"[application-upload] Application file does not exist: {', '.join(missing)}")
+            self.app.render(f"Application file does not exist: {', '.join(missing)}\n")
+            return
 
-            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        if len(sources) == 1 and files == sources and not self.app.pargs.manifest:
+            self._upload_one(db, application_client, files[0])
         else:
-            renderable = {k: v for k, v in application.to_dict().items() if k in valid_keys}
-            if application and application.versions and len(application.versions) > 0:
-                version = application.versions[0]
-                renderable['version_id'] = version.id
-                renderable['version_code'] = version.version_code
-                renderable['build_number'] = version.build_number
-
-            self.app.render(renderable, format=OutputFormat.JSON.value)
+            self._upload_many(db, application_client, files)
 
     @ex(
         help='Download application version',
@@ -283,18 +512,46 @@ class Application(Controller):
 
         url = response.app_file
         file_size = int(response.size_in_mb * 1024 * 1024)
-        first_byte = 0
-
-        pbar = tqdm(total=file_size, initial=first_byte, unit='B', unit_scale=True, desc='Downloading......')
-        req = requests.get(url, stream=True)
-
-        with(open(destination, 'ab')) as f:
-            for chunk in req.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-                    pbar.update(1024)
-                    time.sleep(0.001)
-        pbar.close()
+
+        cached = download_cache.lookup(version_id, file_size)
+        if cached:
+            cloned = download_cache.place(cached, destination)
+            self.app.log.debug(f"[app-download] Served {version_id} from the download cache "
+                               f"({'cloned' if cloned else 'copied'})")
+            self.app.render(f"Served {destination} from the download cache\n")
+            return
+
+        try:
+            req = get_session().get(url, stream=True)
+            req.raise_for_status()
+        except requests.RequestException as e:
+            self.app.log.error(f"[app-download] Failed to download the version file: {e}")
+            self.app.render(f"ERROR: {e}\n")
+            return
+
+        with tqdm(total=file_size, unit='B', unit_scale=True, unit_divisor=1024, desc='Downloading......',
+                  disable=None) as pbar:
+            def chunks():
+                for chunk in req.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                    if chunk:
+                        pbar.update(len(chunk))
+                        yield chunk
+
+            try:
+                if download_cache.enabled:
+                    # A compressed transfer has no Content-Length of the file itself
+                    length = req.headers.get('Content-Length')
+                    expected_size = int(length) if length and not req.headers.get('Content-Encoding') else None
+                    download_cache.place(download_cache.store(version_id, file_size, chunks(), expected_size),
+                                         destination)
+                else:
+                    with open(destination, 'wb') as f:
+                        for chunk in chunks():
+                            f.write(chunk)
+            except (requests.RequestException, OSError) as e:
+                self.app.log.error(f"[app-download] Failed to download the version file: {e}")
+                self.app.render(f"ERROR: {e}\n")
+                return
 
     @ex(
         help='Delete application',
@@ -25,6 +25,27 @@ class Base(Controller):
             (['-v', '--version'],
              {'action': 'version',
               'version': VERSION_BANNER}),
+            (['--timings'],
+             {'help': 'Print a summary of HTTP request timings on exit',
+              'action': 'store_true',
+              'dest': 'timings'}),
+            (['--timings-file'],
+             {'help': 'Append a JSON line per HTTP request to this file',
+              'action': 'store',
+              'dest': 'timings_file'}),
+            (['--refresh'],
+             {'help': 'Bypass the local response cache and fetch fresh data',
+              'action': 'store_true',
+              'dest': 'refresh'}),
+            (['--offline'],
+             {'help': 'Answer read commands from the local response cache, whatever its age, without contacting the '
+                      'API; commands that change anything fail',
+              'action': 'store_true',
+              'dest': 'offline'}),
+            (['--stale-ok'],
+             {'help': 'Answer from the local response cache, whatever its age, when the API cannot be reached',
+              'action': 'store_true',
+              'dest': 'stale_ok'}),
         ]
 
     def _default(self):
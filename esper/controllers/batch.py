@@ -0,0 +1,99 @@
+import json
+import shlex
+import sys
+import time
+
+from cement import Controller, ex
+
+from esper.ext.dispatch import run_command
+
+
+class Batch(Controller):
+    class Meta:
+        label = 'batch'
+        stacked_type = 'embedded'
+        stacked_on = 'base'
+
+        # text displayed at the top of --help output
+        description = 'Run many espercli commands in a single process'
+
+        # text displayed at the bottom of --help output
+        epilog = 'Usage: espercli batch [file|-]'
+
+    @ex(
+        help='Run commands from a file (or stdin), one command line per line',
+        arguments=[
+            (['file'],
+             {'help': "File with one command per line, without the `espercli` prefix. Use '-' for stdin",
+              'action': 'store',
+              'nargs': '?',
+              'default': '-'}),
+
+            (['--jsonl'],
+             {'help': 'Write one JSON object per command with its exit code and output',
+              'action': 'store_true',
+              'default': False,
+              'dest': 'jsonl'}),
+
+            (['--fail-fast'],
+             {'help': 'Stop at the first command that exits with a non-zero code',
+              'action': 'store_true',
+              'default': False,
+              'dest': 'fail_fast'}),
+        ]
+    )
+    def batch(self):
+        """Dispatch each line through this app instance, reusing its DB, certificates and HTTP connections"""
+        jsonl = self.app.pargs.jsonl
+        fail_fast = self.app.pargs.fail_fast
+
+        source = sys.stdin if self.app.pargs.file == '-' else open(self.app.pargs.file)
+        failed = 0
+
+        try:
+            for number, line in enumerate(source, start=1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+
+                try:
+                    argv = shlex.split(line)
+                except ValueError as e:
+                    self.app.log.error(f"[batch] Line {number} could not be parsed: {e}")
+                    failed += 1
+                    continue
+
+                self.app.log.debug(f"[batch] Running line {number}: {argv}")
+
+                if not jsonl:
+                    self.app.render(f"==> [{number}] {line} <==\n")
+                    sys.stdout.flush()
+
+                started = time.perf_counter()
+                code, output = run_command(self.app, argv, capture=jsonl)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                if jsonl:
+                    record = {
+                        'line': number,
+                        'command': line,
+                        'exit_code': code,
+                        'elapsed_ms': round(elapsed_ms, 2),
+                        'output': output
+                    }
+                    self.app.render(json.dumps(record) + "\n")
+                    sys.stdout.flush()
+
+                if code != 0:
+                    failed += 1
+                    if fail_fast:
+                        self.app.log.error(f"[batch] Line {number} exited with {code}, stopping")
+                        break
+
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        if failed:
+            self.app.log.error(f"[batch] {failed} command(s) failed")
+            self.app.exit_code = 1
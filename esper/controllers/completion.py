@@ -0,0 +1,152 @@
+import argparse
+
+from cement import Controller, ex
+from esperclient.rest import ApiException
+
+from esper.controllers.enums import OutputFormat
+from esper.ext.api_client import APIClient
+from esper.ext.bulk import fetch_all_pages, run_concurrently
+from esper.ext.completion import KINDS, SCRIPTS, argument_kind, get_index_dir, mark_refreshed, write_commands, \
+    write_names
+from esper.ext.db_wrapper import DBWrapper
+from esper.ext.device_search import DeviceIndex, device_record
+from esper.ext.pipeline_api import APIException, get_pipeline_url, list_pipelines
+from esper.ext.utils import validate_creds_exists, parse_error_message
+
+PIPELINE_PAGE_SIZE = 100
+
+
+def command_tree(parser: argparse.ArgumentParser) -> dict:
+    """
+    Subcommands, options and name arguments of every command, keyed by command path ('' for the top level)
+    """
+    tree = {}
+
+    def walk(parser, path):
+        node = {'commands': [], 'options': [], 'values': {}, 'multiple': [], 'positionals': []}
+        for action in parser._actions:
+            if isinstance(action, argparse._SubParsersAction):
+                for name, subparser in action.choices.items():
+                    node['commands'].append(name)
+                    walk(subparser, f'{path} {name}'.strip())
+
+            elif action.option_strings:
+                node['options'].extend(action.option_strings)
+                if action.nargs == 0:
+                    continue
+
+                kind = argument_kind(path, action.dest)
+                node['values'].update({option: kind for option in action.option_strings})
+                if action.nargs in ('*', '+'):
+                    node['multiple'].extend(action.option_strings)
+
+            else:
+                node['positionals'].append(argument_kind(path, action.dest))
+
+        node['commands'].sort()
+        tree[path] = node
+
+    walk(parser, '')
+    return tree
+
+
+class Completion(Controller):
+    class Meta:
+        label = 'completion'
+
+        # text displayed at the top of --help output
+        description = 'Shell completion of commands and device, group, application and pipeline names'
+
+        # text displayed at the bottom of --help output
+        epilog = 'Usage: source <(espercli completion script bash)'
+
+        stacked_type = 'nested'
+        stacked_on = 'base'
+
+    @ex(
+        help='Print the completion script of a shell',
+        arguments=[
+            (['shell'],
+             {'help': 'Shell to complete in',
+              'choices': sorted(SCRIPTS)}),
+        ]
+    )
+    def script(self):
+        self.app.render(SCRIPTS[self.app.pargs.shell])
+
+    def _fetch_names(self, kind, db, enterprise_id, directory):
+        if kind == 'device':
+            device_client = APIClient(db.get_configure()).get_device_api_client()
+            devices = fetch_all_pages(
+                lambda limit, offset: device_client.get_all_devices(enterprise_id, limit=limit, offset=offset))
+            DeviceIndex([device_record(device) for device in devices]).save(directory)
+            return [device.device_name for device in devices]
+
+        if kind == 'group':
+            group_client = APIClient(db.get_configure()).get_group_api_client()
+            groups = fetch_all_pages(
+                lambda limit, offset: group_client.get_all_groups(enterprise_id, limit=limit, offset=offset))
+            return [group.name for group in groups]
+
+        if kind == 'application':
+            application_client = APIClient(db.get_configure()).get_application_api_client()
+            applications = fetch_all_pages(
+                lambda limit, offset: application_client.get_all_applications(enterprise_id, limit=limit,
+                                                                              offset=offset))
+            return [application.application_name for application in applications]
+
+        url = get_pipeline_url(db.get_configure().get("environment"), enterprise_id)
+        api_key = db.get_configure().get("api_key")
+        names = []
+        offset = 0
+        while True:
+            response = list_pipelines(url, api_key, {'limit': PIPELINE_PAGE_SIZE, 'offset': offset})
+            if not response.ok:
+                raise APIException(f"Listing pipelines failed with status {response.status_code}")
+
+            page = response.json()
+            names.extend(pipeline.get('name') for pipeline in page.get('results') or [])
+            offset += PIPELINE_PAGE_SIZE
+            if not page.get('next') or offset >= (page.get('count') or 0):
+                return names
+
+    @ex(
+        help='Refresh the local name index that completion answers from, and the device search index',
+        arguments=[
+            (['-q', '--quiet'],
+             {'help': 'Do not print what was indexed',
+              'action': 'store_true',
+              'default': False,
+              'dest': 'quiet'}),
+        ]
+    )
+    def refresh(self):
+        validate_creds_exists(self.app)
+        db = DBWrapper(self.app.creds)
+        enterprise_id = db.get_enterprise_id()
+        directory = get_index_dir()
+
+        write_commands(command_tree(self.app.args), directory)
+
+        def fetch(kind):
+            return self._fetch_names(kind, db, enterprise_id, directory)
+
+        rows = []
+        failed = False
+        for kind, names, error in run_concurrently(fetch, KINDS):
+            if error is not None:
+                failed = True
+                message = parse_error_message(self.app, error) if isinstance(error, ApiException) else str(error)
+                self.app.log.error(f"[completion-refresh] Failed to list {kind} names: {error}")
+                rows.append({'KIND': kind, 'NAMES': f"ERROR: {message}"})
+                continue
+
+            rows.append({'KIND': kind, 'NAMES': write_names(kind, names, directory)})
+
+        if not failed:
+            mark_refreshed(directory)
+        else:
+            self.app.exit_code = 1
+
+        if not self.app.pargs.quiet:
+            self.app.render(rows, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
@@ -0,0 +1,131 @@
+import subprocess
+import sys
+import time
+
+from cement import Controller, ex
+
+from esper.controllers.enums import OutputFormat
+from esper.ext.daemon import DaemonError, control, get_socket_path, serve
+
+
+class Daemon(Controller):
+    class Meta:
+        label = 'daemon'
+
+        # text displayed at the top of --help output
+        description = 'Keep espercli warm in the background and serve commands over a Unix socket'
+
+        # text displayed at the bottom of --help output
+        epilog = 'Usage: espercli daemon'
+
+        stacked_type = 'nested'
+        stacked_on = 'base'
+
+    @ex(
+        help='Start the daemon',
+        arguments=[
+            (['-s', '--socket'],
+             {'help': 'Unix socket path. Defaults to $ESPER_DAEMON_SOCKET or ~/.esper/run/espercli.sock',
+              'action': 'store',
+              'dest': 'socket'}),
+
+            (['-t', '--idle-timeout'],
+             {'help': 'Exit after this many seconds without a command, 0 to never exit',
+              'type': float,
+              'default': 0,
+              'dest': 'idle_timeout'}),
+
+            (['-d', '--detach'],
+             {'help': 'Run in the background and return once the daemon is accepting commands',
+              'action': 'store_true',
+              'default': False,
+              'dest': 'detach'}),
+        ]
+    )
+    def start(self):
+        path = self.app.pargs.socket or get_socket_path()
+
+        if self.app.pargs.detach:
+            command = [sys.executable, '-m', 'esper.main', 'daemon', 'start', '--socket', path,
+                       '--idle-timeout', str(self.app.pargs.idle_timeout)]
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL, start_new_session=True)
+
+            deadline = time.time() + 15
+            while time.time() < deadline:
+                if control('ping', path) is not None:
+                    self.app.render(f"Daemon started with pid {process.pid}, listening on {path}\n")
+                    return
+                if process.poll() is not None:
+                    break
+                time.sleep(0.1)
+
+            self.app.log.error(f"[daemon-start] Daemon did not come up on {path}")
+            self.app.render(f"ERROR: Daemon did not come up on {path}, see the log file for details\n")
+            self.app.exit_code = 1
+            return
+
+        try:
+            serve(self.app, path, self.app.pargs.idle_timeout)
+        except (DaemonError, OSError) as e:
+            self.app.log.error(f"[daemon-start] Failed to start daemon: {e}")
+            self.app.render(f"ERROR: {e}\n")
+            self.app.exit_code = 1
+
+    @ex(
+        help='Stop the running daemon',
+        arguments=[
+            (['-s', '--socket'],
+             {'help': 'Unix socket path',
+              'action': 'store',
+              'dest': 'socket'}),
+        ]
+    )
+    def stop(self):
+        path = self.app.pargs.socket or get_socket_path()
+
+        if control('stop', path) is None:
+            self.app.render("Daemon is not running\n")
+            return
+
+        self.app.render("Daemon stopped\n")
+
+    @ex(
+        help='Show whether the daemon is running',
+        arguments=[
+            (['-s', '--socket'],
+             {'help': 'Unix socket path',
+              'action': 'store',
+              'dest': 'socket'}),
+
+            (['-j', '--json'],
+             {'help': 'Render result in Json format',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ]
+    )
+    def status(self):
+        path = self.app.pargs.socket or get_socket_path()
+        reply = control('ping', path)
+
+        renderable = {
+            'running': reply is not None,
+            'socket': path,
+            'pid': reply.get('pid') if reply else None,
+            'uptime': reply.get('uptime') if reply else None,
+            'served': reply.get('served') if reply else None
+        }
+
+        if self.app.pargs.json:
+            self.app.render(renderable, format=OutputFormat.JSON.value)
+        else:
+            title = "TITLE"
+            details = "DETAILS"
+            renderable = [
+                {title: 'Running', details: renderable['running']},
+                {title: 'Socket', details: renderable['socket']},
+                {title: 'Pid', details: renderable['pid']},
+                {title: 'Uptime (s)', details: renderable['uptime']},
+                {title: 'Commands served', details: renderable['served']}
+            ]
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
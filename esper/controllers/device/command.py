@@ -5,6 +5,7 @@ from esperclient.rest import ApiException
 from esper.controllers.enums import OutputFormat, DeviceCommandEnum
 from esper.ext.api_client import APIClient
 from esper.ext.db_wrapper import DBWrapper
+from esper.ext.device_search import find_device
 from esper.ext.utils import validate_creds_exists, parse_error_message
 
 
@@ -59,14 +60,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-show] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-show] Failed to list devices: {e}")
@@ -121,14 +120,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-install] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-install] Failed to list devices: {e}")
@@ -186,14 +183,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-uninstall] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-uninstall] Failed to list devices: {e}")
@@ -247,14 +242,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-ping] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-ping] Failed to list devices: {e}")
@@ -306,14 +299,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-lock] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-lock] Failed to list devices: {e}")
@@ -365,14 +356,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-reboot] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-reboot] Failed to list devices: {e}")
@@ -432,14 +421,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-wipe] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-wipe] Failed to list devices: {e}")
@@ -507,14 +494,12 @@ class DeviceCommand(Controller):
 
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-command-clear-app-data] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[device-command-clear-app-data] Failed to list devices: {e}")
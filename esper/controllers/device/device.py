@@ -6,6 +6,8 @@ from esperclient.rest import ApiException
 from esper.controllers.enums import DeviceState, OutputFormat
 from esper.ext.api_client import APIClient
 from esper.ext.db_wrapper import DBWrapper
+from esper.ext.device_search import DeviceIndex, find_device
+from esper.ext.listing import DEVICES, fetch_results
 from esper.ext.utils import validate_creds_exists, parse_error_message
 
 
@@ -83,6 +85,10 @@ class Device(Controller):
               'action': 'store',
               'default': 0,
               'dest': 'offset'}),
+            (['-f', '--fields'],
+             {'help': f"Comma separated fields to show, out of {', '.join(DEVICES.columns)}",
+              'action': 'store',
+              'dest': 'fields'}),
             (['-j', '--json'],
              {'help': 'Render result in Json format',
               'action': 'store_true',
@@ -96,6 +102,13 @@ class Device(Controller):
         device_client = APIClient(db.get_configure()).get_device_api_client()
         enterprise_id = db.get_enterprise_id()
 
+        try:
+            columns = DEVICES.select(self.app.pargs.fields)
+        except ValueError as e:
+            self.app.log.error(f"[device-list] {e}")
+            self.app.render(f"ERROR: {e}\n")
+            return
+
         state = self.app.pargs.state
         name = self.app.pargs.name
         group_name = self.app.pargs.group
@@ -155,53 +168,19 @@ class Device(Controller):
 
         try:
             # Find devices in an enterprise
-            response = device_client.get_all_devices(enterprise_id, limit=limit, offset=offset, **kwargs)
+            count, results = fetch_results(device_client.get_all_devices, enterprise_id, limit=limit, offset=offset,
+                                           **kwargs)
         except ApiException as e:
             self.app.log.error(f"[device-list] Failed to list devices: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
             return
 
-        self.app.render(f"Number of Devices: {response.count}")
+        self.app.render(f"Number of Devices: {count}")
+        devices = DEVICES.rows(results, columns, json_keys=self.app.pargs.json)
         if not self.app.pargs.json:
-            devices = []
-
-            label = {
-                'id': "ID",
-                'name': "NAME",
-                'model': "MODEL",
-                'state': "CURRENT STATE",
-                'tags': "TAGS"
-            }
-
-            for device in response.results:
-                current_state = DeviceState(device.status).name
-                name, tags = self.get_name_and_tags_from_device(device)
-
-                devices.append(
-                    {
-                        label['id']: device.id,
-                        label['name']: name,
-                        label['model']: device.hardware_info.get("manufacturer"),
-                        label['state']: current_state,
-                        label['tags']: tags
-                    }
-                )
             self.app.render(devices, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
         else:
-            devices = []
-            for device in response.results:
-                current_state = DeviceState(device.status).name
-                name, _ = self.get_name_and_tags_from_device(device)
-                devices.append(
-                    {
-                        'id': device.id,
-                        'device': name,
-                        'model': device.hardware_info.get("manufacturer"),
-                        'state': current_state,
-                        'tags': device.tags
-                    }
-                )
-            self.app.render(devices, format=OutputFormat.JSON.value)
+            self.app.render([device.as_dict() for device in devices], format=OutputFormat.JSON.value)
 
     def _device_basic_response(self, device, format=OutputFormat.TABULATED):
         valid_keys = ['id', 'device_name', 'alias_name', 'suid', 'api_level', 'template_name', 'is_gms']
@@ -244,14 +223,12 @@ class Device(Controller):
         device_client = APIClient(db.get_configure()).get_device_api_client()
         enterprise_id = db.get_enterprise_id()
 
-        kwargs = {'name': device_name}
         try:
-            search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-            if not search_response.results or len(search_response.results) == 0:
+            response = find_device(self.app, device_client, enterprise_id, device_name)
+            if not response:
                 self.app.log.debug(f'[device-show] Device does not exist with name {device_name}')
                 self.app.render(f'Device does not exist with name {device_name}\n')
                 return
-            response = search_response.results[0]
         except ApiException as e:
             self.app.log.error(f"[device-show] Failed to list devices: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
@@ -268,6 +245,43 @@ class Device(Controller):
             renderable = self._device_basic_response(response, OutputFormat.JSON)
             self.app.render(renderable, format=OutputFormat.JSON.value)
 
+    @ex(
+        help='Search devices by partial or approximate name, alias, serial, IMEI or tag in the local device index',
+        arguments=[
+            (['query'],
+             {'help': 'Search text',
+              'action': 'store'}),
+            (['-l', '--limit'],
+             {'help': 'Number of matches to return',
+              'action': 'store',
+              'type': int,
+              'default': 10,
+              'dest': 'limit'}),
+            (['-j', '--json'],
+             {'help': 'Render result in Json format',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ]
+    )
+    def search(self):
+        index = DeviceIndex.load()
+        if index is None:
+            self.app.log.error("[device-search] There is no device index yet")
+            self.app.render("There is no device index yet, create it with `espercli completion refresh`\n")
+            self.app.exit_code = 1
+            return
+
+        matches = index.search(self.app.pargs.query, limit=self.app.pargs.limit)
+        devices = [{'id': match.device[0], 'name': match.device[1], 'alias': match.device[2], 'field': match.field,
+                    'value': match.value, 'score': match.score} for match in matches]
+
+        if not self.app.pargs.json:
+            self.app.render(f"Number of Matches: {len(devices)}")
+            renderable = [{key.upper(): value for key, value in device.items()} for device in devices]
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        else:
+            self.app.render(devices, format=OutputFormat.JSON.value)
+
     @ex(
         help='Set or show the active device',
         arguments=[
@@ -289,14 +303,12 @@ class Device(Controller):
 
         if self.app.pargs.name:
             device_name = self.app.pargs.name
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[device-active] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 name, _ = self.get_name_and_tags_from_device(response)
                 db.set_device({'id': response.id, 'name': name})
             except ApiException as e:
@@ -1,15 +1,33 @@
+import sys
 from ast import literal_eval
 
 from cement import ex, Controller
 from esperclient import GroupCommandRequest
 from esperclient.rest import ApiException
+from tqdm import tqdm
 
 from esper.controllers.enums import OutputFormat, DeviceCommandEnum
 from esper.ext.api_client import APIClient
 from esper.ext.db_wrapper import DBWrapper
+from esper.ext.polling import AdaptivePoller, group_command_states
 from esper.ext.utils import validate_creds_exists, parse_error_message
 
 
+# Arguments shared by the commands that fire a group command
+WAIT_ARGUMENTS = [
+    (['-w', '--wait'],
+     {'help': 'Wait until the command completes on every device',
+      'action': 'store_true',
+      'dest': 'wait'}),
+    (['-t', '--timeout'],
+     {'help': 'Seconds to wait for completion, default 600',
+      'action': 'store',
+      'type': float,
+      'default': 600,
+      'dest': 'timeout'}),
+]
+
+
 class GroupCommand(Controller):
     class Meta:
         label = 'group-command'
@@ -86,6 +104,62 @@ class GroupCommand(Controller):
 
         return renderable
 
+    def _watch(self, command_client, command, group_id, enterprise_id, timeout, label):
+        """
+        Poll a group command until no device is in progress, printing devices as their state changes and a
+        progress bar of the counts on stderr. Sets a non-zero exit code if any device failed (1) or the
+        command did not complete within the timeout (2).
+        :return: The last polled command, None if polling failed
+        """
+        poller = AdaptivePoller(timeout=timeout)
+        previous = {}
+        polled = False
+        quiet = self.app.pargs.json
+
+        with tqdm(total=0, unit='device', desc='Waiting', file=sys.stderr, disable=None, leave=False) as pbar:
+            while True:
+                details = literal_eval(command.details) if command.details else {}
+                states = group_command_states(details)
+                changed = {name: state for name, state in states.items() if previous.get(name) != state}
+                previous = states
+
+                if not quiet:
+                    for name in sorted(changed, key=str):
+                        tqdm.write(f'{name}\t{changed[name]}', file=sys.stdout)
+
+                counts = {key: 0 for key in ('success', 'failed', 'inactive', 'in_progress')}
+                for state in states.values():
+                    counts[state] += 1
+
+                pbar.total = len(states)
+                pbar.n = len(states) - counts['in_progress']
+                pbar.set_postfix(counts, refresh=False)
+                pbar.refresh()
+
+                # The command as created has no devices yet, a polled one without devices has none to wait for
+                if (states or polled) and counts['in_progress'] == 0:
+                    break
+
+                if not poller.wait(changed=bool(changed)):
+                    self.app.log.debug(f"[{label}] Timed out waiting for command {command.id}")
+                    self.app.render(f"Timed out after {timeout:g}s waiting for command {command.id}, "
+                                    f"{counts['in_progress']} device(s) still in progress\n")
+                    self.app.exit_code = 2
+                    return command
+
+                try:
+                    command = command_client.get_group_command(command.id, group_id, enterprise_id)
+                    polled = True
+                except ApiException as e:
+                    self.app.log.error(f"[{label}] Failed to poll group command: {e}")
+                    self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+                    self.app.exit_code = 1
+                    return None
+
+        if counts['failed']:
+            self.app.exit_code = 1
+        return command
+
     @ex(
         help='Show command details',
         arguments=[
@@ -149,6 +223,80 @@ class GroupCommand(Controller):
             renderable = self._command_basic_response(response, OutputFormat.JSON)
             self.app.render(renderable, format=OutputFormat.JSON.value)
 
+    @ex(
+        help='Watch a command until it completes on every device',
+        arguments=[
+            (['command_id'],
+             {'help': 'Group command id',
+              'action': 'store'}),
+            (['-g', '--group'],
+             {'help': 'Group name',
+              'action': 'store',
+              'dest': 'group'}),
+            (['-t', '--timeout'],
+             {'help': 'Seconds to wait for completion, default 600',
+              'action': 'store',
+              'type': float,
+              'default': 600,
+              'dest': 'timeout'}),
+            (['-j', '--json'],
+             {'help': 'Render result in Json format',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ]
+    )
+    def watch(self):
+        command_id = self.app.pargs.command_id
+        validate_creds_exists(self.app)
+        db = DBWrapper(self.app.creds)
+        command_client = APIClient(db.get_configure()).get_group_command_api_client()
+        enterprise_id = db.get_enterprise_id()
+        group_client = APIClient(db.get_configure()).get_group_api_client()
+
+        if self.app.pargs.group:
+            group_name = self.app.pargs.group
+            kwargs = {'name': group_name}
+            try:
+                search_response = group_client.get_all_groups(enterprise_id, limit=1, offset=0, **kwargs)
+                if not search_response.results or len(search_response.results) == 0:
+                    self.app.log.debug(f'[group-command-watch] Group does not exist with name {group_name}')
+                    self.app.render(f'Group does not exist with name {group_name}\n')
+                    return
+                response = search_response.results[0]
+                group_id = response.id
+            except ApiException as e:
+                self.app.log.error(f"[group-command-watch] Failed to list groups: {e}")
+                self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+                return
+
+        else:
+            group = db.get_group()
+            if group is None or group.get('name') is None:
+                self.app.log.debug('[group-command-watch] There is no active group.')
+                self.app.render('There is no active group.\n')
+                return
+
+            group_id = group.get('id')
+
+        try:
+            response = command_client.get_group_command(command_id, group_id, enterprise_id)
+        except ApiException as e:
+            self.app.log.error(f"[group-command-watch] Failed to show details of group command: {e}")
+            self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+            return
+
+        response = self._watch(command_client, response, group_id, enterprise_id, self.app.pargs.timeout,
+                               'group-command-watch')
+        if response is None:
+            return
+
+        if not self.app.pargs.json:
+            renderable = self._command_basic_response(response)
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        else:
+            renderable = self._command_basic_response(response, OutputFormat.JSON)
+            self.app.render(renderable, format=OutputFormat.JSON.value)
+
     @ex(
         help='Install application version',
         arguments=[
@@ -164,7 +312,7 @@ class GroupCommand(Controller):
              {'help': 'Render result in Json format',
               'action': 'store_true',
               'dest': 'json'}),
-        ]
+        ] + WAIT_ARGUMENTS
     )
     def install(self):
         validate_creds_exists(self.app)
@@ -208,6 +356,12 @@ class GroupCommand(Controller):
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
             return
 
+        if self.app.pargs.wait:
+            response = self._watch(command_client, response, group_id, enterprise_id, self.app.pargs.timeout,
+                                   'group-command-install')
+            if response is None:
+                return
+
         if not self.app.pargs.json:
             renderable = self._command_basic_response(response)
             self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
@@ -226,7 +380,7 @@ class GroupCommand(Controller):
              {'help': 'Render result in Json format',
               'action': 'store_true',
               'dest': 'json'}),
-        ]
+        ] + WAIT_ARGUMENTS
     )
     def ping(self):
         validate_creds_exists(self.app)
@@ -268,6 +422,12 @@ class GroupCommand(Controller):
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
             return
 
+        if self.app.pargs.wait:
+            response = self._watch(command_client, response, group_id, enterprise_id, self.app.pargs.timeout,
+                                   'group-command-ping')
+            if response is None:
+                return
+
         if not self.app.pargs.json:
             renderable = self._command_basic_response(response)
             self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
@@ -286,7 +446,7 @@ class GroupCommand(Controller):
              {'help': 'Render result in Json format',
               'action': 'store_true',
               'dest': 'json'}),
-        ]
+        ] + WAIT_ARGUMENTS
     )
     def lock(self):
         validate_creds_exists(self.app)
@@ -328,6 +488,12 @@ class GroupCommand(Controller):
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
             return
 
+        if self.app.pargs.wait:
+            response = self._watch(command_client, response, group_id, enterprise_id, self.app.pargs.timeout,
+                                   'group-command-lock')
+            if response is None:
+                return
+
         if not self.app.pargs.json:
             renderable = self._command_basic_response(response)
             self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
@@ -346,7 +512,7 @@ class GroupCommand(Controller):
              {'help': 'Render result in Json format',
               'action': 'store_true',
               'dest': 'json'}),
-        ]
+        ] + WAIT_ARGUMENTS
     )
     def reboot(self):
         validate_creds_exists(self.app)
@@ -388,6 +554,12 @@ class GroupCommand(Controller):
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
             return
 
+        if self.app.pargs.wait:
+            response = self._watch(command_client, response, group_id, enterprise_id, self.app.pargs.timeout,
+                                   'group-command-reboot')
+            if response is None:
+                return
+
         if not self.app.pargs.json:
             renderable = self._command_basic_response(response)
             self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
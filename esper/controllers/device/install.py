@@ -1,10 +1,21 @@
+import sys
+import time
+
 from cement import Controller, ex
 from esperclient.rest import ApiException
+from tqdm import tqdm
 
 from esper.controllers.enums import OutputFormat
 from esper.ext.api_client import APIClient
+from esper.ext.bulk import fetch_all_pages, run_concurrently
 from esper.ext.db_wrapper import DBWrapper
-from esper.ext.utils import validate_creds_exists, parse_error_message
+from esper.ext.device_search import find_device
+from esper.ext.listing import INSTALLS, fetch_results
+from esper.ext.inventory import InstallInventory
+from esper.ext.utils import validate_creds_exists, parse_error_message, format_age
+
+# Devices collected between writes to the inventory
+COLLECT_CHUNK = 500
 
 
 class AppInstall(Controller):
@@ -49,6 +60,10 @@ class AppInstall(Controller):
               'action': 'store',
               'default': 0,
               'dest': 'offset'}),
+            (['-f', '--fields'],
+             {'help': f"Comma separated fields to show, out of {', '.join(INSTALLS.columns)}",
+              'action': 'store',
+              'dest': 'fields'}),
             (['-j', '--json'],
              {'help': 'Render result in Json format',
               'action': 'store_true',
@@ -62,16 +77,21 @@ class AppInstall(Controller):
         device_client = APIClient(db.get_configure()).get_device_api_client()
         enterprise_id = db.get_enterprise_id()
 
+        try:
+            columns = INSTALLS.select(self.app.pargs.fields)
+        except ValueError as e:
+            self.app.log.error(f"[installs-list] {e}")
+            self.app.render(f"ERROR: {e}\n")
+            return
+
         if self.app.pargs.device:
             device_name = self.app.pargs.device
-            kwargs = {'name': device_name}
             try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
+                response = find_device(self.app, device_client, enterprise_id, device_name)
+                if not response:
                     self.app.log.debug(f'[installs-list] Device does not exist with name {device_name}')
                     self.app.render(f'Device does not exist with name {device_name}\n')
                     return
-                response = search_response.results[0]
                 device_id = response.id
             except ApiException as e:
                 self.app.log.error(f"[installs-list] Failed to list devices: {e}")
@@ -103,45 +123,175 @@ class AppInstall(Controller):
             kwargs['install_state'] = install_state
 
         try:
-            response = device_client.get_app_installs(enterprise_id, device_id, limit=limit, offset=offset, **kwargs)
+            count, results = fetch_results(device_client.get_app_installs, enterprise_id, device_id, limit=limit,
+                                           offset=offset, **kwargs)
         except ApiException as e:
             self.app.log.error(f"[installs-list] Failed to list installs: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
             return
 
-        self.app.render(f"Total Number of Installs: {response.count}")
+        self.app.render(f"Total Number of Installs: {count}")
+        installs = INSTALLS.rows(results, columns, json_keys=self.app.pargs.json)
         if not self.app.pargs.json:
-            installs = []
-
-            label = {
-                'id': "ID",
-                'application_name': "APPLICATION",
-                'package_name': "PACKAGE",
-                'version_code': "VERSION",
-                'install_state': "STATE"
-            }
-
-            for install in response.results:
-                installs.append(
-                    {
-                        label['id']: install.id,
-                        label['application_name']: install.application.application_name,
-                        label['package_name']: install.application.package_name,
-                        label['version_code']: install.application.version.version_code,
-                        label['install_state']: install.install_state
-                    }
-                )
             self.app.render(installs, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
         else:
-            installs = []
-            for install in response.results:
-                installs.append(
-                    {
-                        'id': install.id,
-                        'application_name': install.application.application_name,
-                        'package_name': install.application.package_name,
-                        'version_code': install.application.version.version_code,
-                        'install_state': install.install_state
-                    }
-                )
-            self.app.render(installs, format=OutputFormat.JSON.value)
+            self.app.render([install.as_dict() for install in installs], format=OutputFormat.JSON.value)
+
+    def _inventory(self):
+        return InstallInventory(self.app.config.get('esper', 'inventory_file'))
+
+    @ex(
+        help='Collect the installs of every device into the local inventory',
+        arguments=[
+            (['-g', '--group'],
+             {'help': 'Only collect devices of this group',
+              'action': 'store',
+              'dest': 'group'}),
+            (['--workers'],
+             {'help': 'Devices collected at once, default max_concurrency from esper.yml',
+              'action': 'store',
+              'type': int,
+              'dest': 'workers'}),
+            (['-j', '--json'],
+             {'help': 'Render result in Json format',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ]
+    )
+    def collect(self):
+        """Command to collect installs of all devices"""
+        validate_creds_exists(self.app)
+        db = DBWrapper(self.app.creds)
+        device_client = APIClient(db.get_configure()).get_device_api_client()
+        enterprise_id = db.get_enterprise_id()
+        start = time.time()
+
+        kwargs = {}
+        if self.app.pargs.group:
+            group_name = self.app.pargs.group
+            group_client = APIClient(db.get_configure()).get_group_api_client()
+            try:
+                search_response = group_client.get_all_groups(enterprise_id, limit=1, offset=0, name=group_name)
+            except ApiException as e:
+                self.app.log.error(f"[installs-collect] Failed to list groups: {e}")
+                self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+                return
+
+            if not search_response.results:
+                self.app.log.debug(f'[installs-collect] Group does not exist with name {group_name}')
+                self.app.render(f'Group does not exist with name {group_name}\n')
+                return
+            kwargs['group'] = search_response.results[0].id
+
+        try:
+            devices = fetch_all_pages(
+                lambda limit, offset: device_client.get_all_devices(enterprise_id, limit=limit, offset=offset,
+                                                                    **kwargs))
+        except ApiException as e:
+            self.app.log.error(f"[installs-collect] Failed to list devices: {e}")
+            self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+            return
+
+        def collect_device(device):
+            return fetch_all_pages(
+                lambda limit, offset: device_client.get_app_installs(enterprise_id, device.id, limit=limit,
+                                                                     offset=offset),
+                workers=1)
+
+        installs = 0
+        failed = []
+        with self._inventory() as inventory, \
+                tqdm(total=len(devices), unit='device', desc='Collecting', file=sys.stderr, disable=None,
+                     leave=False) as pbar:
+            # Store each chunk as it arrives, so memory stays flat on large fleets
+            for chunk_start in range(0, len(devices), COLLECT_CHUNK):
+                chunk = devices[chunk_start:chunk_start + COLLECT_CHUNK]
+                for device, results, error in run_concurrently(collect_device, chunk, self.app.pargs.workers):
+                    if error is not None:
+                        message = parse_error_message(self.app, error) if isinstance(error, ApiException) else error
+                        self.app.log.error(f"[installs-collect] Failed to list installs of {device.device_name}: "
+                                           f"{message}")
+                        failed.append(device.device_name)
+                    else:
+                        inventory.replace_device(enterprise_id, device.id, device.device_name, results)
+                        installs += len(results)
+                pbar.update(len(chunk))
+
+            if not kwargs:
+                inventory.prune_devices(enterprise_id, [device.id for device in devices])
+
+        summary = {
+            'devices': len(devices) - len(failed),
+            'installs': installs,
+            'failed': failed,
+            'seconds': round(time.time() - start, 2)
+        }
+        if not self.app.pargs.json:
+            renderable = [{'TITLE': key, 'DETAILS': '\n'.join(value) if isinstance(value, list) else value}
+                          for key, value in summary.items()]
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        else:
+            self.app.render(summary, format=OutputFormat.JSON.value)
+
+        if failed:
+            self.app.exit_code = 1
+
+    @ex(
+        help='Query the local installs inventory for version compliance',
+        arguments=[
+            (['-p', '--package'],
+             {'help': 'Package name',
+              'action': 'store',
+              'dest': 'package'}),
+            (['-b', '--below'],
+             {'help': 'List devices with the package at a version lower than this one',
+              'action': 'store',
+              'dest': 'below'}),
+            (['-m', '--missing'],
+             {'help': 'List devices without the package',
+              'action': 'store_true',
+              'dest': 'missing'}),
+            (['-s', '--state'],
+             {'help': 'Install state, with --below',
+              'action': 'store',
+              'dest': 'state'}),
+            (['-j', '--json'],
+             {'help': 'Render result in Json format',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ]
+    )
+    def compliance(self):
+        """Command to answer version compliance queries from the inventory"""
+        validate_creds_exists(self.app)
+        db = DBWrapper(self.app.creds)
+        enterprise_id = db.get_enterprise_id()
+
+        package_name = self.app.pargs.package
+        if not package_name:
+            self.app.log.debug('[installs-compliance] package cannot be empty.')
+            self.app.render('package cannot be empty.\n')
+            return
+
+        with self._inventory() as inventory:
+            stats = inventory.stats(enterprise_id)
+            if not stats['devices']:
+                self.app.log.debug('[installs-compliance] The inventory is empty.')
+                self.app.render('No installs collected yet, run `espercli installs collect` first.\n')
+                return
+
+            if self.app.pargs.missing:
+                results = inventory.missing(enterprise_id, package_name)
+            elif self.app.pargs.below:
+                results = inventory.below(enterprise_id, package_name, self.app.pargs.below, self.app.pargs.state)
+            else:
+                results = inventory.versions(enterprise_id, package_name)
+
+        age = time.time() - stats['oldest']
+        self.app.render(f"Inventory of {stats['devices']} devices, collected {format_age(age)} ago")
+        self.app.render(f"Number of Results: {len(results)}")
+        if not self.app.pargs.json:
+            renderable = [{key.upper(): value for key, value in result.items()} for result in results]
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        else:
+            self.app.render(results, format=OutputFormat.JSON.value)
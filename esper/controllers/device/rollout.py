@@ -0,0 +1,242 @@
+from cement import Controller, ex
+from esperclient import CommandRequest
+from esperclient.rest import ApiException
+
+from esper.controllers.enums import OutputFormat, DeviceCommandEnum, DeviceState
+from esper.ext.api_client import APIClient
+from esper.ext.bulk import fetch_all_pages, read_items, run_concurrently, unique
+from esper.ext.db_wrapper import DBWrapper
+from esper.ext.rollout import DEFAULT_WAVES, Rollout, parse_waves, plan_waves
+from esper.ext.utils import validate_creds_exists, parse_error_message
+
+
+class AppRollout(Controller):
+    class Meta:
+        label = 'rollout'
+
+        # text displayed at the top of --help output
+        description = 'Staged rollout of commands to devices in waves'
+
+        # text displayed at the bottom of --help output
+        epilog = 'Usage: espercli rollout'
+
+        stacked_type = 'nested'
+        stacked_on = 'base'
+
+    def _target_devices(self, db, enterprise_id, tag):
+        """Devices named by --devices/--devices-file, else the members of --group or of the active group"""
+        device_client = APIClient(db.get_configure()).get_device_api_client()
+
+        names = list(self.app.pargs.devices or [])
+        if self.app.pargs.devices_file:
+            try:
+                names.extend(read_items(self.app.pargs.devices_file))
+            except OSError as e:
+                self.app.log.error(f"[{tag}] Failed to read devices file: {e}")
+                self.app.render(f"ERROR: {e}\n")
+                return None
+
+        if names:
+            def lookup(device_name):
+                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, name=device_name)
+                return search_response.results[0] if search_response.results else None
+
+            devices = []
+            missing = []
+            for device_name, device, error in run_concurrently(lookup, unique(names)):
+                if error is not None:
+                    self.app.log.error(f"[{tag}] Failed to list devices: {error}")
+                    message = parse_error_message(self.app, error) if isinstance(error, ApiException) else error
+                    self.app.render(f"ERROR: {message}\n")
+                    return None
+                if device is None:
+                    missing.append(device_name)
+                else:
+                    devices.append(device)
+
+            if missing:
+                self.app.log.debug(f'[{tag}] Device does not exist with name {", ".join(missing)}')
+                self.app.render(f'Device does not exist with name {", ".join(missing)}\n')
+                return None
+
+            return devices
+
+        if self.app.pargs.group:
+            group_name = self.app.pargs.group
+            group_client = APIClient(db.get_configure()).get_group_api_client()
+            try:
+                search_response = group_client.get_all_groups(enterprise_id, limit=1, offset=0, name=group_name)
+            except ApiException as e:
+                self.app.log.error(f"[{tag}] Failed to list groups: {e}")
+                self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+                return None
+
+            if not search_response.results:
+                self.app.log.debug(f'[{tag}] Group does not exist with name {group_name}')
+                self.app.render(f'Group does not exist with name {group_name}\n')
+                return None
+            group_id = search_response.results[0].id
+        else:
+            group = db.get_group()
+            if group is None or group.get('name') is None:
+                self.app.log.debug(f'[{tag}] There is no active group.')
+                self.app.render('There is no active group.\n')
+                return None
+            group_id = group.get('id')
+
+        try:
+            return fetch_all_pages(
+                lambda limit, offset: device_client.get_all_devices(enterprise_id, group=group_id, limit=limit,
+                                                                    offset=offset))
+        except ApiException as e:
+            self.app.log.error(f"[{tag}] Failed to list device by group: {e}")
+            self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+            return None
+
+    @ex(
+        help='Install an application version in waves, halting when too many installs fail',
+        arguments=[
+            (['-V', '--version'],
+             {'help': 'Application version id',
+              'action': 'store',
+              'dest': 'version'}),
+            (['-g', '--group'],
+             {'help': 'Group name, the active group is used if no devices are given',
+              'action': 'store',
+              'dest': 'group'}),
+            (['-d', '--devices'],
+             {'help': 'List of devices, space separated',
+              'nargs': "*",
+              'type': str,
+              'dest': 'devices'}),
+            (['-f', '--devices-file'],
+             {'help': "File with device names, one per line or comma separated. Use '-' for stdin",
+              'action': 'store',
+              'dest': 'devices_file'}),
+            (['-w', '--waves'],
+             {'help': f'Cumulative percentages of devices reached after each wave, default {DEFAULT_WAVES}',
+              'action': 'store',
+              'default': DEFAULT_WAVES,
+              'dest': 'waves'}),
+            (['-m', '--max-failure-rate'],
+             {'help': 'Percentage of failed installs above which the rollout halts, default 5',
+              'action': 'store',
+              'type': float,
+              'default': 5,
+              'dest': 'max_failure_rate'}),
+            (['-t', '--wave-timeout'],
+             {'help': 'Seconds to wait for the installs of a wave to finish, default 600',
+              'action': 'store',
+              'type': float,
+              'default': 600,
+              'dest': 'wave_timeout'}),
+            (['--workers'],
+             {'help': 'Requests in flight, default max_concurrency from esper.yml',
+              'action': 'store',
+              'type': int,
+              'dest': 'workers'}),
+            (['--include-inactive'],
+             {'help': 'Also target devices that are not active; their installs stay pending until they connect, and '
+                      'count as failed when that is after the wave timeout',
+              'action': 'store_true',
+              'dest': 'include_inactive'}),
+            (['--dry-run'],
+             {'help': 'Only show the waves',
+              'action': 'store_true',
+              'dest': 'dry_run'}),
+            (['-j', '--json'],
+             {'help': 'Render result in Json format',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ]
+    )
+    def install(self):
+        validate_creds_exists(self.app)
+        db = DBWrapper(self.app.creds)
+        command_client = APIClient(db.get_configure()).get_command_api_client()
+        enterprise_id = db.get_enterprise_id()
+
+        version_id = self.app.pargs.version
+        if not version_id:
+            self.app.log.debug('[rollout-install] version cannot be empty.')
+            self.app.render('version cannot be empty.\n')
+            return
+
+        try:
+            waves = parse_waves(self.app.pargs.waves)
+        except ValueError as e:
+            self.app.log.debug(f'[rollout-install] Invalid waves: {e}')
+            self.app.render(f'{e}\n')
+            return
+
+        devices = self._target_devices(db, enterprise_id, 'rollout-install')
+        if devices is None:
+            return
+
+        if not self.app.pargs.include_inactive:
+            skipped = [device for device in devices if device.status != DeviceState.ACTIVE.value]
+            if skipped:
+                self.app.log.debug(f'[rollout-install] Skipping {len(skipped)} devices that are not active')
+            devices = [device for device in devices if device.status == DeviceState.ACTIVE.value]
+
+        if not devices:
+            self.app.log.debug('[rollout-install] There are no devices to install on.')
+            self.app.render('There are no devices to install on.\n')
+            return
+
+        names = {device.id: device.device_name for device in devices}
+        plan = plan_waves(list(names), waves)
+        max_failure_rate = self.app.pargs.max_failure_rate / 100
+
+        if self.app.pargs.dry_run:
+            renderable = [{'wave': index, 'devices': len(device_ids), 'names': [names[d] for d in device_ids]}
+                          for index, device_ids in enumerate(plan, start=1)]
+            if not self.app.pargs.json:
+                renderable = [{'WAVE': wave['wave'], 'DEVICES': wave['devices'], 'NAMES': '\n'.join(wave['names'])}
+                              for wave in renderable]
+                self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+            else:
+                self.app.render(renderable, format=OutputFormat.JSON.value)
+            return
+
+        def fire(device_id):
+            command_request = CommandRequest(command_args={"app_version": version_id},
+                                             command=DeviceCommandEnum.INSTALL.name)
+            return command_client.run_command(enterprise_id, device_id, command_request).id
+
+        def poll(device_id, command_id):
+            return command_client.get_command(command_id, device_id, enterprise_id).state
+
+        def on_wave(result, rate):
+            self.app.log.debug(f"[rollout-install] Wave {result.index}: {result.to_dict()}")
+            for device_id, error in result.errors.items():
+                message = parse_error_message(self.app, error) if isinstance(error, ApiException) else error
+                self.app.log.error(f"[rollout-install] Failed to fire the install command on {names[device_id]}: "
+                                   f"{message}")
+            if not self.app.pargs.json:
+                self.app.render(f"Wave {result.index}/{len(plan)}: {len(result.device_ids)} devices, "
+                                f"{result.success} success, {result.failed} failed, {result.pending} pending, "
+                                f"failure rate {rate:.1%}\n")
+
+        rollout = Rollout(fire, poll, max_failure_rate, self.app.pargs.wave_timeout, self.app.pargs.workers,
+                          on_wave)
+        results = rollout.run(plan)
+        rate = rollout.failure_rate()
+
+        if rollout.halted:
+            self.app.render(f"Rollout halted after wave {len(results)} of {len(plan)}: failure rate {rate:.1%} "
+                            f"is above {max_failure_rate:.1%}\n")
+        if rate > max_failure_rate:
+            self.app.exit_code = 1
+
+        if not self.app.pargs.json:
+            renderable = [{key.upper(): value for key, value in result.to_dict().items()} for result in results]
+            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+        else:
+            renderable = {
+                'version': version_id,
+                'halted': rollout.halted,
+                'failure_rate': rate,
+                'waves': [result.to_dict() for result in results]
+            }
+            self.app.render(renderable, format=OutputFormat.JSON.value)
@@ -1,10 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from cement import Controller, ex
 from esperclient import DeviceGroup, DeviceGroupUpdate
 from esperclient.rest import ApiException
 
-from esper.controllers.enums import OutputFormat, DeviceState
+from esper.controllers.enums import OutputFormat
 from esper.ext.api_client import APIClient
+from esper.ext.bulk import fetch_all_pages, read_items, run_concurrently, unique
 from esper.ext.db_wrapper import DBWrapper
+from esper.ext.listing import DEVICES, fetch_results
 from esper.ext.utils import validate_creds_exists, parse_error_message
 
 
@@ -384,108 +388,134 @@ class EnterpriseGroup(Controller):
             return
 
     def _get_group_device_ids(self, device_client, enterprise_id, group_id):
-        device_ids = []
         try:
-            counter = 0
-            limit = 100
-            while True:
-                offset = limit * counter
-                response = device_client.get_all_devices(enterprise_id, group=group_id, limit=limit, offset=offset)
-                if not response.results or len(response.results) == 0:
-                    break
-
-                device_ids.extend([device.id for device in response.results])
-                counter += 1
+            devices = fetch_all_pages(
+                lambda limit, offset: device_client.get_all_devices(enterprise_id, group=group_id, limit=limit,
+                                                                    offset=offset))
         except ApiException as e:
             self.app.log.error(f"[_get_group_device_ids] Failed to list device by group: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
             return None
 
-        return device_ids
-
-    @ex(
-        help='Add devices to group',
-        arguments=[
-            (['-g', '--group'],
-             {'help': 'Group name',
-              'action': 'store',
-              'dest': 'group'}),
-            (['-d', '--devices'],
-             {'help': 'List of devices, space separated',
-              'nargs': "*",
-              'type': str,
-              'dest': 'devices'}),
-            (['-j', '--json'],
-             {'help': 'Render result in Json format',
-              'action': 'store_true',
-              'dest': 'json'})
-        ]
-    )
-    def add(self):
-        validate_creds_exists(self.app)
-        db = DBWrapper(self.app.creds)
-        group_client = APIClient(db.get_configure()).get_group_api_client()
-        enterprise_id = db.get_enterprise_id()
-        data = DeviceGroupUpdate()
+        return [device.id for device in devices]
 
+    def _resolve_group(self, group_client, db, enterprise_id, tag):
+        """Return the (id, name) of the group given by --group, or of the active group"""
         if self.app.pargs.group:
             group_name = self.app.pargs.group
             kwargs = {'name': group_name}
             try:
                 search_response = group_client.get_all_groups(enterprise_id, limit=1, offset=0, **kwargs)
                 if not search_response.results or len(search_response.results) == 0:
-                    self.app.log.debug(f'[group-add] Group does not exist with name {group_name}')
+                    self.app.log.debug(f'[{tag}] Group does not exist with name {group_name}')
                     self.app.render(f'Group does not exist with name {group_name}')
-                    return
+                    return None, None
                 response = search_response.results[0]
-                group_id = response.id
+                return response.id, response.name
             except ApiException as e:
-                self.app.log.error(f"[group-add] Failed to list groups: {e}")
+                self.app.log.error(f"[{tag}] Failed to list groups: {e}")
                 self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
-                return
+                return None, None
 
-        else:
-            group = db.get_group()
-            if group is None or group.get('name') is None:
-                self.app.log.debug('[group-add] There is no active group.')
-                self.app.render('There is no active group.')
-                return
+        group = db.get_group()
+        if group is None or group.get('name') is None:
+            self.app.log.debug(f'[{tag}] There is no active group.')
+            self.app.render('There is no active group.')
+            return None, None
 
-            group_id = group.get('id')
+        return group.get('id'), group.get('name')
 
-        devices = self.app.pargs.devices
-        if not devices or len(devices) == 0:
-            self.app.log.debug('[group-add] devices cannot be empty.')
+    def _requested_devices(self, tag):
+        """Device names from --devices and --devices-file, without duplicates"""
+        devices = list(self.app.pargs.devices or [])
+        if self.app.pargs.devices_file:
+            try:
+                devices.extend(read_items(self.app.pargs.devices_file))
+            except OSError as e:
+                self.app.log.error(f"[{tag}] Failed to read devices file: {e}")
+                self.app.render(f"ERROR: {e}\n")
+                return None
+
+        devices = unique(devices)
+        if not devices:
+            self.app.log.debug(f'[{tag}] devices cannot be empty.')
             self.app.render('devices cannot be empty.')
-            return
+            return None
 
-        device_client = APIClient(db.get_configure()).get_device_api_client()
-        request_device_ids = []
-        for device_name in devices:
-            kwargs = {'name': device_name}
-            try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
-                    self.app.debug(f'[group-add] Device does not exist with name {device_name}')
-                    return
-                response = search_response.results[0]
-                request_device_ids.append(response.id)
-            except ApiException as e:
-                self.app.log.error(f"[group-add] Failed to list devices: {e}")
-                self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
-                return
+        return devices
 
+    def _resolve_device_ids(self, device_client, enterprise_id, devices, tag):
+        """Look up device names concurrently. Returns None, after reporting every unknown name, if any is missing."""
+        def lookup(device_name):
+            search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, name=device_name)
+            return search_response.results[0].id if search_response.results else None
+
+        device_ids = []
+        missing = []
+        for device_name, device_id, error in run_concurrently(lookup, devices):
+            if error is not None:
+                self.app.log.error(f"[{tag}] Failed to list devices: {error}")
+                message = parse_error_message(self.app, error) if isinstance(error, ApiException) else error
+                self.app.render(f"ERROR: {message}")
+                return None
+            if device_id is None:
+                missing.append(device_name)
+            else:
+                device_ids.append(device_id)
+
+        if missing:
+            self.app.log.debug(f'[{tag}] Device does not exist with name {", ".join(missing)}')
+            self.app.render(f'Device does not exist with name {", ".join(missing)}')
+            return None
+
+        return device_ids
+
+    def _update_group_devices(self, add: bool):
+        tag = 'group-add' if add else 'group-remove'
+
+        validate_creds_exists(self.app)
+        db = DBWrapper(self.app.creds)
+        group_client = APIClient(db.get_configure()).get_group_api_client()
         device_client = APIClient(db.get_configure()).get_device_api_client()
-        device_ids = self._get_group_device_ids(device_client, enterprise_id, group_id)
-        if device_ids is None:
+        enterprise_id = db.get_enterprise_id()
+
+        group_id, group_name = self._resolve_group(group_client, db, enterprise_id, tag)
+        if group_id is None:
+            return
+
+        devices = self._requested_devices(tag)
+        if devices is None:
             return
 
-        device_ids.extend(request_device_ids)
-        data.device_ids = device_ids
+        # Name lookups and the membership listing are independent, so run them side by side
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            requested = executor.submit(self._resolve_device_ids, device_client, enterprise_id, devices, tag)
+            current = executor.submit(self._get_group_device_ids, device_client, enterprise_id, group_id)
+            request_device_ids, current_device_ids = requested.result(), current.result()
+
+        if request_device_ids is None or current_device_ids is None:
+            return
+
+        current_set = set(current_device_ids)
+        if add:
+            delta = set(request_device_ids) - current_set
+            latest_devices = current_set | delta
+        else:
+            delta = set(request_device_ids) & current_set
+            latest_devices = current_set - delta
+
+        self.app.log.debug(f"[{tag}] {len(delta)} of {len(request_device_ids)} devices to "
+                           f"{'add' if add else 'remove'}, group has {len(current_set)}")
+
         try:
-            response = group_client.partial_update_group(group_id, enterprise_id, data)
+            if delta:
+                data = DeviceGroupUpdate(name=group_name, device_ids=sorted(latest_devices))
+                response = group_client.partial_update_group(group_id, enterprise_id, data)
+            else:
+                response = group_client.get_group_by_id(group_id, enterprise_id)
         except ApiException as e:
-            self.app.log.error(f"[group-add]  Failed to add device into a group: {e}")
+            action = 'add device into' if add else 'remove device from'
+            self.app.log.error(f"[{tag}] Failed to {action} a group: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
             return
 
@@ -496,6 +526,31 @@ class EnterpriseGroup(Controller):
             renderable = self._group_basic_response(response, OutputFormat.JSON)
             self.app.render(renderable, format=OutputFormat.JSON.value)
 
+    @ex(
+        help='Add devices to group',
+        arguments=[
+            (['-g', '--group'],
+             {'help': 'Group name',
+              'action': 'store',
+              'dest': 'group'}),
+            (['-d', '--devices'],
+             {'help': 'List of devices, space separated',
+              'nargs': "*",
+              'type': str,
+              'dest': 'devices'}),
+            (['-f', '--devices-file'],
+             {'help': "File with device names, one per line or comma separated. Use '-' for stdin",
+              'action': 'store',
+              'dest': 'devices_file'}),
+            (['-j', '--json'],
+             {'help': 'Render result in Json format',
+              'action': 'store_true',
+              'dest': 'json'})
+        ]
+    )
+    def add(self):
+        self._update_group_devices(add=True)
+
     @ex(
         help='Remove devices from group',
         arguments=[
@@ -508,6 +563,10 @@ class EnterpriseGroup(Controller):
               'nargs': "*",
               'type': str,
               'dest': 'devices'}),
+            (['-f', '--devices-file'],
+             {'help': "File with device names, one per line or comma separated. Use '-' for stdin",
+              'action': 'store',
+              'dest': 'devices_file'}),
             (['-j', '--json'],
              {'help': 'Render result in Json format',
               'action': 'store_true',
@@ -515,80 +574,7 @@ class EnterpriseGroup(Controller):
         ]
     )
     def remove(self):
-        validate_creds_exists(self.app)
-        db = DBWrapper(self.app.creds)
-        group_client = APIClient(db.get_configure()).get_group_api_client()
-        enterprise_id = db.get_enterprise_id()
-        data = DeviceGroupUpdate()
-
-        if self.app.pargs.group:
-            group_name = self.app.pargs.group
-            kwargs = {'name': group_name}
-            try:
-                search_response = group_client.get_all_groups(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
-                    self.app.log.debug(f'[group-remove] Group does not exist with name {group_name}')
-                    self.app.render(f'Group does not exist with name {group_name}')
-                    return
-                response = search_response.results[0]
-                group_id = response.id
-            except ApiException as e:
-                self.app.log.error(f"[group-remove] Failed to list groups: {e}")
-                self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
-                return
-
-        else:
-            group = db.get_group()
-            if group is None or group.get('name') is None:
-                self.app.log.debug('[group-remove] There is no active group.')
-                self.app.render('There is no active group.')
-                return
-
-            group_id = group.get('id')
-
-        devices = self.app.pargs.devices
-        if not devices or len(devices) == 0:
-            self.app.log.debug('[group-remove] devices cannot be empty.')
-            self.app.render('devices cannot be empty.')
-            return
-
-        device_client = APIClient(db.get_configure()).get_device_api_client()
-        request_device_ids = []
-        for device_name in devices:
-            kwargs = {'name': device_name}
-            try:
-                search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-                if not search_response.results or len(search_response.results) == 0:
-                    self.app.log.debug(f'[group-remove] Device does not exist with name {device_name}')
-                    self.app.render(f'Device does not exist with name {device_name}')
-                    return
-                response = search_response.results[0]
-                request_device_ids.append(response.id)
-            except ApiException as e:
-                self.app.log.error(f"Failed to list devices: {e}")
-                self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
-                return
-
-        device_client = APIClient(db.get_configure()).get_device_api_client()
-        current_device_ids = self._get_group_device_ids(device_client, enterprise_id, group_id)
-        if current_device_ids is None:
-            return
-
-        latest_devices = list(set(current_device_ids) - set(request_device_ids))
-        data.device_ids = latest_devices
-        try:
-            response = group_client.partial_update_group(group_id, enterprise_id, data)
-        except ApiException as e:
-            self.app.log.error(f"[group-remove] Failed to remove device from group: {e}")
-            self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
-            return
-
-        if not self.app.pargs.json:
-            renderable = self._group_basic_response(response)
-            self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
-        else:
-            renderable = self._group_basic_response(response, OutputFormat.JSON)
-            self.app.render(renderable, format=OutputFormat.JSON.value)
+        self._update_group_devices(add=False)
 
     @ex(
         help='List group devices',
@@ -607,6 +593,10 @@ class EnterpriseGroup(Controller):
               'action': 'store',
               'default': 0,
               'dest': 'offset'}),
+            (['-f', '--fields'],
+             {'help': f"Comma separated fields to show, out of {', '.join(DEVICES.columns)}",
+              'action': 'store',
+              'dest': 'fields'}),
             (['-j', '--json'],
              {'help': 'Render result in Json format',
               'action': 'store_true',
@@ -620,6 +610,13 @@ class EnterpriseGroup(Controller):
         group_client = APIClient(db.get_configure()).get_group_api_client()
         enterprise_id = db.get_enterprise_id()
 
+        try:
+            columns = DEVICES.select(self.app.pargs.fields)
+        except ValueError as e:
+            self.app.log.error(f"[group-devices] {e}")
+            self.app.render(f"ERROR: {e}\n")
+            return
+
         if self.app.pargs.group:
             group_name = self.app.pargs.group
             kwargs = {'name': group_name}
@@ -649,54 +646,16 @@ class EnterpriseGroup(Controller):
         offset = self.app.pargs.offset
 
         try:
-            response = device_client.get_all_devices(enterprise_id, group=group_id, limit=limit, offset=offset)
+            count, results = fetch_results(device_client.get_all_devices, enterprise_id, group=group_id, limit=limit,
+                                           offset=offset)
         except ApiException as e:
             self.app.log.error(f"[group-devices] Failed to list group devices: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}")
             return
 
-        self.app.render(f"Number of Devices: {response.count}")
+        self.app.render(f"Number of Devices: {count}")
+        devices = DEVICES.rows(results, columns, json_keys=self.app.pargs.json)
         if not self.app.pargs.json:
-            devices = []
-
-            label = {
-                'id': "ID",
-                'name': "NAME",
-                'model': "MODEL",
-                'state': "CURRENT STATE",
-                'tags': "TAGS"
-            }
-
-            for device in response.results:
-                name = device.device_name
-                if device.alias_name and device.alias_name != '':
-                    name = device.alias_name
-                tags = ''
-                if device.tags and len(device.tags) > 0:
-                    tags = ', '.join(device.tags)
-                devices.append(
-                    {
-                        label['id']: device.id,
-                        label['name']: name,
-                        label['model']: device.hardware_info.get("manufacturer"),
-                        label['state']: DeviceState(device.status).name,
-                        label['tags']: tags
-                    }
-                )
             self.app.render(devices, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
         else:
-            devices = []
-            for device in response.results:
-                name = device.device_name
-                if device.alias_name and device.alias_name != '':
-                    name = device.alias_name
-                devices.append(
-                    {
-                        'id': device.id,
-                        'device': name,
-                        'model': device.hardware_info.get("manufacturer"),
-                        'state': DeviceState(device.status).name,
-                        'tags': device.tags
-                    }
-                )
-            self.app.render(devices, format=OutputFormat.JSON.value)
+            self.app.render([device.as_dict() for device in devices], format=OutputFormat.JSON.value)
@@ -1,14 +1,39 @@
+import sys
+from datetime import datetime
 from enum import Enum
 
 from cement import Controller, ex
 from clint.textui import prompt
+from tqdm import tqdm
 
 from esper.controllers.enums import OutputFormat
 from esper.ext.db_wrapper import DBWrapper
 from esper.ext.pipeline_api import execute_pipeline, list_execute_pipeline, get_pipeline_execute_url, \
     APIException, render_single_dict
+from esper.ext.polling import AdaptivePoller, execution_outcome, execution_states
 from esper.ext.utils import validate_creds_exists
 
+# Exit status of a watched execution
+EXIT_CODES = {
+    'success': 0,
+    'failed': 1,
+    'timeout': 2,
+    'stopped': 3,
+}
+
+WAIT_ARGUMENTS = [
+    (['-w', '--wait'],
+     {'help': 'Wait until the execution finishes, printing stage and operation state changes',
+      'action': 'store_true',
+      'dest': 'wait'}),
+    (['-t', '--timeout'],
+     {'help': 'Seconds to wait for the execution to finish, default 3600',
+      'action': 'store',
+      'type': float,
+      'default': 3600,
+      'dest': 'timeout'}),
+]
+
 
 class ActionEnums(Enum):
     APP_INSTALL = "App Install to a Group of Devices"
@@ -89,6 +114,72 @@ class Execution(Controller):
         if response.status_code == 500:
             self.app.log.error(f"Internal Server Error! {response.json()}")
 
+    def _watch(self, args, execution):
+        """
+        Poll an execution until it completes, fails or is stopped, printing every state change of the
+        execution, its stages and operations as it is seen, and a progress bar of finished stages on stderr.
+        Sets the exit code from EXIT_CODES.
+        :return: Outcome (a key of EXIT_CODES) and the state changes seen, as dicts
+        """
+        url = get_pipeline_execute_url(args["environment"], args["enterprise_id"], args["pipeline_id"],
+                                       execution["id"])
+        timeout = self.app.pargs.timeout
+        poller = AdaptivePoller(timeout=timeout)
+        quiet = getattr(self.app.pargs, 'json', False)
+        previous = {}
+        transitions = []
+
+        with tqdm(total=0, unit='stage', desc='Executing', file=sys.stderr, disable=None, leave=False) as pbar:
+            while True:
+                states = execution_states(execution)
+                changed = {part: state for part, state in states.items() if previous.get(part) != state}
+                for part, state in changed.items():
+                    transition = {'time': datetime.now().isoformat(timespec='seconds'), 'part': part,
+                                  'from': previous.get(part), 'to': state}
+                    transitions.append(transition)
+                    if not quiet:
+                        tqdm.write(f"{transition['time']}  {part:<40} {transition['from'] or '-'} -> {state}",
+                                   file=sys.stdout)
+                previous = states
+
+                stages = [state for part, state in states.items() if part.startswith('stage ')]
+                pbar.total = len(stages)
+                pbar.n = sum(1 for state in stages if state == 'COMPLETED')
+                pbar.set_postfix(state=execution.get('state'), status=execution.get('status'), refresh=False)
+                pbar.refresh()
+
+                outcome = execution_outcome(execution)
+                if outcome:
+                    break
+
+                if not poller.wait(changed=bool(changed)):
+                    self.app.log.debug(f"[pipeline-execute-watch] Timed out waiting for execution {execution['id']}")
+                    outcome = 'timeout'
+                    break
+
+                try:
+                    response = list_execute_pipeline(url, args["api_key"])
+                except APIException:
+                    self.app.render("ERROR in connecting to Environment!\n")
+                    self.app.exit_code = EXIT_CODES['failed']
+                    return 'failed', transitions
+
+                if not response.ok:
+                    self.handle_response_failure(response)
+                    self.app.exit_code = EXIT_CODES['failed']
+                    return 'failed', transitions
+                execution = response.json()
+
+        self.app.exit_code = EXIT_CODES[outcome]
+        if not quiet:
+            if outcome == 'timeout':
+                self.app.render(f"Timed out after {timeout:g}s, execution {execution['id']} is still "
+                                f"{execution.get('state')}\n")
+            else:
+                self.app.render(f"Execution {execution['id']} {outcome}: state {execution.get('state')}, "
+                                f"status {execution.get('status')}\n")
+        return outcome, transitions
+
     @ex(
         help='Execute pipeline',
         arguments=[
@@ -97,7 +188,7 @@ class Execution(Controller):
               'action': 'store',
               'dest': 'pipeline_id',
               'default': None}),
-        ]
+        ] + WAIT_ARGUMENTS
     )
     def start(self):
         args = self.fetch_args()
@@ -123,6 +214,9 @@ class Execution(Controller):
         self.app.render(f"Pipeline execution started! Details: \n")
         self.app.render(data, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
 
+        if self.app.pargs.wait:
+            self._watch(args, response.json())
+
     @ex(
         help='Stop a Pipeline Execution',
         arguments=[
@@ -324,3 +418,44 @@ class Execution(Controller):
 
         self.app.render(f"Listing Executions for the Pipeline! Details: \n")
         self.app.render(render_data, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
+
+    @ex(
+        help='Watch a Pipeline Execution until it finishes',
+        arguments=[
+            (['-p', '--pipeline-id'],
+             {'help': 'Pipeline ID',
+              'action': 'store',
+              'dest': 'pipeline_id',
+              'default': None}),
+            (['-e', '--execution-id'],
+             {'help': 'Execution ID',
+              'action': 'store',
+              'dest': 'execution_id',
+              'default': None}),
+            (['-j', '--json'],
+             {'help': 'Render the outcome and state changes in JSON format when the execution finishes',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ] + WAIT_ARGUMENTS[1:]
+    )
+    def watch(self):
+        args = self.fetch_args()
+
+        url = get_pipeline_execute_url(args["environment"], args["enterprise_id"], args["pipeline_id"],
+                                       args["execution_id"])
+        try:
+            response = list_execute_pipeline(url, args["api_key"])
+        except APIException:
+            self.app.render("ERROR in connecting to Environment!\n")
+            self.app.exit_code = EXIT_CODES['failed']
+            return
+
+        if not response.ok:
+            self.handle_response_failure(response)
+            self.app.exit_code = EXIT_CODES['failed']
+            return
+
+        outcome, transitions = self._watch(args, response.json())
+        if self.app.pargs.json:
+            self.app.render({'execution_id': args["execution_id"], 'outcome': outcome, 'transitions': transitions},
+                            format=OutputFormat.JSON.value)
@@ -2,12 +2,21 @@ from enum import Enum
 
 from cement import Controller, ex
 from clint.textui import prompt
+from esperclient.rest import ApiException
 
 from esper.controllers.enums import OutputFormat
+from esper.controllers.pipeline.operation import ActionEnums
+from esper.ext.api_client import APIClient
+from esper.ext.bulk import run_concurrently
 from esper.ext.db_wrapper import DBWrapper
+from esper.ext.http_cache import cache
 from esper.ext.pipeline_api import get_pipeline_url, create_pipeline, edit_pipeline, list_pipelines, fetch_pipelines, \
-    APIException, render_single_dict, delete_api
-from esper.ext.utils import validate_creds_exists
+    APIException, render_single_dict, delete_api, get_stage_url, get_operation_url, get_group_command_url, \
+    create_stage, edit_stage, create_operation, edit_operation, list_stages
+from esper.ext.pipeline_spec import PHASES, SpecError, diff_pipeline, load_spec, spec_groups
+from esper.ext.utils import validate_creds_exists, parse_error_message
+
+PIPELINE_PAGE_SIZE = 100
 
 
 class TriggerEventType(Enum):
@@ -341,3 +350,222 @@ class Pipeline(Controller):
             return
 
         self.app.render(f"Removed Pipeline Successfully! \n")
+
+    def _checked(self, response) -> dict:
+        """JSON body of a successful response; raises APIException with the server's message otherwise"""
+        if response.ok:
+            return response.json() if response.content else {}
+
+        try:
+            body = response.json()
+            message = body.get('message') or body.get('errors') or body
+        except ValueError:
+            message = response.reason
+        raise APIException(f"{response.status_code}: {message}")
+
+    def _find_pipeline(self, environment, enterprise_id, api_key, pipeline_id, name):
+        """Current pipeline by id, or by name when no id is given; None if there is no such pipeline"""
+        if pipeline_id:
+            return self._checked(fetch_pipelines(get_pipeline_url(environment, enterprise_id, pipeline_id), api_key))
+
+        url = get_pipeline_url(environment, enterprise_id)
+        matches = []
+        offset = 0
+        while True:
+            page = self._checked(list_pipelines(url, api_key, {'limit': PIPELINE_PAGE_SIZE, 'offset': offset}))
+            matches.extend(pipeline for pipeline in page.get('results') or [] if pipeline.get('name') == name)
+            offset += PIPELINE_PAGE_SIZE
+            if not page.get('next') or offset >= (page.get('count') or 0):
+                break
+
+        if len(matches) > 1:
+            raise SpecError(f"{len(matches)} pipelines are named {name!r}, choose one with --pipeline-id")
+        return matches[0] if matches else None
+
+    def _load_operations(self, environment, enterprise_id, api_key, pipeline):
+        """Fetch the operations of stages that were listed without them"""
+        stages = [stage for stage in pipeline.get('stages') or [] if 'operations' not in stage]
+
+        def fetch(stage):
+            url = get_operation_url(environment, enterprise_id, pipeline['id'], stage['id'])
+            return self._checked(list_stages(url, api_key)).get('results') or []
+
+        for stage, operations, error in run_concurrently(fetch, stages):
+            if error is not None:
+                raise error
+            stage['operations'] = operations
+
+    def _group_urls(self, db, environment, enterprise_id, names):
+        group_client = APIClient(db.get_configure()).get_group_api_client()
+
+        def find(name):
+            response = group_client.get_all_groups(enterprise_id, name=name)
+            matches = [group for group in response.results if group.name == name]
+            if not matches:
+                raise SpecError(f"No such group: {name}")
+            return get_group_command_url(environment, enterprise_id, matches[0].id)
+
+        urls = {}
+        for name, url, error in run_concurrently(find, names):
+            if error is not None:
+                raise error
+            urls[name] = url
+        return urls
+
+    def _apply_change(self, change, environment, enterprise_id, api_key, ids):
+        """Send one change; `ids` holds the pipeline id and the stage ids by name, and learns created ones"""
+        data = change.data
+        pipeline_id = ids.get('pipeline')
+
+        if change.kind == 'pipeline':
+            url = get_pipeline_url(environment, enterprise_id, change.id)
+            if change.action == 'create':
+                created = self._checked(create_pipeline(url, api_key, data['name'], data.get('description'),
+                                                        data.get('trigger')))
+                ids['pipeline'] = created['id']
+                return created['id']
+            self._checked(edit_pipeline(url, api_key, data.get('name'), data.get('description'), data.get('trigger')))
+            return change.id
+
+        if change.kind == 'stage':
+            url = get_stage_url(environment, enterprise_id, pipeline_id, change.id)
+            if change.action == 'create':
+                created = self._checked(create_stage(url, api_key, data['name'], data['ordering'],
+                                                     data.get('description')))
+                ids['stages'][change.name] = created['id']
+                return created['id']
+            if change.action == 'update':
+                self._checked(edit_stage(url, api_key, None, data.get('ordering'), data.get('description')))
+            else:
+                self._checked(delete_api(url, api_key))
+            return change.id
+
+        stage_id = ids['stages'].get(change.stage)
+        if not stage_id:
+            raise APIException(f"Stage {change.stage!r} was not created")
+        url = get_operation_url(environment, enterprise_id, pipeline_id, stage_id, change.id)
+        if change.action == 'create':
+            created = self._checked(create_operation(url, api_key, data['name'], data['action'],
+                                                     data.get('description'), data.get('group_url')))
+            return created['id']
+        if change.action == 'update':
+            self._checked(edit_operation(url, api_key, None, data.get('action'), data.get('description'),
+                                         data.get('group_url')))
+        else:
+            self._checked(delete_api(url, api_key))
+        return change.id
+
+    @ex(
+        help='Create or update a pipeline, its stages and operations from a YAML file',
+        arguments=[
+            (['-f', '--file'],
+             {'help': 'Pipeline YAML file, - for stdin',
+              'action': 'store',
+              'dest': 'file',
+              'required': True}),
+            (['-p', '--pipeline-id'],
+             {'help': 'Pipeline ID, by default the pipeline is found by its name',
+              'action': 'store',
+              'dest': 'pipeline_id',
+              'default': None}),
+            (['--dry-run'],
+             {'help': 'Show the changes without making them',
+              'action': 'store_true',
+              'dest': 'dry_run'}),
+            (['-j', '--json'],
+             {'help': 'Render result in JSON format',
+              'action': 'store_true',
+              'dest': 'json'}),
+        ]
+    )
+    def apply(self):
+        validate_creds_exists(self.app)
+        db = DBWrapper(self.app.creds)
+        environment = db.get_configure().get("environment")
+        api_key = db.get_configure().get("api_key")
+        enterprise_id = db.get_enterprise_id()
+
+        # The diff is planned against the live pipeline, never against cached responses
+        refresh, cache.refresh = cache.refresh, True
+        try:
+            spec = load_spec(self.app.pargs.file, [action.name for action in ActionEnums])
+            current = self._find_pipeline(environment, enterprise_id, api_key, self.app.pargs.pipeline_id,
+                                          spec['name'])
+            if current:
+                self._load_operations(environment, enterprise_id, api_key, current)
+            group_urls = self._group_urls(db, environment, enterprise_id, spec_groups(spec))
+        except (OSError, SpecError) as e:
+            self.app.log.error(f"[pipeline-apply] Invalid pipeline spec: {e}")
+            self.app.render(f"ERROR: {e}\n")
+            self.app.exit_code = 1
+            return
+        except ApiException as e:
+            self.app.log.error(f"[pipeline-apply] Failed to resolve groups: {e}")
+            self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
+            self.app.exit_code = 1
+            return
+        except APIException as e:
+            self.app.log.error(f"[pipeline-apply] Failed to fetch the pipeline: {e}")
+            self.app.render(f"ERROR: {e}\n")
+            self.app.exit_code = 1
+            return
+        finally:
+            cache.refresh = refresh
+
+        changes = diff_pipeline(spec, current, group_urls)
+        ids = {
+            'pipeline': current['id'] if current else None,
+            'stages': {stage['name']: stage['id'] for stage in (current or {}).get('stages') or []}
+        }
+
+        results = {}
+        if not self.app.pargs.dry_run:
+            for phase in range(PHASES):
+                batch = [change for change in changes if change.phase == phase]
+                if phase > 0 and not ids['pipeline']:
+                    results.update({change: (None, 'Pipeline was not created') for change in batch})
+                    continue
+
+                applied = run_concurrently(
+                    lambda change: self._apply_change(change, environment, enterprise_id, api_key, ids), batch)
+                for change, object_id, error in applied:
+                    if error is not None:
+                        self.app.log.error(f"[pipeline-apply] Failed to {change.action} {change.kind} "
+                                           f"{change.name!r}: {error}")
+                        results[change] = (None, str(error))
+                    else:
+                        results[change] = (object_id, None)
+
+        # Stages moving through a parking ordering show up once, with their final ordering, unless parking failed
+        shown = [change for change in changes
+                 if not (change.kind == 'stage' and change.phase == 1 and change.action == 'update')
+                 or results.get(change, (None, None))[1]]
+        rows = []
+        for change in shown:
+            object_id, error = results.get(change, (change.id, None))
+            rows.append({
+                'action': change.action,
+                'kind': change.kind,
+                'stage': change.stage,
+                'name': change.name,
+                'id': object_id,
+                'result': 'planned' if self.app.pargs.dry_run else ('failed' if error else 'ok'),
+                'error': error
+            })
+
+        failed = [change for change, (_, error) in results.items() if error]
+        if failed:
+            self.app.exit_code = 1
+
+        if self.app.pargs.json:
+            self.app.render({'pipeline_id': ids['pipeline'], 'changes': rows}, format=OutputFormat.JSON.value)
+            return
+
+        if not changes:
+            self.app.render(f"Pipeline {spec['name']!r} is up to date.\n")
+            return
+
+        self.app.render(f"{'Planned' if self.app.pargs.dry_run else 'Applied'} {len(shown)} changes to pipeline "
+                        f"{ids['pipeline'] or spec['name']}, {len(failed)} failed\n")
+        renderable = [{key.upper(): value for key, value in row.items()} for row in rows]
+        self.app.render(renderable, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain")
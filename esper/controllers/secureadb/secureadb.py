@@ -1,6 +1,8 @@
 import signal
 import socket
 import ssl
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from cement import Controller, ex, CaughtSignal
 
@@ -8,9 +10,12 @@ from esper.controllers.enums import OutputFormat
 from esper.ext.api_client import APIClient
 from esper.ext.certs import cleanup_certs, create_self_signed_cert, save_device_certificate
 from esper.ext.db_wrapper import DBWrapper
-from esper.ext.relay import Relay
+from esper.ext.device_search import find_device
+from esper.ext.relay import ReconnectingRelay, Relay
+from esper.ext.relay_metrics import StatsReporter
 from esper.ext.remoteadb_api import initiate_remoteadb_connection, fetch_device_certificate, fetch_relay_endpoint, \
     RemoteADBError
+from esper.ext.timings import PhaseTimer
 from esper.ext.utils import validate_creds_exists
 
 
@@ -46,13 +51,11 @@ class SecureADB(Controller):
         device_client = APIClient(db.get_configure()).get_device_api_client()
         enterprise_id = db.get_enterprise_id()
 
-        kwargs = {'name': device_name}
-
-        search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-        if not search_response.results or len(search_response.results) == 0:
+        device = find_device(self.app, device_client, enterprise_id, device_name)
+        if not device:
             raise SecureADBWorkflowError(f'Device does not exist with name {device_name}')
 
-        return search_response.results[0].id
+        return device.id
 
     def setup_ssl_connection(self,
                              host: str,
@@ -73,12 +76,20 @@ class SecureADB(Controller):
         :return: A Secure TCP Socket, wrapped in SSL Context
         """
 
+        sock = self._connect_relay(host, port)
+        return self._wrap_ssl(sock, client_cert=client_cert, client_key=client_key, device_cert=device_cert)
+
+    def _connect_relay(self, host: str, port: int) -> socket.socket:
+        """TCP connection to the TCP relay, to be wrapped in SSL once the device certificate is known"""
         self.app.log.debug("[remoteadb-connect] Starting SSL Connection setup")
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.connect((host, port))
 
         self.app.log.debug(f"[remoteadb-connect] Connected to TCP endpoint")
+        return sock
 
+    def _wrap_ssl(self, sock: socket.socket, client_cert: str, client_key: str, device_cert: str) -> ssl.SSLSocket:
+        """Mutual TLS handshake on a connected socket, see setup_ssl_connection"""
         self.app.log.debug("[remoteadb-connect] Setting up SSL context")
         context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
         context.verify_mode = ssl.CERT_REQUIRED
@@ -99,13 +110,113 @@ class SecureADB(Controller):
 
         return secure_sock
 
+    def _create_certs(self, phases: PhaseTimer) -> None:
+        with phases.phase('certificates'):
+            # Remove older certs
+            cleanup_certs(self.app)
+
+            # Create new certs
+            create_self_signed_cert(local_cert=self.app.local_cert,
+                                    local_key=self.app.local_key)
+
+    def _negotiate_session(self, enterprise_id: str, device_id: str, phases: PhaseTimer = None) -> ssl.SSLSocket:
+        """
+        Start a Remote ADB session with the device, and connect to its TCP relay with the current certificates.
+        The device certificate is polled for while the relay endpoint is polled for and connected to; only the TLS
+        handshake needs both.
+
+        :param enterprise_id: Enterprise ID
+        :param device_id: Device ID
+        :param phases: Records the duration of each step
+        :return: A Secure TCP Socket connected to the TCP relay
+        """
+        phases = phases or PhaseTimer()
+        config = DBWrapper(self.app.creds).get_configure()
+        session = {'environment': config.get("environment"), 'enterprise_id': enterprise_id, 'device_id': device_id,
+                   'api_key': config.get("api_key"), 'log': self.app.log}
+
+        # Call SCAPI for establish remote adb connection with device
+        with phases.phase('session'):
+            remoteadb_id = initiate_remoteadb_connection(client_cert_path=self.app.local_cert, **session)
+
+        def device_certificate():
+            with phases.phase('device certificate'):
+                return fetch_device_certificate(remoteadb_id=remoteadb_id, **session)
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='remoteadb-connect')
+        sock = None
+        try:
+            # Poll and fetch the Device's Certificate String, in the background
+            device_cert = executor.submit(device_certificate)
+
+            # Poll and fetch the TCP relay's endpoint, and connect to it
+            with phases.phase('relay endpoint'):
+                relay_ip, relay_port = fetch_relay_endpoint(remoteadb_id=remoteadb_id, **session)
+            with phases.phase('relay connect'):
+                sock = self._connect_relay(relay_ip, relay_port)
+
+            # Save Device certificate to disk
+            save_device_certificate(self.app.device_cert, device_cert.result())
+
+            # Setup an SSL connection to TCP relay
+            with phases.phase('tls handshake'):
+                secure_sock = self._wrap_ssl(sock,
+                                             client_cert=self.app.local_cert,
+                                             client_key=self.app.local_key,
+                                             device_cert=self.app.device_cert)
+        except BaseException:
+            if sock:
+                sock.close()
+            raise
+        finally:
+            executor.shutdown(wait=False)
+
+        for name, (_, duration) in phases.phases.items():
+            self.app.log.debug(f"[remoteadb-connect] {name}: {duration:.3f}s")
+
+        return secure_sock
+
     @ex(help='Setup and connect securely via Remote ADB to device',
         arguments=[
             (['-d', '--device'],
              {'help': "Device name",
               'action': 'store',
               'dest': 'device_name',
-              'default': None})
+              'default': None}),
+            (['--latency-mode'],
+             {'help': "Tune the tunnel for interactive use (adb shell): small packets are sent immediately. "
+                      "push/pull still work, with the default mode tuned for their throughput.",
+              'action': 'store_true',
+              'dest': 'latency_mode',
+              'default': False}),
+            (['--stats'],
+             {'help': "Show live throughput, queued data and stalls of each direction on stderr",
+              'action': 'store_true',
+              'dest': 'stats',
+              'default': False}),
+            (['--stats-interval'],
+             {'help': "Seconds between stats updates",
+              'action': 'store',
+              'dest': 'stats_interval',
+              'type': float,
+              'default': 1.0}),
+            (['--stats-port'],
+             {'help': "Serve stats on http://127.0.0.1:<port>/ (JSON) and /metrics (Prometheus), 0 for any port",
+              'action': 'store',
+              'dest': 'stats_port',
+              'type': int,
+              'default': None}),
+            (['--stats-file'],
+             {'help': "Keep the stats in this Prometheus textfile",
+              'action': 'store',
+              'dest': 'stats_file',
+              'default': None}),
+            (['--reconnect'],
+             {'help': "Keep the local endpoint when the connection to the device drops, and reconnect in the "
+                      "background, so that ADB clients can reconnect to the same port",
+              'action': 'store_true',
+              'dest': 'reconnect',
+              'default': False})
         ])
     def connect(self):
         """Setup and connect securely via Remote ADB to device"""
@@ -114,65 +225,49 @@ class SecureADB(Controller):
         db = DBWrapper(self.app.creds)
 
         enterprise_id = db.get_enterprise_id()
+        phases = PhaseTimer()
 
-        # Remove older certs
-        cleanup_certs(self.app)
-
-        # Create new certs
-        create_self_signed_cert(local_cert=self.app.local_cert,
-                                local_key=self.app.local_key)
+        # Generating the RSA key takes a while; the device lookup does not need it
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='remoteadb-connect')
+        certs = executor.submit(self._create_certs, phases)
+        executor.shutdown(wait=False)
 
         try:
             # Get device
             device_id = None
-            if self.app.pargs.device_name:
-                device_id = self._fetch_device_by_name(self.app.pargs.device_name)
-                self.app.log.debug(f"Device Name: {self.app.pargs.device_name}. Device ID: {device_id}")
+            with phases.phase('device lookup'):
+                if self.app.pargs.device_name:
+                    device_id = self._fetch_device_by_name(self.app.pargs.device_name)
+                    self.app.log.debug(f"Device Name: {self.app.pargs.device_name}. Device ID: {device_id}")
 
-            elif db.get_device():
-                device_id = db.get_device().get('id')
+                elif db.get_device():
+                    device_id = db.get_device().get('id')
 
-            else:
+            if not device_id:
                 self.app.log.error("[remoteadb-connect] Device not specified!")
                 return
 
-            self.app.render("\nInitiating Remote ADB Session. This may take a few seconds...\n")
+            certs.result()
 
-            # Call SCAPI for establish remote adb connection with device
-            remoteadb_id = initiate_remoteadb_connection(environment=db.get_configure().get("environment"),
-                                                         enterprise_id=enterprise_id,
-                                                         device_id=device_id,
-                                                         api_key=db.get_configure().get("api_key"),
-                                                         client_cert_path=self.app.local_cert,
-                                                         log=self.app.log)
-
-            # Poll and fetch the TCP relay's endpoint
-            relay_ip, relay_port = fetch_relay_endpoint(environment=db.get_configure().get("environment"),
-                                                        enterprise_id=enterprise_id,
-                                                        device_id=device_id,
-                                                        remoteadb_id=remoteadb_id,
-                                                        api_key=db.get_configure().get("api_key"),
-                                                        log=self.app.log)
-
-            # Poll and fetch the Device's Certificate String
-            device_cert = fetch_device_certificate(environment=db.get_configure().get("environment"),
-                                                   enterprise_id=enterprise_id,
-                                                   device_id=device_id,
-                                                   remoteadb_id=remoteadb_id,
-                                                   api_key=db.get_configure().get("api_key"),
-                                                   log=self.app.log)
+            self.app.render("\nInitiating Remote ADB Session. This may take a few seconds...\n")
 
-            # Save Device certificate to disk
-            save_device_certificate(self.app.device_cert, device_cert)
+            secure_sock = self._negotiate_session(enterprise_id, device_id, phases)
 
-            # Setup an SSL connection to TCP relay
-            secure_sock = self.setup_ssl_connection(host=relay_ip,
-                                                    port=relay_port,
-                                                    client_cert=self.app.local_cert,
-                                                    client_key=self.app.local_key,
-                                                    device_cert=self.app.device_cert)
+            self.app.log.debug(f"[remoteadb-connect] Connected in {phases.total:.3f}s")
+            if getattr(self.app.pargs, 'timings', False):
+                sys.stderr.write(f"\nConnection setup ({phases.total:.1f}s):\n")
+                self.app.render(phases.summary(), format=OutputFormat.TABULATED.value, headers="keys",
+                                tablefmt="plain", out=sys.stderr)
+                sys.stderr.write("\n")
 
-            relay = Relay(relay_conn=secure_sock, relay_addr=secure_sock.getsockname(), log=self.app.log)
+            mode = 'latency' if self.app.pargs.latency_mode else 'bulk'
+            if self.app.pargs.reconnect:
+                # Later sessions reuse the device ID and the client certificate
+                relay = ReconnectingRelay(negotiate=lambda: self._negotiate_session(enterprise_id, device_id),
+                                          relay_conn=secure_sock, log=self.app.log, mode=mode)
+            else:
+                relay = Relay(relay_conn=secure_sock, relay_addr=secure_sock.getsockname(), log=self.app.log,
+                              mode=mode)
 
             listener_ip, listener_port = relay.get_listener_address()
 
@@ -188,8 +283,19 @@ class SecureADB(Controller):
 
             self.app.log.debug("[remoteadb-connect] Starting Client Mediator")
 
-            relay.accept_connection()
-            relay.start_relay()
+            pargs = self.app.pargs
+            if pargs.stats or pargs.stats_file or pargs.stats_port is not None:
+                reporter = StatsReporter(relay, interval=pargs.stats_interval, status=pargs.stats,
+                                         textfile=pargs.stats_file, port=pargs.stats_port)
+                if reporter.address:
+                    self.app.render(f"Relay stats: http://{reporter.address[0]}:{reporter.address[1]}/metrics\n")
+                reporter.start()
+
+            if pargs.reconnect:
+                relay.serve_forever()
+            else:
+                relay.accept_connection()
+                relay.start_relay()
 
         except (SecureADBWorkflowError, RemoteADBError) as timeout_exc:
             self.app.log.error(f"[remoteadb-connect] {str(timeout_exc)}")
@@ -205,6 +311,9 @@ class SecureADB(Controller):
             self.app.log.debug(f"Exception Encountered -> {exc}")
 
         finally:
+            if "reporter" in locals():
+                locals().get("reporter").stop()
+
             if "relay" in locals():
                 relay = locals().get("relay")
                 relay.stop_relay()
@@ -214,5 +323,8 @@ class SecureADB(Controller):
                 if metrics.get('started') and metrics.get('stopped'):
                     self.app.render(f"\nSession Duration: {metrics.get('stopped') - metrics.get('started')}\n")
 
+                if getattr(relay, 'sessions', 0) > 1:
+                    self.app.render(f"\nSessions: {relay.sessions}\n")
+
                 if metrics.get('bytes'):
                     self.app.render(f"\nTotal Data streamed: {metrics.get('bytes')/1024.0} KB\n")
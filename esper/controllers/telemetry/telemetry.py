@@ -2,13 +2,13 @@ from cement import Controller, ex
 from esperclient.rest import ApiException
 
 from esper.controllers.enums import OutputFormat
-from esper.ext.api_client import APIClient
+from esper.ext.api_client import APIClient, get_session
 from esper.ext.db_wrapper import DBWrapper
+from esper.ext.device_search import find_device
 from esper.ext.telemetry_api import get_telemetry_url
 from esper.ext.utils import validate_creds_exists, parse_error_message
 
 from datetime import datetime, timedelta
-import requests
 
 
 class Telemetry(Controller):
@@ -74,16 +74,15 @@ class Telemetry(Controller):
         if not device_name:
             self.app.render(f'No device specified. Use the -d, --device option to specify a device\n')
             return
-        kwargs = {'name': device_name}
 
         # Fetch device id from device name supplied as parameter
         try:
-            response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, **kwargs)
-            if not response.results or len(response.results) == 0:
+            device = find_device(self.app, device_client, enterprise_id, device_name)
+            if not device:
                 self.app.log.debug(f'[device-show] Device does not exist with name {device_name}')
                 self.app.render(f'Device does not exist with name {device_name}\n')
                 return
-            device_id = response.results[0].id
+            device_id = device.id
         except ApiException as e:
             self.app.log.error(f"[device-show] Failed to fetch telemetry info for device {device_name}: {e}")
             self.app.render(f"ERROR: {parse_error_message(self.app, e)}\n")
@@ -126,7 +125,7 @@ class Telemetry(Controller):
                                 statistic)
 
         api_key = db.get_configure().get("api_key")
-        response = requests.get(
+        response = get_session().get(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
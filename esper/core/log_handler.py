@@ -0,0 +1,85 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from cement.ext.ext_colorlog import ColorLogHandler
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues records as they are, so that their messages are formatted on the writer thread instead of the logging
+    one. Arguments of a record must not be changed after it is logged.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_queue_logging(logger: logging.Logger, handler: logging.Handler) -> QueueListener:
+    """
+    Move a handler of a logger to a background writer thread. The logger gets a queue handler with the same level in
+    its place.
+    :return: The listener, stop it to write out what is queued
+    """
+    records = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(records)
+    queue_handler.setLevel(handler.level)
+
+    logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def is_debug_enabled(log) -> bool:
+    """Whether debug records of a logger (or Cement log handler) go anywhere, to skip building per-packet messages"""
+    backend = getattr(log, 'backend', log)
+    return isinstance(backend, logging.Logger) and backend.isEnabledFor(logging.DEBUG)
+
+
+class EsperLogHandler(ColorLogHandler):
+    """
+    Color log handler that writes the log file on a background thread, and may log to the file at a level of its own
+    (`file_level`, by default the same as `level`). Takes the place of the `colorlog` extension's handler, with the
+    same `log.colorlog` configuration section.
+    """
+
+    class Meta:
+        label = 'colorlog'
+        config_defaults = dict(ColorLogHandler.Meta.config_defaults, file_level=None)
+
+    _listener = None
+
+    def _file_level(self) -> int:
+        level = self.app.config.get(self._meta.config_section, 'file_level')
+        if not level or level.upper() not in self.levels:
+            return self.backend.level
+        return getattr(logging, level.upper())
+
+    def set_level(self, level):
+        super(EsperLogHandler, self).set_level(level)
+
+        # The logger lets through what either the console or the file wants, its handlers filter
+        self.backend.setLevel(min(self.backend.level, self._file_level()))
+
+    def _setup_file_log(self):
+        self.stop()
+        super(EsperLogHandler, self)._setup_file_log()
+
+        file_handler = self.backend.handlers[-1]
+        if isinstance(file_handler, logging.NullHandler):
+            return
+
+        file_handler.setLevel(self._file_level())
+        self._listener = start_queue_logging(self.backend, file_handler)
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out the queued records and stop the writer thread"""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
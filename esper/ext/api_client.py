@@ -1,6 +1,305 @@
+import os
+import threading
+from typing import Optional
+from urllib.parse import urlparse, urlencode
+
 import esperclient as client
 from esperclient.configuration import Configuration
+from esperclient.rest import ApiException
 import requests
+from requests.structures import CaseInsensitiveDict
+
+from esper.ext.http_cache import cache
+from esper.ext.throttle import RETRYABLE_STATUSES, TRANSPORT_ERRORS, get_throttle, settings
+from esper.ext.timings import recorder, instrument_pool_manager, url_template
+
+
+def get_api_host(environment: str) -> str:
+    """
+    Base URL of the Esper API for an environment. `ESPER_API_HOST` overrides it, which is how the
+    CLI is pointed at a local stand-in server for benchmarks.
+    :param environment: The client/tenant's environment
+    :return: Scheme and host, without a trailing slash
+    """
+    return os.environ.get('ESPER_API_HOST', f'https://{environment}-api.esper.cloud').rstrip('/')
+
+
+class CachedResponse(object):
+    """Stands in for esperclient's RESTResponse when a GET is answered from the response cache"""
+
+    def __init__(self, entry):
+        self.status = 200
+        self.reason = 'OK'
+        self.data = entry.body.decode('utf-8')
+        self._headers = CaseInsensitiveDict(entry.headers)
+
+    def getheaders(self):
+        return self._headers
+
+    def getheader(self, name, default=None):
+        return self._headers.get(name, default)
+
+
+def cached_requests_response(entry) -> requests.Response:
+    """Build a `requests` Response for a GET answered from the response cache"""
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = entry.url
+    response.headers = CaseInsensitiveDict(entry.headers)
+    response.encoding = 'utf-8'
+    response._content = entry.body
+    return response
+
+
+def _cacheable_headers(headers) -> dict:
+    return {name: headers[name] for name in ('Content-Type', 'ETag') if headers.get(name)}
+
+
+class OfflineError(ApiException):
+    """Raised instead of making a request in offline mode, when the request cannot be answered from the cache"""
+
+    def __init__(self, method: str, url: str):
+        if method != 'GET':
+            reason = f"Offline mode, {method} {url_template(url)} needs the API"
+        else:
+            reason = f"Offline mode, there is no cached response for {url}"
+        super(OfflineError, self).__init__(status=0, reason=reason)
+
+
+def _unavailable(status: Optional[int]) -> bool:
+    """Whether a response status means the API could not answer, rather than that it refused the request"""
+    return not status or status in RETRYABLE_STATUSES or status >= 500
+
+
+def _stale_entry(key: str, entry):
+    """With `--stale-ok`, the cached response to serve in place of a request the API did not answer"""
+    if not cache.stale_ok:
+        return None
+    # With `--refresh` the entry was not read before the request
+    entry = entry or cache.get(key)
+    return cache.serve_stale(entry) if entry else None
+
+
+class EsperApiClient(client.ApiClient):
+    """
+    esperclient's ApiClient with per-request instrumentation, rate limiting, retries and response
+    caching. The URL template is taken from the swagger resource path, so it never contains concrete ids.
+    """
+
+    def __init__(self, configuration=None, *args, **kwargs):
+        super(EsperApiClient, self).__init__(configuration, *args, **kwargs)
+        instrument_pool_manager(self.rest_client.pool_manager)
+
+        self._base_path = urlparse(self.configuration.host).path.rstrip('/')
+        self._netloc = urlparse(self.configuration.host).netloc
+        self._local = threading.local()
+
+    def call_api(self, resource_path, method, *args, **kwargs):
+        self._local.template = f"{self._base_path}{resource_path}"
+        return super(EsperApiClient, self).call_api(resource_path, method, *args, **kwargs)
+
+    def request(self, method, url, query_params=None, headers=None, *args, **kwargs):
+        template = getattr(self._local, 'template', None) or url_template(url)
+
+        def send(request_headers):
+            return get_throttle(self._netloc).call(
+                method, lambda: self._timed_request(template, method, url, query_params, request_headers, *args,
+                                                    **kwargs))
+
+        if method != 'GET':
+            if cache.offline:
+                raise OfflineError(method, url)
+            try:
+                return send(headers)
+            finally:
+                cache.invalidate(url)
+
+        full_url = f"{url}?{urlencode(query_params)}" if query_params else url
+        if not cache.stores(url):
+            if cache.offline:
+                raise OfflineError(method, full_url)
+            return send(headers)
+
+        ttl = cache.ttl_for(url)
+        key = cache.key(full_url, (headers or {}).get('Authorization'))
+
+        if cache.offline:
+            entry = cache.get(key)
+            if entry is None:
+                raise OfflineError(method, full_url)
+            return CachedResponse(cache.serve_stale(entry))
+
+        entry = None if cache.refresh else cache.get(key)
+
+        if entry and entry.fresh:
+            cache.touch(entry)
+            return CachedResponse(entry)
+
+        if entry and entry.etag:
+            headers = dict(headers or {}, **{'If-None-Match': entry.etag})
+
+        try:
+            response = send(headers)
+        except ApiException as e:
+            if e.status == 304 and entry:
+                cache.revalidated(entry)
+                return CachedResponse(entry)
+            entry = _stale_entry(key, entry) if _unavailable(e.status) else None
+            if entry:
+                return CachedResponse(entry)
+            raise
+        except TRANSPORT_ERRORS:
+            entry = _stale_entry(key, entry)
+            if entry:
+                return CachedResponse(entry)
+            raise
+
+        # Raw responses (`_preload_content=False`) hold bytes, deserialized ones text
+        body = response.data if isinstance(response.data, bytes) else response.data.encode('utf-8')
+        cache.put(key, full_url, body, ttl, response.getheader('ETag'), _cacheable_headers(response.getheaders()))
+        return response
+
+    def _timed_request(self, template, method, url, *args, **kwargs):
+        started = recorder.start()
+        try:
+            response = super(EsperApiClient, self).request(method, url, *args, **kwargs)
+        except ApiException as exc:
+            recorder.record(method, template, exc.status, started, len(exc.body or ''))
+            raise
+        except Exception:
+            recorder.record(method, template, None, started, 0)
+            raise
+
+        recorder.record(method, template, response.status, started, len(response.data or b''))
+        return response
+
+
+class EsperSession(requests.Session):
+    """A `requests` Session whose calls are instrumented, limited, retried and cached like the esperclient ones"""
+
+    def __init__(self):
+        super(EsperSession, self).__init__()
+        for adapter in self.adapters.values():
+            instrument_pool_manager(adapter.poolmanager)
+
+    def request(self, method, url, *args, retries=None, **kwargs):
+        """`retries` overrides the configured retries of this request, see `Throttle.call`"""
+        template = url_template(url)
+        throttle = get_throttle(urlparse(url).netloc)
+
+        def send():
+            return throttle.call(method, lambda: self._timed_request(template, method, url, *args, **kwargs),
+                                 retries)
+
+        if method.upper() != 'GET':
+            if cache.offline:
+                raise OfflineError(method.upper(), url)
+            try:
+                return send()
+            finally:
+                cache.invalidate(url)
+
+        if not cache.stores(url) or kwargs.get('stream') or args:
+            if cache.offline:
+                raise OfflineError('GET', url)
+            return send()
+
+        ttl = cache.ttl_for(url)
+        full_url = requests.Request('GET', url, params=kwargs.get('params')).prepare().url
+        headers = kwargs.get('headers') or {}
+        key = cache.key(full_url, headers.get('Authorization'))
+
+        if cache.offline:
+            entry = cache.get(key)
+            if entry is None:
+                raise OfflineError('GET', full_url)
+            return cached_requests_response(cache.serve_stale(entry))
+
+        entry = None if cache.refresh else cache.get(key)
+
+        if entry and entry.fresh:
+            cache.touch(entry)
+            return cached_requests_response(entry)
+
+        if entry and entry.etag:
+            kwargs['headers'] = dict(headers, **{'If-None-Match': entry.etag})
+
+        try:
+            response = send()
+        except TRANSPORT_ERRORS:
+            entry = _stale_entry(key, entry)
+            if entry:
+                return cached_requests_response(entry)
+            raise
+
+        if response.status_code == 304 and entry:
+            cache.revalidated(entry)
+            return cached_requests_response(entry)
+
+        if _unavailable(response.status_code):
+            stale = _stale_entry(key, entry)
+            if stale:
+                return cached_requests_response(stale)
+
+        if response.status_code == 200:
+            cache.put(key, full_url, response.content, ttl, response.headers.get('ETag'),
+                      _cacheable_headers(response.headers))
+        return response
+
+    def _timed_request(self, template, method, url, *args, **kwargs):
+        started = recorder.start()
+        try:
+            response = super(EsperSession, self).request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            recorder.record(method, template, None, started, 0)
+            raise
+
+        if kwargs.get('stream'):
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            size = len(response.content or b'')
+
+        recorder.record(method, template, response.status_code, started, size)
+        return response
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> EsperSession:
+    """Shared session for the raw REST helpers, so connections are pooled across calls"""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = EsperSession()
+
+        return _session
+
+
+_api_clients = {}
+_api_clients_lock = threading.Lock()
+
+
+def get_api_client(configuration: Configuration) -> EsperApiClient:
+    """
+    Shared esperclient ApiClient per host and API key, so connection pools survive across the
+    commands of a long-running process (batch, daemon)
+    :param configuration: esperclient Configuration with host and credentials set
+    :return: A cached EsperApiClient
+    """
+    key = (configuration.host, configuration.api_key.get('Authorization'))
+
+    with _api_clients_lock:
+        if key not in _api_clients:
+            # Keep a pooled connection for every request the throttle lets through at once
+            configuration.connection_pool_maxsize = max(configuration.connection_pool_maxsize or 0,
+                                                         settings.max_concurrency)
+            _api_clients[key] = EsperApiClient(configuration)
+
+        return _api_clients[key]
 
 
 class APIClient:
@@ -8,28 +307,28 @@ class APIClient:
         self.config = Configuration()
         self.config.api_key['Authorization'] = credential["api_key"]
         self.config.api_key_prefix['Authorization'] = 'Bearer'
-        self.config.host = f"https://{credential['environment']}-api.esper.cloud/api"
+        self.config.host = f"{get_api_host(credential['environment'])}/api"
 
     def get_enterprise_api_client(self):
-        return client.EnterpriseApi(client.ApiClient(self.config))
+        return client.EnterpriseApi(get_api_client(self.config))
 
     def get_device_api_client(self):
-        return client.DeviceApi(client.ApiClient(self.config))
+        return client.DeviceApi(get_api_client(self.config))
 
     def get_application_api_client(self):
-        return client.ApplicationApi(client.ApiClient(self.config))
+        return client.ApplicationApi(get_api_client(self.config))
 
     def get_command_api_client(self):
-        return client.CommandsApi(client.ApiClient(self.config))
+        return client.CommandsApi(get_api_client(self.config))
 
     def get_group_api_client(self):
-        return client.DeviceGroupApi(client.ApiClient(self.config))
+        return client.DeviceGroupApi(get_api_client(self.config))
 
     def get_group_command_api_client(self):
-        return client.GroupCommandsApi(client.ApiClient(self.config))
+        return client.GroupCommandsApi(get_api_client(self.config))
 
     def get_remoteadb_api_client(self):
-        return client.DeviceApi(client.ApiClient(self.config))
+        return client.DeviceApi(get_api_client(self.config))
 
     def get_token_api_client(self):
-        return client.TokenApi(client.ApiClient(self.config))
+        return client.TokenApi(get_api_client(self.config))
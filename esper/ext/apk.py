@@ -0,0 +1,135 @@
+import hashlib
+import mmap
+import struct
+import zipfile
+from typing import Optional
+
+# Files smaller than this are hashed with plain reads, mapping them is not worth the syscalls
+MMAP_THRESHOLD = 1024 * 1024
+READ_CHUNK = 1024 * 1024
+
+# Android binary XML chunk types
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+UTF8_FLAG = 1 << 8
+
+# Typed value kinds of attribute data
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+
+# android:versionCode and android:versionName, as listed in the resource map
+ATTR_VERSION_CODE = 0x0101021b
+ATTR_VERSION_NAME = 0x0101021c
+
+
+def sha256_file(path: str) -> str:
+    """
+    SHA-256 of a file without loading it into memory. Large files are memory mapped and hashed in one
+    call, which lets hashlib release the GIL for the whole file; small ones are read in chunks.
+    :param path: File path
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        f.seek(0)
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+        else:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _read_string(data: bytes, offset: int, utf8: bool) -> str:
+    if utf8:
+        # Character count then byte count, each one or two bytes long
+        offset += 2 if data[offset] & 0x80 else 1
+        length = data[offset]
+        offset += 1
+        if length & 0x80:
+            length = ((length & 0x7f) << 8) | data[offset]
+            offset += 1
+        return data[offset:offset + length].decode('utf-8', errors='replace')
+
+    length = struct.unpack_from('<H', data, offset)[0]
+    offset += 2
+    if length & 0x8000:
+        length = ((length & 0x7fff) << 16) | struct.unpack_from('<H', data, offset)[0]
+        offset += 2
+    return data[offset:offset + length * 2].decode('utf-16-le', errors='replace')
+
+
+def _string_pool(data: bytes, start: int) -> list:
+    header_size, _, count, _, flags, strings_start = struct.unpack_from('<HIIIII', data, start + 2)
+    utf8 = bool(flags & UTF8_FLAG)
+    offsets = struct.unpack_from(f'<{count}I', data, start + header_size)
+    return [_read_string(data, start + strings_start + offset, utf8) for offset in offsets]
+
+
+def parse_manifest(data: bytes) -> Optional[dict]:
+    """
+    Read the package name and version of a compiled (binary XML) AndroidManifest.xml
+    :param data: Manifest contents
+    :return: Dict with package, version_code and version_name, None if there is no manifest element
+    """
+    kind, header_size = struct.unpack_from('<HH', data, 0)
+    if kind != RES_XML_TYPE:
+        raise ValueError('not an Android binary XML file')
+
+    strings = []
+    resource_ids = []
+    offset = header_size
+    while offset + 8 <= len(data):
+        kind, header_size, size = struct.unpack_from('<HHI', data, offset)
+        if size < 8:
+            break
+
+        if kind == RES_STRING_POOL_TYPE:
+            strings = _string_pool(data, offset)
+        elif kind == RES_XML_RESOURCE_MAP_TYPE:
+            resource_ids = list(struct.unpack_from(f'<{(size - header_size) // 4}I', data, offset + header_size))
+        elif kind == RES_XML_START_ELEMENT_TYPE:
+            ext = offset + header_size
+            _, name, attribute_start, attribute_size, attribute_count = struct.unpack_from('<IIHHH', data, ext)
+            if strings[name] == 'manifest':
+                manifest = {'package': None, 'version_code': None, 'version_name': None}
+                for i in range(attribute_count):
+                    attribute = ext + attribute_start + i * attribute_size
+                    _, name, raw, _, _, value_type, value = struct.unpack_from('<IIIHBBI', data, attribute)
+                    resource_id = resource_ids[name] if name < len(resource_ids) else None
+
+                    if value_type == TYPE_STRING:
+                        value = strings[value]
+                    elif value_type not in (TYPE_INT_DEC, TYPE_INT_HEX):
+                        value = strings[raw] if raw != 0xffffffff else None
+
+                    if resource_id == ATTR_VERSION_CODE or strings[name] == 'versionCode':
+                        manifest['version_code'] = str(value)
+                    elif resource_id == ATTR_VERSION_NAME or strings[name] == 'versionName':
+                        manifest['version_name'] = str(value)
+                    elif strings[name] == 'package':
+                        manifest['package'] = value
+                return manifest
+
+        offset += size
+
+    return None
+
+
+def read_manifest(path: str) -> Optional[dict]:
+    """
+    Package name and version of an APK, read from its manifest without unpacking anything else
+    :param path: APK file path or file object
+    :return: Dict with package, version_code and version_name, None if the file is not a readable APK
+    """
+    try:
+        with zipfile.ZipFile(path) as apk:
+            return parse_manifest(apk.read('AndroidManifest.xml'))
+    except (zipfile.BadZipFile, KeyError, ValueError, IndexError, struct.error):
+        return None
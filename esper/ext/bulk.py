@@ -0,0 +1,80 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Tuple
+
+from esper.ext.throttle import settings
+
+
+def get_workers(workers: int = None) -> int:
+    """Worker count for bulk operations, `max_concurrency` from esper.yml unless given"""
+    return max(1, workers or settings.max_concurrency)
+
+
+def run_concurrently(func: Callable[[Any], Any], items: Iterable, workers: int = None) -> List[Tuple[Any, Any, Any]]:
+    """
+    Call `func` for every item on a thread pool. The per-environment throttle still applies to each API call.
+    :param func: Called with one item
+    :param items: Inputs
+    :param workers: Pool size, defaults to `max_concurrency`
+    :return: `(item, result, error)` tuples in input order; exactly one of result/error is set
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    with ThreadPoolExecutor(max_workers=min(get_workers(workers), len(items))) as executor:
+        return list(executor.map(call, items))
+
+
+def fetch_all_pages(fetch: Callable[[int, int], Any], limit: int = 100, workers: int = None) -> list:
+    """
+    Fetch every page of a paginated list endpoint. The first page tells the total `count`, the remaining
+    pages are then requested in parallel.
+    :param fetch: Called with `(limit, offset)`, returns a response with `count` and `results`
+    :param limit: Page size
+    :param workers: Pool size, defaults to `max_concurrency`
+    :return: All results, in order
+    """
+    first = fetch(limit, 0)
+    results = list(first.results or [])
+
+    count = first.count or 0
+    offsets = range(limit, count, limit)
+    for offset, response, error in run_concurrently(lambda o: fetch(limit, o), offsets, workers):
+        if error is not None:
+            raise error
+        results.extend(response.results or [])
+
+    return results
+
+
+def read_items(path: str) -> List[str]:
+    """
+    Read names or ids from a file, or stdin for '-'. Items are separated by newlines or commas;
+    blank lines and lines starting with '#' are skipped.
+    :param path: File path or '-'
+    :return: Items in order of appearance
+    """
+    source = sys.stdin if path == '-' else open(path)
+    try:
+        items = []
+        for line in source:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            items.extend(item.strip() for item in line.split(',') if item.strip())
+        return items
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def unique(items: Iterable) -> list:
+    """Drop duplicates, keeping the first occurrence"""
+    return list(dict.fromkeys(items))
@@ -0,0 +1,237 @@
+import json
+import os
+import sys
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+# Kept free of cement/esperclient imports: `espercli __complete` runs on every keypress and answers from the index
+# files alone
+
+DEFAULT_INDEX_DIR = '~/.esper/cache/names'
+
+KINDS = ('device', 'group', 'application', 'pipeline')
+
+# The index is refreshed in the background once it is this old, attempts are at least RETRY_INTERVAL apart
+REFRESH_INTERVAL = 300
+RETRY_INTERVAL = 60
+
+COMMANDS_FILE = 'commands.json'
+REFRESHED_FILE = 'refreshed'
+ATTEMPT_FILE = 'refresh.attempt'
+
+# Arguments that take names of a kind, by argparse dest
+ARGUMENT_KINDS = {
+    'device': 'device',
+    'devices': 'device',
+    'device_name': 'device',
+    'group': 'group',
+    'group_name': 'group',
+}
+
+# A plain `name` argument of these commands' subcommands is the name of their kind
+COMMAND_KINDS = {
+    'device': 'device',
+    'group': 'group',
+    'app': 'application',
+    'pipeline': 'pipeline',
+}
+
+BASH_SCRIPT = r'''# espercli completion for bash, load with: source <(espercli completion script bash)
+_espercli_complete() {
+    local IFS=$'\n' candidate
+    COMPREPLY=()
+    for candidate in $(espercli __complete -- "${COMP_WORDS[@]:1:COMP_CWORD}" 2>/dev/null); do
+        COMPREPLY+=("$(printf '%q' "$candidate")")
+    done
+}
+complete -F _espercli_complete espercli
+'''
+
+ZSH_SCRIPT = r'''#compdef espercli
+# espercli completion for zsh, load with: source <(espercli completion script zsh)
+_espercli_complete() {
+    local -a candidates
+    candidates=(${(f)"$(espercli __complete -- "${(@)words[2,CURRENT]}" 2>/dev/null)"})
+    compadd -- "${candidates[@]}"
+}
+compdef _espercli_complete espercli
+'''
+
+SCRIPTS = {'bash': BASH_SCRIPT, 'zsh': ZSH_SCRIPT}
+
+
+def get_index_dir() -> str:
+    return os.path.expanduser(os.environ.get('ESPER_NAME_INDEX', DEFAULT_INDEX_DIR))
+
+
+def argument_kind(path: str, dest: str) -> Optional[str]:
+    """
+    Kind of names an argument takes
+    :param path: Command path, e.g. 'device show'
+    :param dest: Argparse dest of the argument
+    :return: One of KINDS, None for arguments that do not take names
+    """
+    if dest in ARGUMENT_KINDS:
+        return ARGUMENT_KINDS[dest]
+
+    words = path.split()
+    if dest == 'name' and len(words) == 2:
+        return COMMAND_KINDS.get(words[0])
+    return None
+
+
+def _replace(path: str, content: str) -> None:
+    temp_path = f'{path}.tmp-{os.getpid()}'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def write_names(kind: str, names: Iterable[str], directory: str = None) -> int:
+    """
+    Replace the names of a kind in the index, as a sorted list with one name per line
+    :return: Number of names written
+    """
+    directory = directory or get_index_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    names = sorted({name for name in names if name and '\n' not in name})
+    _replace(os.path.join(directory, kind), ''.join(f'{name}\n' for name in names))
+    return len(names)
+
+
+def write_commands(tree: Dict[str, dict], directory: str = None) -> None:
+    """Replace the command tree of the index, see `command_tree` in the completion controller"""
+    directory = directory or get_index_dir()
+    os.makedirs(directory, exist_ok=True)
+    _replace(os.path.join(directory, COMMANDS_FILE), json.dumps(tree, separators=(',', ':')))
+
+
+def mark_refreshed(directory: str = None) -> None:
+    directory = directory or get_index_dir()
+    os.makedirs(directory, exist_ok=True)
+    _replace(os.path.join(directory, REFRESHED_FILE), f'{time.time()}\n')
+
+
+def index_age(directory: str = None) -> Optional[float]:
+    """Seconds since the index was last refreshed, None if it never was"""
+    try:
+        return time.time() - os.path.getmtime(os.path.join(directory or get_index_dir(), REFRESHED_FILE))
+    except OSError:
+        return None
+
+
+def lookup(kind: str, prefix: str, directory: str = None) -> List[str]:
+    """
+    Names of a kind starting with a prefix, found by bisecting the sorted name list
+    :return: Matches in sorted order, an empty list without an index
+    """
+    try:
+        with open(os.path.join(directory or get_index_dir(), kind), encoding='utf-8') as f:
+            names = f.read().splitlines()
+    except OSError:
+        return []
+
+    matches = []
+    for position in range(bisect_left(names, prefix), len(names)):
+        if not names[position].startswith(prefix):
+            break
+        matches.append(names[position])
+    return matches
+
+
+def load_commands(directory: str = None) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(directory or get_index_dir(), COMMANDS_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def complete(words: List[str], directory: str = None) -> List[str]:
+    """
+    Candidates for the last word of a command line
+    :param words: Command line arguments without the program name, the last one being the word to complete
+    :param directory: Index directory, defaults to `get_index_dir()`
+    :return: Subcommands, options or names, depending on what the word is
+    """
+    words = words or ['']
+    tree = load_commands(directory)
+
+    path = ''
+    node = tree.get(path, {})
+    option = None
+    positionals = 0
+    for word in words[:-1]:
+        if word.startswith('-'):
+            option = word if word in node.get('values', {}) else None
+        elif option is not None:
+            if option not in node.get('multiple', []):
+                option = None
+        elif word in node.get('commands', []):
+            path = f'{path} {word}'.strip()
+            node = tree.get(path, {})
+        else:
+            positionals += 1
+
+    current = words[-1]
+    if option is not None and not current.startswith('-'):
+        kind = node['values'][option]
+        return lookup(kind, current, directory) if kind else []
+
+    if current.startswith('-'):
+        return [candidate for candidate in node.get('options', []) if candidate.startswith(current)]
+
+    if node.get('commands'):
+        return [candidate for candidate in node['commands'] if candidate.startswith(current)]
+
+    kinds = node.get('positionals', [])
+    if positionals < len(kinds) and kinds[positionals]:
+        return lookup(kinds[positionals], current, directory)
+    return []
+
+
+def refresh_in_background(directory: str = None) -> bool:
+    """
+    Start `espercli completion refresh` in a detached process, when the index is stale and no attempt was made
+    recently
+    :return: Whether a refresh was started
+    """
+    directory = directory or get_index_dir()
+    age = index_age(directory)
+    if age is not None and age < REFRESH_INTERVAL:
+        return False
+
+    attempt = os.path.join(directory, ATTEMPT_FILE)
+    try:
+        if time.time() - os.path.getmtime(attempt) < RETRY_INTERVAL:
+            return False
+    except OSError:
+        pass
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(attempt, 'w') as f:
+            f.write(f'{time.time()}\n')
+
+        import subprocess
+        subprocess.Popen([sys.executable, '-m', 'esper.main', 'completion', 'refresh', '--quiet'],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True, env=dict(os.environ, ESPER_NAME_INDEX=directory))
+    except OSError:
+        return False
+    return True
+
+
+def complete_command(argv: List[str]) -> int:
+    """`espercli __complete [--] WORD...`: print one candidate per line"""
+    if argv[:1] == ['--']:
+        argv = argv[1:]
+
+    candidates = complete(argv)
+    if candidates:
+        sys.stdout.write('\n'.join(candidates) + '\n')
+
+    refresh_in_background()
+    return 0
@@ -0,0 +1,209 @@
+import io
+import json
+import os
+import socket
+import sys
+import time
+from contextlib import redirect_stderr
+from typing import List, Optional
+
+# Kept free of cement/esperclient imports: the thin client in `esper.cli` imports this module on every invocation
+
+DEFAULT_SOCKET = '~/.esper/run/espercli.sock'
+
+# Commands that prompt, read stdin, hold local resources or manage the daemon itself always run in-process
+LOCAL_COMMANDS = ('configure', 'secureadb', 'batch', 'daemon')
+
+# Global options that change how the process itself behaves
+LOCAL_OPTIONS = ('-h', '--help', '-v', '--version', '-D', '--debug', '--timings', '--timings-file')
+
+# Pipeline, stage, operation and execution commands prompt on the caller's terminal for any argument left out;
+# only `pipeline apply` never does
+PROMPTING_COMMANDS = (('pipeline',),)
+NON_PROMPTING_COMMANDS = (('pipeline', 'apply'),)
+
+# Commands that poll until something finishes. They would hold the daemon's only worker, and their progress
+# would only reach the caller once they end.
+WATCH_COMMANDS = (('rollout',), ('group-command', 'watch'), ('pipeline', 'execute', 'watch'))
+WATCH_OPTIONS = {('group-command',): ('-w', '--wait'), ('pipeline', 'execute'): ('-w', '--wait')}
+
+
+class DaemonError(Exception):
+    '''Exceptions related to talking to the espercli daemon'''
+    pass
+
+
+def get_socket_path() -> str:
+    return os.path.expanduser(os.environ.get('ESPER_DAEMON_SOCKET', DEFAULT_SOCKET))
+
+
+def is_forwardable(argv: List[str]) -> bool:
+    """
+    Whether a command line can be served by the daemon
+    :param argv: Command line arguments, without the program name
+    :return:
+    """
+    if not argv or argv[0] in LOCAL_COMMANDS:
+        return False
+
+    options = [arg.split('=')[0] for arg in argv if arg.startswith('-')]
+    if any(option in LOCAL_OPTIONS for option in options):
+        return False
+
+    # `-f -` and the like read the caller's stdin
+    if '-' in argv or any(arg.endswith('=-') for arg in argv):
+        return False
+
+    words = tuple(arg for arg in argv if not arg.startswith('-'))
+
+    def starts(prefixes):
+        return any(words[:len(prefix)] == prefix for prefix in prefixes)
+
+    if starts(PROMPTING_COMMANDS) and not starts(NON_PROMPTING_COMMANDS):
+        return False
+
+    if starts(WATCH_COMMANDS):
+        return False
+
+    return not any(starts((prefix,)) and set(flags) & set(options) for prefix, flags in WATCH_OPTIONS.items())
+
+
+def _exchange(path: str, message: dict, timeout: Optional[float] = None) -> dict:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+        with sock.makefile('rb') as stream:
+            line = stream.readline()
+    finally:
+        sock.close()
+
+    if not line:
+        raise DaemonError('Daemon closed the connection without replying')
+
+    return json.loads(line)
+
+
+def forward(argv: List[str], path: str = None) -> Optional[dict]:
+    """
+    Run a command in the daemon
+    :param argv: Command line arguments, without the program name
+    :param path: Socket path, defaults to `get_socket_path()`
+    :return: The daemon's reply with `exit_code`, `stdout` and `stderr`, or None when no daemon is listening
+    """
+    path = path or get_socket_path()
+    if not os.path.exists(path):
+        return None
+
+    try:
+        return _exchange(path, {'argv': argv, 'cwd': os.getcwd()})
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+
+
+def control(command: str, path: str = None, timeout: float = 5.0) -> Optional[dict]:
+    """
+    Send a control message (`ping` or `stop`) to the daemon
+    :return: The daemon's reply, or None when no daemon is listening
+    """
+    path = path or get_socket_path()
+    try:
+        return _exchange(path, {'control': command}, timeout)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+
+
+def serve(app, path: str, idle_timeout: float = 0) -> None:
+    """
+    Serve commands over a Unix domain socket until stopped. Commands run one at a time on the calling
+    thread, since they share the app's parsed arguments and render state.
+    :param app: The running Esper app
+    :param path: Socket path
+    :param idle_timeout: Exit after this many idle seconds, 0 to run until stopped
+    """
+    from esper.ext.dispatch import run_command
+
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        if control('ping', path) is not None:
+            raise DaemonError(f'A daemon is already listening on {path}')
+        os.unlink(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    server.settimeout(1.0)
+
+    started = time.time()
+    last_active = started
+    served = 0
+    cwd = os.getcwd()
+
+    app.log.info(f"[daemon] Listening on {path} (pid {os.getpid()})")
+
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                if idle_timeout and time.time() - last_active > idle_timeout:
+                    app.log.info(f"[daemon] Idle for {idle_timeout}s, exiting")
+                    break
+                continue
+
+            last_active = time.time()
+            with conn:
+                conn.settimeout(None)
+                with conn.makefile('rb') as stream:
+                    line = stream.readline()
+                if not line:
+                    continue
+
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    app.log.error(f"[daemon] Ignoring malformed request: {line[:200]!r}")
+                    continue
+
+                if message.get('control') == 'ping':
+                    reply = {'pid': os.getpid(), 'uptime': round(time.time() - started, 1), 'served': served}
+                elif message.get('control') == 'stop':
+                    conn.sendall(json.dumps({'stopping': True}).encode('utf-8') + b'\n')
+                    app.log.info("[daemon] Stop requested")
+                    break
+                else:
+                    argv = message.get('argv') or []
+                    app.log.debug(f"[daemon] Running {argv}")
+
+                    stderr = io.StringIO()
+                    # Forwarded commands must never read the daemon's own stdin: a prompt sees end of input
+                    stdin, sys.stdin = sys.stdin, io.StringIO()
+                    try:
+                        os.chdir(message.get('cwd') or cwd)
+                        with redirect_stderr(stderr):
+                            code, output = run_command(app, argv, capture=True)
+                    except OSError as e:
+                        code, output = 1, ''
+                        stderr.write(f"{e}\n")
+                    finally:
+                        sys.stdin = stdin
+                        os.chdir(cwd)
+
+                    served += 1
+                    reply = {'exit_code': code, 'stdout': output, 'stderr': stderr.getvalue()}
+
+                try:
+                    conn.sendall(json.dumps(reply).encode('utf-8') + b'\n')
+                except OSError as e:
+                    app.log.debug(f"[daemon] Client went away: {e}")
+
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
@@ -97,3 +97,25 @@ class DBWrapper:
     def unset_group(self):
         Group = Query()
         self.db.remove(Group.group.exists())
+
+    def set_upload(self, enterprise_id, sha256, upload):
+        Upload = Query()
+        uploads = self.db.table('uploads')
+
+        uploads.remove((Upload.enterprise == enterprise_id) & (Upload.sha256 == sha256))
+        uploads.insert({'enterprise': enterprise_id, 'sha256': sha256, 'upload': upload})
+
+    def get_upload(self, enterprise_id, sha256):
+        Upload = Query()
+
+        db_result = self.db.table('uploads').get((Upload.enterprise == enterprise_id) & (Upload.sha256 == sha256))
+
+        upload = None
+        if db_result:
+            upload = db_result['upload']
+
+        return upload
+
+    def unset_upload(self, enterprise_id, sha256):
+        Upload = Query()
+        self.db.table('uploads').remove((Upload.enterprise == enterprise_id) & (Upload.sha256 == sha256))
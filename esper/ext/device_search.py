@@ -0,0 +1,208 @@
+import os
+import pickle
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+from clint.textui import prompt
+from esperclient.rest import ApiException
+
+from esper.ext.api_client import OfflineError
+from esper.ext.completion import get_index_dir
+
+INDEX_FILE = 'devices.idx'
+INDEX_VERSION = 1
+
+# Fields of an index record, after the device id
+FIELDS = ('name', 'alias', 'serial', 'imei', 'tag')
+
+# Scores of the kinds of match; prefix and substring matches rank closer matches higher within their band
+EXACT = 1.0
+PREFIX = 0.85
+SUBSTRING = 0.7
+FUZZY = 0.7
+MIN_SCORE = 0.45
+
+# Terms sharing the most trigrams with a query that are scored for a fuzzy match
+FUZZY_CANDIDATES = 200
+
+# Matches offered when a name has to be disambiguated
+CHOICES = 9
+
+Match = namedtuple('Match', ['score', 'field', 'value', 'device'])
+
+
+def device_record(device) -> tuple:
+    """Index record of an esperclient Device: id, name, alias, serial, IMEIs and tags"""
+    hardware = device.hardware_info or {}
+    network = device.network_info or {}
+    return (device.id, device.device_name or '', device.alias_name or '', hardware.get('serialNumber') or '',
+            tuple(network[key] for key in ('imei1', 'imei2') if network.get(key)), tuple(device.tags or ()))
+
+
+def trigrams(key: str) -> set:
+    padded = f' {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DeviceIndex(object):
+    """
+    Search index over device names, aliases, serials, IMEIs and tags. Distinct lowercased values ("terms") are kept
+    sorted for prefix lookups, and every trigram of a term points back to it for fuzzy lookups, so a search only
+    scores the terms that can match.
+    """
+
+    def __init__(self, records: List[tuple]):
+        """
+        :param records: Records from `device_record`
+        """
+        terms = {}
+        for position, record in enumerate(records):
+            for field, values in enumerate(record[1:4] + (record[4], record[5])):
+                for value in (values if isinstance(values, tuple) else (values,)):
+                    if value:
+                        terms.setdefault(value.lower(), []).append(position * len(FIELDS) + field)
+
+        self.records = records
+        self.keys = sorted(terms)
+        self.postings = [tuple(terms[key]) for key in self.keys]
+
+        grams = {}
+        for term, key in enumerate(self.keys):
+            for gram in trigrams(key):
+                grams.setdefault(gram, array('I')).append(term)
+        self.grams = {gram: terms.tobytes() for gram, terms in grams.items()}
+
+    def __len__(self):
+        return len(self.records)
+
+    def save(self, directory: str = None) -> None:
+        directory = directory or get_index_dir()
+        os.makedirs(directory, exist_ok=True)
+
+        path = os.path.join(directory, INDEX_FILE)
+        temp_path = f'{path}.tmp-{os.getpid()}'
+        with open(temp_path, 'wb') as f:
+            pickle.dump((INDEX_VERSION, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, directory: str = None) -> Optional['DeviceIndex']:
+        """:return: The saved index, None if there is none or it was saved by another version"""
+        try:
+            with open(os.path.join(directory or get_index_dir(), INDEX_FILE), 'rb') as f:
+                version, index = pickle.load(f)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError, TypeError):
+            return None
+        return index if version == INDEX_VERSION else None
+
+    def _score(self, key: str, term: str) -> float:
+        if term == key:
+            return EXACT
+        if term.startswith(key):
+            return PREFIX + 0.1 * len(key) / len(term)
+        if key in term:
+            return SUBSTRING + 0.1 * len(key) / len(term)
+        return FUZZY * SequenceMatcher(None, key, term).ratio()
+
+    def search(self, query: str, limit: int = 10) -> List[Match]:
+        """
+        Devices matching a query by prefix, substring or approximately, best first. A device ranks by its best
+        matching field.
+        """
+        key = query.strip().lower()
+        if not key:
+            return []
+
+        # Prefix matches are contiguous in the sorted terms
+        candidates = set()
+        for term in range(bisect_left(self.keys, key), len(self.keys)):
+            if not self.keys[term].startswith(key) or len(candidates) >= FUZZY_CANDIDATES:
+                break
+            candidates.add(term)
+
+        shared = Counter()
+        for gram in trigrams(key):
+            if gram in self.grams:
+                shared.update(array('I', self.grams[gram]))
+        candidates.update(term for term, _ in shared.most_common(FUZZY_CANDIDATES))
+
+        best = {}
+        for term in candidates:
+            score = self._score(key, self.keys[term])
+            if score < MIN_SCORE:
+                continue
+
+            for posting in self.postings[term]:
+                position, field = divmod(posting, len(FIELDS))
+                if position not in best or score > best[position][0]:
+                    best[position] = (score, field, term)
+
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], self.records[item[0]][1]))
+        return [Match(round(score, 3), FIELDS[field], self.keys[term], self.records[position])
+                for position, (score, field, term) in ranked[:limit]]
+
+
+def _describe(match: Match) -> str:
+    _, name, alias = match.device[:3]
+    label = f'{name} ({alias})' if alias else name
+    return label if match.field == 'name' else f'{label}, {match.field} {match.value}'
+
+
+def choose_device(app, query: str, matches: List[Match]) -> Optional[Match]:
+    """
+    Settle which device a query means. Only a single device with an exactly matching name, alias, serial or IMEI
+    is taken as is, since commands act on it (wipe, reboot...) without asking. Any other match has to be chosen on
+    a terminal; without one the closest matches are printed on stderr and nothing is chosen.
+    :return: The chosen match, None if there is none
+    """
+    if not matches:
+        return None
+
+    exact = [match for match in matches if match.score >= EXACT]
+    if len(exact) == 1 and exact[0].field != 'tag':
+        app.log.info(f"Resolved {query!r} to device {_describe(exact[0])}")
+        return exact[0]
+
+    if not sys.stdin.isatty():
+        app.log.warning(f"Closest matches for {query!r}: " +
+                        '; '.join(_describe(match) for match in matches[:CHOICES]))
+        sys.stderr.write(f"No device is named {query!r}, closest matches:\n" +
+                         ''.join(f"  {_describe(match)}\n" for match in matches[:CHOICES]))
+        return None
+
+    options = [{'selector': i, 'prompt': _describe(match), 'return': match}
+               for i, match in enumerate(matches[:CHOICES], start=1)]
+    options.append({'selector': 0, 'prompt': 'None of these', 'return': None})
+    return prompt.options(f"No device is named {query!r}, did you mean:", options)
+
+
+def find_device(app, device_client, enterprise_id: str, name: str):
+    """
+    Device by name. An exact name goes to the API; otherwise the local device index (see `espercli completion
+    refresh`) resolves partial or misspelled names, aliases, serials, IMEIs and tags.
+    :return: The esperclient Device, None if no device matches
+    """
+    try:
+        search_response = device_client.get_all_devices(enterprise_id, limit=1, offset=0, name=name)
+        if search_response.results:
+            return search_response.results[0]
+    except OfflineError:
+        # This name was never looked up online, the index may still know it
+        pass
+
+    index = DeviceIndex.load()
+    match = choose_device(app, name, index.search(name, limit=CHOICES) if index else [])
+    if match is None:
+        return None
+
+    try:
+        return device_client.get_device_by_id(enterprise_id, match.device[0])
+    except ApiException as e:
+        if e.status == 404:
+            app.log.debug(f"[find_device] Indexed device {match.device[0]} no longer exists")
+            return None
+        raise
@@ -0,0 +1,72 @@
+import io
+import traceback
+from contextlib import redirect_stdout, nullcontext
+from typing import List, Tuple
+
+# Commands that manage a dispatch loop themselves and must not be nested inside one
+NON_DISPATCHABLE = ('batch', 'daemon')
+
+
+def _exit_code(code) -> int:
+    if code is None:
+        return 0
+    return code if isinstance(code, int) else 1
+
+
+def run_command(app, argv: List[str], capture: bool = False) -> Tuple[int, str]:
+    """
+    Dispatch a single command line through an app that has already been set up and run once,
+    reusing its parsers, DB handle, certificates and HTTP connection pools
+    :param app: The running Esper app
+    :param argv: Command line arguments, without the program name
+    :param capture: Collect rendered output and prints instead of writing them to stdout
+    :return: Exit code and captured output (empty when not capturing)
+    """
+    if argv and argv[0] in NON_DISPATCHABLE:
+        app.log.error(f"[dispatch] `{argv[0]}` cannot be run from within a batch or daemon")
+        return 1, ''
+
+    buffer = io.StringIO()
+    parsed_args = app._parsed_args
+    render = app.render
+
+    if capture:
+        def render_to_buffer(data, *args, **kwargs):
+            kwargs['out'] = buffer
+            return render(data, *args, **kwargs)
+
+        app.render = render_to_buffer
+
+    app.exit_code = 0
+    try:
+        with redirect_stdout(buffer) if capture else nullcontext():
+            app._parsed_args = app.args.parse(argv)
+            for res in app.hook.run('post_argument_parsing', app):
+                pass
+
+            if not hasattr(app.pargs, '__dispatch__'):
+                app.args.print_help()
+                return 0, buffer.getvalue()
+
+            label, func_name = app.pargs.__dispatch__.split('.')
+            controller = app.controller if label == 'base' else app.controller._controllers_map[label]
+            getattr(controller, func_name)()
+
+        code = app.exit_code
+
+    except SystemExit as e:
+        code = _exit_code(e.code)
+
+    except Exception as e:
+        app.log.error(f"[dispatch] {' '.join(argv)} failed: {e!r}")
+        if app.debug:
+            traceback.print_exc()
+        code = 1
+
+    finally:
+        app._parsed_args = parsed_args
+        if capture:
+            del app.render
+
+    app.exit_code = 0
+    return code, buffer.getvalue()
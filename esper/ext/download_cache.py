@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from cement.utils import fs
+
+from esper.ext.apk import sha256_file
+
+# ioctl that shares the blocks of one file with another on copy-on-write file systems (btrfs, XFS)
+FICLONE = 0x40049409
+
+
+class DownloadCache(object):
+    """
+    On-disk cache of downloaded application files. File contents are stored once under their SHA-256 in
+    `objects/`, and `keys/` maps a version id and size to the content. Objects are evicted least recently used
+    first once they grow past `max_bytes`, and every hit is verified against the recorded size and hash before it
+    is served. Downloads are copied out of the cache, so editing one never changes the cached file. Disabled until
+    `configure` is called with a non-zero size.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.max_bytes = 0
+        # Skip lookups (but still store downloads), set by `--refresh`
+        self.refresh = False
+        self.lock = threading.Lock()
+
+    def configure(self, directory: str, max_bytes: int) -> None:
+        self.directory = fs.abspath(directory)
+        self.max_bytes = max_bytes
+
+        if self.enabled:
+            os.makedirs(self.objects, mode=0o700, exist_ok=True)
+            os.makedirs(self.keys, mode=0o700, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory and self.max_bytes > 0)
+
+    @property
+    def objects(self) -> str:
+        return os.path.join(self.directory, 'objects')
+
+    @property
+    def keys(self) -> str:
+        return os.path.join(self.directory, 'keys')
+
+    def _key_path(self, version_id: str, size: int) -> str:
+        return os.path.join(self.keys, f'{version_id}-{size}.json')
+
+    def _discard(self, key_path: str, object_path: str = None) -> None:
+        for path in (key_path, object_path):
+            if path:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def lookup(self, version_id: str, size: int) -> Optional[str]:
+        """
+        Cached file of an application version. Entries that fail verification are dropped.
+        :param version_id: Version id
+        :param size: File size reported by the server
+        :return: Path of the cached file, None on a miss
+        """
+        if not self.enabled or self.refresh:
+            return None
+
+        key_path = self._key_path(version_id, size)
+        try:
+            with open(key_path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        object_path = os.path.join(self.objects, record['sha256'])
+        try:
+            valid = os.path.getsize(object_path) == record['size'] and sha256_file(object_path) == record['sha256']
+        except OSError:
+            valid = False
+
+        if not valid:
+            self._discard(key_path, object_path)
+            return None
+
+        try:
+            os.utime(object_path)
+        except OSError:
+            pass
+        return object_path
+
+    def store(self, version_id: str, size: int, chunks: Iterable[bytes], expected_size: int = None,
+              sha256: str = None) -> str:
+        """
+        Write a download into the cache, hashing it on the way. Nothing is cached when the contents do not match the
+        expected size or hash.
+        :param version_id: Version id
+        :param size: File size reported by the server
+        :param chunks: File contents
+        :param expected_size: Exact size of the contents, the Content-Length of the download
+        :param sha256: Expected SHA-256 of the contents, when known
+        :return: Path of the cached file
+        """
+        digest = hashlib.sha256()
+        written = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.objects, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+
+            if expected_size is not None and written != expected_size:
+                raise IOError(f"Incomplete download, received {written} of {expected_size} bytes")
+            if sha256 is not None and digest.hexdigest() != sha256:
+                raise IOError(f"Download does not match its SHA-256 {sha256}")
+
+            sha256 = digest.hexdigest()
+            object_path = os.path.join(self.objects, sha256)
+            os.replace(temp_path, object_path)
+        except BaseException:
+            self._discard(temp_path)
+            raise
+
+        record = {'version_id': version_id, 'sha256': sha256, 'size': written, 'stored': time.time()}
+        fd, temp_path = tempfile.mkstemp(dir=self.keys, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(temp_path, self._key_path(version_id, size))
+
+        self.evict(keep=object_path)
+        return object_path
+
+    @staticmethod
+    def _clone(path: str, temp_path: str) -> bool:
+        """Copy-on-write clone of a file, False where the platform or file system has none"""
+        if fcntl is None:
+            return False
+
+        try:
+            with open(path, 'rb') as source, open(temp_path, 'wb') as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def place(path: str, destination: str) -> bool:
+        """
+        Put a copy of a cached file at the destination, replacing what is there. The copy is a copy-on-write clone
+        where the file system supports it.
+        :param path: Cached file
+        :param destination: Destination file path
+        :return: True if the file was cloned, False if its contents were copied
+        """
+        directory = os.path.dirname(os.path.abspath(destination))
+        temp_path = os.path.join(directory, f'.{os.path.basename(destination)}.{os.getpid()}.tmp')
+        try:
+            cloned = DownloadCache._clone(path, temp_path)
+            if not cloned:
+                shutil.copyfile(path, temp_path)
+            os.replace(temp_path, destination)
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        return cloned
+
+    def clear(self) -> None:
+        if not self.enabled:
+            return
+
+        for directory in (self.keys, self.objects):
+            for entry in os.scandir(directory):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def evict(self, keep: str = None) -> None:
+        """
+        Remove least recently used files until the cache is back under 90% of `max_bytes`, then the keys left
+        without a file.
+        :param keep: File that must stay, the one that was just stored
+        """
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.objects):
+                if entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            for _, size, path in sorted(entries):
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes * 0.9:
+                    break
+
+            self._prune_keys()
+
+    def _prune_keys(self) -> None:
+        """Remove keys whose file is gone"""
+        for entry in os.scandir(self.keys):
+            if entry.name.startswith('.tmp-'):
+                continue
+            try:
+                with open(entry.path) as f:
+                    sha256 = json.load(f)['sha256']
+            except (OSError, ValueError, KeyError):
+                sha256 = None
+            if not sha256 or not os.path.exists(os.path.join(self.objects, sha256)):
+                self._discard(entry.path)
+
+
+download_cache = DownloadCache()
+
+
+def init_download_cache(app):
+    """Hook: configure the download cache from the `esper` config section and `--refresh`"""
+    download_cache.configure(app.config.get('esper', 'download_cache_dir'),
+                             int(app.config.get('esper', 'download_cache_max_bytes')))
+
+    download_cache.refresh = bool(getattr(app.pargs, 'refresh', False))
@@ -1,11 +1,15 @@
 import logging
 import socket
 import threading
+import time
 from datetime import datetime
 from typing import Tuple, ByteString
 
 BUFFER_SIZE = 1024
 
+# A write that blocks this long is counted as a stall: the receiving end (or the network) is not keeping up
+STALL_THRESHOLD = 0.05
+
 
 class ClientConnection(object):
     '''
@@ -50,6 +54,7 @@ class Forwarder(threading.Thread):
                  outbound_conn: socket.socket = None,
                  outbound_address: Tuple[str, int] = (None, None),
                  log: logging.Logger = None,
+                 bufsize: int = BUFFER_SIZE,
                  *args,
                  **kwargs):
         super(Forwarder, self).__init__(*args, **kwargs)
@@ -57,6 +62,7 @@ class Forwarder(threading.Thread):
         self.args = kwargs.get('args')
         self.kwargs = kwargs.get('kwargs')
         self.log = log
+        self.bufsize = bufsize
 
         self.inbound_connection = ClientConnection(inbound_conn, inbound_address)
         self.outbound_connection = ClientConnection(outbound_conn, outbound_address)
@@ -69,6 +75,10 @@ class Forwarder(threading.Thread):
         self._bytes_transferred = 0
         self._connection_started = None
         self._connection_stopped = None
+        self._packets = 0
+        self._in_flight = 0
+        self._stalls = 0
+        self._stalled_seconds = 0.0
 
     @property
     def bytes(self):
@@ -78,6 +88,25 @@ class Forwarder(threading.Thread):
     def bytes(self, value):
         self._bytes_transferred += value
 
+    @property
+    def packets(self) -> int:
+        """Chunks relayed, each one read from the inbound connection and written to the outbound one"""
+        return self._packets
+
+    @property
+    def in_flight(self) -> int:
+        """Bytes read but not written yet"""
+        return self._in_flight
+
+    @property
+    def stalls(self) -> int:
+        """Writes that blocked for STALL_THRESHOLD or longer, on backpressure from the outbound connection"""
+        return self._stalls
+
+    @property
+    def stalled_seconds(self) -> float:
+        return self._stalled_seconds
+
     def start_timer(self) -> None:
         self._connection_started = datetime.utcnow()
 
@@ -124,7 +153,7 @@ class TCPForwarder(Forwarder):
                 break
 
             try:
-                data = self.inbound_connection.recv(BUFFER_SIZE)
+                data = self.inbound_connection.recv(self.bufsize)
                 if len(data) <= 0:
                     self.log.debug(f"[{self.name}] Zero Data! Connection closed by client: {self.inbound_connection}!")
                     break
@@ -136,8 +165,16 @@ class TCPForwarder(Forwarder):
                 break
 
             try:
+                self._in_flight = len(data)
+                started = time.perf_counter()
                 self.outbound_connection.send(data)
+                blocked = time.perf_counter() - started
+                if blocked >= STALL_THRESHOLD:
+                    self._stalls += 1
+                    self._stalled_seconds += blocked
+                self._packets += 1
                 self.bytes = len(data)
+                self._in_flight = 0
             except socket.error:
                 self.log.debug(f"[{self.name}] Write Error! Connection closed by client {self.outbound_connection}")
                 break
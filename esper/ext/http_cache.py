@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from cement.utils import fs
+
+from esper.ext.timings import url_template
+from esper.ext.utils import format_age
+
+# Seconds a GET response stays fresh, by URL template. Endpoints that are not listed are never cached: devices,
+# installs, statuses, commands and pipeline executions change too often to be served from disk.
+DEFAULT_TTLS = {
+    '/api/v1/token-info/': 300,
+    '/api/v1/enterprise/{id}/': 3600,
+    '/api/enterprise/{id}/devicegroup/': 60,
+    '/api/enterprise/{id}/devicegroup/{id}/': 60,
+    '/api/enterprise/{id}/application/': 300,
+    '/api/enterprise/{id}/application/{id}/': 300,
+    '/api/enterprise/{id}/application/{id}/version/': 300,
+    '/api/enterprise/{id}/application/{id}/version/{id}/': 300,
+    '/api/v1/enterprise/{id}/pipeline/': 60,
+    '/api/v1/enterprise/{id}/pipeline/{id}/': 60,
+    '/api/v1/enterprise/{id}/pipeline/{id}/stage/': 60,
+    '/api/v1/enterprise/{id}/pipeline/{id}/stage/{id}/': 60,
+    '/api/v1/enterprise/{id}/pipeline/{id}/stage/{id}/operation/': 60,
+}
+
+# Endpoints that are never served fresh from the cache, but whose last response is kept for `--offline` and
+# `--stale-ok`, so device reads still work when the API cannot be reached. Only stored when opted in with
+# `offline_cache` or during `--stale-ok`, since they are fetched in bulk and hold device identifiers.
+OFFLINE_TEMPLATES = {
+    '/api/enterprise/{id}/device/',
+    '/api/enterprise/{id}/device/{id}/',
+    '/api/enterprise/{id}/device/{id}/status/',
+}
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def resource_scope(url: str) -> str:
+    """
+    The resource collection a URL belongs to, e.g. `/api/enterprise/<id>/devicegroup`. A write anywhere in a
+    collection invalidates every cached read of it, since list responses embed the items.
+    :param url: Request URL
+    :return: Path prefix
+    """
+    segments = [s for s in url.split('?')[0].split('/') if s]
+    path = segments[2:] if '://' in url else segments
+
+    if 'enterprise' in path:
+        index = path.index('enterprise')
+        return '/' + '/'.join(path[:index + 3])
+
+    return '/' + '/'.join(path[:2])
+
+
+class CacheEntry(object):
+
+    def __init__(self, path: str, meta: dict, body: bytes):
+        self.path = path
+        self.url = meta['url']
+        self.stored = meta['stored']
+        self.ttl = meta['ttl']
+        self.etag = meta.get('etag')
+        self.headers = meta.get('headers') or {}
+        self.body = body
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored
+
+    @property
+    def fresh(self) -> bool:
+        return self.age < self.ttl
+
+
+class HttpCache(object):
+    """
+    On-disk cache of GET responses, one file per response. Entries are evicted least recently used first
+    once the directory grows past `max_bytes`, which is tracked with a running size so that the directory is
+    only scanned when it may be over. Disabled until `configure` is called with a non-zero size.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.max_bytes = 0
+        self.ttls = dict(DEFAULT_TTLS)
+        # Skip lookups (but still store fresh responses), set by `--refresh`
+        self.refresh = False
+        # Answer reads from cached responses of any age and never touch the network, set by `--offline`
+        self.offline = False
+        # Fall back to stale cached responses when the API cannot be reached, set by `--stale-ok`
+        self.stale_ok = False
+        # Keep the last response of the offline endpoints on every read, set by the `offline_cache` config
+        self.offline_cache = False
+        # Ages of the responses served because of `offline` or `stale_ok`
+        self.served_ages = []
+        # Bytes in the directory as of the last scan plus what was written since, None until the first scan
+        self.size = None
+        self.lock = threading.Lock()
+
+    def configure(self, directory: str, max_bytes: int, ttls: dict = None) -> None:
+        self.directory = fs.abspath(directory)
+        self.max_bytes = max_bytes
+        self.size = None
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+
+        if self.enabled:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory and self.max_bytes > 0)
+
+    def ttl_for(self, url: str) -> int:
+        return self.ttls.get(url_template(url), 0) if self.enabled else 0
+
+    def stores(self, url: str) -> bool:
+        """Whether GET responses of a URL are kept, be it to serve them fresh or only for offline use"""
+        if self.ttl_for(url):
+            return True
+        keep = self.offline_cache or self.offline or self.stale_ok
+        return self.enabled and keep and url_template(url) in OFFLINE_TEMPLATES
+
+    def key(self, url: str, authorization: Optional[str]) -> str:
+        """
+        File name for a response. The scope prefix lets writes invalidate a whole collection with one listing.
+        :param url: Full request URL, including the query string
+        :param authorization: Authorization header, so different API keys never share responses
+        :return:
+        """
+        return f"{_digest(resource_scope(url))[:16]}-{_digest(f'{authorization}|{url}')[:32]}"
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+
+        return CacheEntry(path, meta, body)
+
+    def put(self, key: str, url: str, body: bytes, ttl: int, etag: str = None, headers: dict = None) -> None:
+        meta = {'url': url, 'stored': time.time(), 'ttl': ttl, 'etag': etag, 'headers': headers or {}}
+
+        path = os.path.join(self.directory, key)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8') + b'\n')
+                f.write(body)
+                written = f.tell()
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return
+
+        with self.lock:
+            if self.size is not None:
+                self.size += written - replaced
+            over = self.size is None or self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    def revalidated(self, entry: CacheEntry) -> None:
+        """The server confirmed the entry is unchanged (304): restart its TTL"""
+        self.put(os.path.basename(entry.path), entry.url, entry.body, entry.ttl, entry.etag, entry.headers)
+
+    def serve_stale(self, entry: CacheEntry) -> CacheEntry:
+        """Record that an entry answers a request without the API, so its age is reported on exit"""
+        with self.lock:
+            self.served_ages.append(entry.age)
+        self.touch(entry)
+        return entry
+
+    def touch(self, entry: CacheEntry) -> None:
+        """Mark an entry as recently used"""
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+
+    def invalidate(self, url: str) -> None:
+        """Drop every cached response in the collection of a URL that was just written to"""
+        if not self.enabled:
+            return
+
+        prefix = _digest(resource_scope(url))[:16] + '-'
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(prefix):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        if not self.enabled:
+            return
+
+        for entry in os.scandir(self.directory):
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+        self.size = None
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache is back under 90% of `max_bytes`, and reset the
+        running size from the scan
+        """
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    if total <= self.max_bytes * 0.9:
+                        break
+
+            self.size = total
+
+
+cache = HttpCache()
+
+
+def init_http_cache(app):
+    """Hook: configure the response cache from the `esper` config section and `--refresh`"""
+    cache.configure(app.config.get('esper', 'cache_dir'),
+                    int(app.config.get('esper', 'cache_max_bytes')),
+                    app.config.get('esper', 'cache_ttls'))
+
+    cache.refresh = bool(getattr(app.pargs, 'refresh', False))
+    cache.offline = bool(getattr(app.pargs, 'offline', False))
+    cache.stale_ok = bool(getattr(app.pargs, 'stale_ok', False))
+    cache.offline_cache = str(app.config.get('esper', 'offline_cache')).lower() in ('true', '1', 'yes')
+    cache.served_ages = []
+
+    if (cache.offline or cache.stale_ok) and not cache.enabled:
+        app.log.warning("[http-cache] The response cache is disabled (cache_max_bytes is 0), "
+                        "nothing can be served from it")
+
+
+def report_cache_age(app):
+    """Hook: tell how old the data was when any of it came from the cache instead of the API"""
+    if not cache.served_ages:
+        return
+
+    mode = 'offline' if cache.offline else 'API unavailable'
+    sys.stderr.write(f"\nServed from the local cache ({mode}), data up to {format_age(max(cache.served_ages))} old\n")
+    app.log.info(f"[http-cache] Served {len(cache.served_ages)} responses from the cache, "
+                 f"oldest {format_age(max(cache.served_ages))}")
@@ -0,0 +1,137 @@
+import os
+import re
+import sqlite3
+import time
+from typing import Iterable, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    enterprise TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    device_name TEXT,
+    collected_at REAL NOT NULL,
+    PRIMARY KEY (enterprise, device_id)
+);
+CREATE TABLE IF NOT EXISTS installs (
+    enterprise TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    package TEXT NOT NULL,
+    application_name TEXT,
+    version_code TEXT,
+    version_key TEXT,
+    build_number TEXT,
+    state TEXT
+);
+CREATE INDEX IF NOT EXISTS installs_package_version ON installs (enterprise, package, version_key);
+CREATE INDEX IF NOT EXISTS installs_device ON installs (enterprise, device_id);
+CREATE INDEX IF NOT EXISTS installs_state ON installs (enterprise, state, package);
+"""
+
+
+def version_key(version: Optional[str]) -> str:
+    """
+    Sortable form of a version string, so versions compare correctly as text in the index:
+    '1.10.2' > '1.9' and '210' > '30'. Numeric parts are zero padded, and sort above text parts
+    so '2.0-beta' < '2.0.1'.
+    """
+    if not version:
+        return ''
+    parts = re.split(r'[.\-_+ ]', str(version).strip())
+    return '.'.join('1' + part.zfill(10) if part.isdigit() else '0' + part for part in parts)
+
+
+class InstallInventory(object):
+    """
+    Local SQLite snapshot of the app installs of every device of an enterprise, indexed by package and
+    version for compliance queries
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def replace_device(self, enterprise_id: str, device_id: str, device_name: str, installs: Iterable):
+        """
+        Store the installs of one device, replacing what was collected for it before
+        :param installs: esperclient InstallationListResult results, or objects with the same attributes
+        """
+        rows = []
+        for install in installs:
+            application = install.application
+            version = application.version
+            rows.append((enterprise_id, device_id, application.package_name, application.application_name,
+                         version.version_code if version else None,
+                         version_key(version.version_code) if version else '',
+                         version.build_number if version else None,
+                         install.install_state))
+
+        with self.connection:
+            self.connection.execute("DELETE FROM installs WHERE enterprise = ? AND device_id = ?",
+                                    (enterprise_id, device_id))
+            self.connection.executemany("INSERT INTO installs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.execute("INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?)",
+                                    (enterprise_id, device_id, device_name, time.time()))
+
+    def prune_devices(self, enterprise_id: str, device_ids: Iterable[str]):
+        """Forget devices that are no longer part of the enterprise"""
+        known = set(device_ids)
+        stale = [row['device_id'] for row in
+                 self.connection.execute("SELECT device_id FROM devices WHERE enterprise = ?", (enterprise_id,))
+                 if row['device_id'] not in known]
+
+        with self.connection:
+            for device_id in stale:
+                self.connection.execute("DELETE FROM installs WHERE enterprise = ? AND device_id = ?",
+                                        (enterprise_id, device_id))
+                self.connection.execute("DELETE FROM devices WHERE enterprise = ? AND device_id = ?",
+                                        (enterprise_id, device_id))
+
+    def stats(self, enterprise_id: str) -> dict:
+        """Device and install counts, and the oldest and newest collection time"""
+        row = self.connection.execute(
+            "SELECT COUNT(*) AS devices, MIN(collected_at) AS oldest, MAX(collected_at) AS newest "
+            "FROM devices WHERE enterprise = ?", (enterprise_id,)).fetchone()
+        installs = self.connection.execute("SELECT COUNT(*) FROM installs WHERE enterprise = ?",
+                                           (enterprise_id,)).fetchone()[0]
+        return {'devices': row['devices'], 'installs': installs, 'oldest': row['oldest'], 'newest': row['newest']}
+
+    def versions(self, enterprise_id: str, package: str) -> List[dict]:
+        """Number of devices per installed version of a package, newest version first"""
+        rows = self.connection.execute(
+            "SELECT version_code, state, COUNT(DISTINCT device_id) AS devices FROM installs "
+            "WHERE enterprise = ? AND package = ? GROUP BY version_key, version_code, state "
+            "ORDER BY version_key DESC, state", (enterprise_id, package))
+        return [dict(row) for row in rows]
+
+    def below(self, enterprise_id: str, package: str, version: str, state: str = None) -> List[dict]:
+        """Devices that have the package installed at a version lower than `version`"""
+        query = ("SELECT d.device_name, i.device_id, i.version_code, i.state FROM installs i "
+                 "JOIN devices d ON d.enterprise = i.enterprise AND d.device_id = i.device_id "
+                 "WHERE i.enterprise = ? AND i.package = ? AND i.version_key < ?")
+        params = [enterprise_id, package, version_key(version)]
+        if state:
+            query += " AND i.state = ?"
+            params.append(state)
+
+        return [dict(row) for row in self.connection.execute(query + " ORDER BY i.version_key, d.device_name",
+                                                             params)]
+
+    def missing(self, enterprise_id: str, package: str) -> List[dict]:
+        """Devices without any install of the package"""
+        rows = self.connection.execute(
+            "SELECT d.device_name, d.device_id FROM devices d WHERE d.enterprise = ? AND NOT EXISTS "
+            "(SELECT 1 FROM installs i WHERE i.enterprise = d.enterprise AND i.device_id = d.device_id "
+            "AND i.package = ?) ORDER BY d.device_name", (enterprise_id, package))
+        return [dict(row) for row in rows]
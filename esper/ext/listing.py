@@ -0,0 +1,156 @@
+import json
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from esper.controllers.enums import DeviceState
+
+
+class Column(object):
+    """One field of a list command"""
+
+    __slots__ = ('field', 'label', 'key', 'extract', 'text', 'default')
+
+    def __init__(self, field: str, label: str, key: str, extract: Callable[[dict], object],
+                 text: Callable[[object], object] = None, default: bool = True):
+        """
+        :param field: Name for `--fields`
+        :param label: Table header
+        :param key: Key in JSON output
+        :param extract: Reads the value from an API result, as decoded from JSON
+        :param text: Formats the value for tables, if it differs from the JSON value
+        :param default: Shown when no fields are chosen
+        """
+        self.field = field
+        self.label = label
+        self.key = key
+        self.extract = extract
+        self.text = text
+        self.default = default
+
+
+class Row(tuple):
+    """
+    Listing row: the values of the chosen columns, no larger than a tuple. Values are read by column name like a
+    dict, so rows render as tables (`headers="keys"`) the way the dicts they replace did.
+    """
+
+    __slots__ = ()
+    names = ()
+    positions = {}
+
+    def keys(self) -> Sequence[str]:
+        return self.names
+
+    def values(self) -> tuple:
+        return tuple(self)
+
+    def get(self, name, default=None):
+        position = self.positions.get(name)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self.positions[key])
+        return tuple.__getitem__(self, key)
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.names, self))
+
+
+class Listing(object):
+    """Columns of a list command, and the compact rows built from its API results"""
+
+    def __init__(self, name: str, columns: List[Column]):
+        self.name = name
+        self.columns = {column.field: column for column in columns}
+        self._row_types = {}
+
+    def select(self, fields: Optional[str] = None) -> Tuple[Column, ...]:
+        """
+        Columns named by a `--fields` value such as 'id,name,state', the default columns without one
+        :raises ValueError: For unknown fields
+        """
+        if not fields:
+            return tuple(column for column in self.columns.values() if column.default)
+
+        names = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in names if field not in self.columns]
+        if unknown or not names:
+            raise ValueError(f"Unknown fields {', '.join(unknown) or repr(fields)}, "
+                             f"choose from {', '.join(self.columns)}")
+        return tuple(self.columns[field] for field in dict.fromkeys(names))
+
+    def _row_type(self, columns: Tuple[Column, ...], json_keys: bool) -> type:
+        key = (tuple(column.field for column in columns), json_keys)
+        if key not in self._row_types:
+            names = tuple(column.key if json_keys else column.label for column in columns)
+            self._row_types[key] = type(f'{self.name.title()}Row', (Row,), {
+                '__slots__': (),
+                'names': names,
+                'positions': {name: position for position, name in enumerate(names)}
+            })
+        return self._row_types[key]
+
+    def rows(self, results: Iterable[dict], columns: Tuple[Column, ...], json_keys: bool = False) -> List[Row]:
+        """
+        Rows of the chosen columns; nothing else is read from the results
+        :param results: API results, as decoded from JSON
+        :param columns: From `select`
+        :param json_keys: Name values by JSON key and keep them unformatted, instead of by table label
+        """
+        row_type = self._row_type(columns, json_keys)
+        if json_keys:
+            readers = [column.extract for column in columns]
+        else:
+            readers = [(lambda result, c=column: c.text(c.extract(result))) if column.text else column.extract
+                       for column in columns]
+        return [row_type([read(result) for read in readers]) for result in results]
+
+
+def fetch_results(call: Callable, *args, **kwargs) -> Tuple[int, List[dict]]:
+    """
+    Call an esperclient list method without building its models, which cost far more than the rows built from them
+    :return: `count` and `results` of the response, as decoded from JSON
+    """
+    response = call(*args, _preload_content=False, **kwargs)
+    body = json.loads(response.data)
+    return body.get('count') or 0, body.get('results') or []
+
+
+def _device_name(device: dict) -> str:
+    return device.get('alias_name') or device.get('device_name')
+
+
+def _join(values) -> str:
+    return ', '.join(values) if values else ''
+
+
+DEVICES = Listing('device', [
+    Column('id', 'ID', 'id', lambda device: device.get('id')),
+    Column('name', 'NAME', 'device', _device_name),
+    Column('model', 'MODEL', 'model', lambda device: (device.get('hardwareInfo') or {}).get('manufacturer')),
+    Column('state', 'CURRENT STATE', 'state', lambda device: DeviceState(device.get('status')).name),
+    Column('tags', 'TAGS', 'tags', lambda device: device.get('tags'), text=_join),
+    Column('serial', 'SERIAL', 'serial', lambda device: (device.get('hardwareInfo') or {}).get('serialNumber'),
+           default=False),
+    Column('imei', 'IMEI', 'imei', lambda device: (device.get('networkInfo') or {}).get('imei1'), default=False),
+    Column('brand', 'BRAND', 'brand', lambda device: (device.get('hardwareInfo') or {}).get('brand'),
+           default=False),
+    Column('api_level', 'API LEVEL', 'api_level', lambda device: device.get('api_level'), default=False),
+])
+
+INSTALLS = Listing('install', [
+    Column('id', 'ID', 'id', lambda install: install.get('id')),
+    Column('application', 'APPLICATION', 'application_name',
+           lambda install: (install.get('application') or {}).get('application_name')),
+    Column('package', 'PACKAGE', 'package_name',
+           lambda install: (install.get('application') or {}).get('package_name')),
+    Column('version', 'VERSION', 'version_code',
+           lambda install: ((install.get('application') or {}).get('version') or {}).get('version_code')),
+    Column('state', 'STATE', 'install_state', lambda install: install.get('install_state')),
+])
+
+APPLICATIONS = Listing('application', [
+    Column('id', 'ID', 'id', lambda application: application.get('id')),
+    Column('name', 'NAME', 'name', lambda application: application.get('application_name')),
+    Column('package', 'PACKAGE NAME', 'package', lambda application: application.get('package_name')),
+])
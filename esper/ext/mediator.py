@@ -1,10 +1,13 @@
 import random
 import selectors
 import socket
+import ssl
 import types
 
 from typing import Tuple
 
+from esper.core.log_handler import is_debug_enabled
+
 
 class MediatorShutdown(BaseException):
     pass
@@ -40,6 +43,8 @@ class Mediator(object):
     def __init__(self, secure_conn=None, secure_addr=None, log=None):
         self.selector = selectors.DefaultSelector()
         self.log = log
+        # Per-packet debug logs are skipped altogether unless they are written somewhere
+        self._trace = is_debug_enabled(log)
         self._host = '127.0.0.1'
         self._port = self._get_random_unused_port()
 
@@ -102,7 +107,9 @@ class Mediator(object):
                                              bytes_transferred=0,
                                              addr=self._secure_addr)
 
-        # Register Inbound connection
+        # Register Inbound connection, Non blocking too: TLS records that carry no data (e.g. session tickets) make
+        # the socket readable, and a blocking read would wait for the next data record
+        self._secure_connection.setblocking(False)
         self.selector.register(fileobj=self._secure_connection, events=events, data=inbound_data)
 
     def service_connection(self, key, mask) -> None:
@@ -110,24 +117,35 @@ class Mediator(object):
         data = key.data
 
         if mask & selectors.EVENT_READ:
-            recv_data = sock.recv(1024)  # Should be ready to read
+            try:
+                recv_data = sock.recv(1024)  # Should be ready to read
+
+                # TLS decrypts whole records: the rest of one sits in the SSL buffer, where the selector can't see it
+                pending = getattr(sock, 'pending', None)
+                while recv_data and pending and pending():
+                    recv_data += sock.recv(pending())
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                # Only TLS protocol data was read
+                recv_data = None
 
             if recv_data:
                 # Inbound data: Receive on Local unsecure endpoint and send to Remote Secure endpoint
                 # So Recv first and store in outbound buffer
                 if not data.is_secure:
-                    self.log.debug("Reading from ADB-Client...")
+                    if self._trace:
+                        self.log.debug("Reading from ADB-Client...")
                     self._outbound_data += recv_data
 
                 # Outbound data: Receive on Remote Secure endpoint and send to Local unsecure endpoint
                 # So Recv first and store in inbound buffer
                 else:
-                    self.log.debug("Reading from TCP Relay...")
+                    if self._trace:
+                        self.log.debug("Reading from TCP Relay...")
                     self._inbound_data += recv_data
 
                 data.bytes_transferred += len(recv_data)
 
-            else:
+            elif recv_data is not None:
                 if self.log:
                     self.log.debug(f"Closing connection to {data.addr[0]}:{data.addr[1]}")
 
@@ -136,14 +154,18 @@ class Mediator(object):
         if mask & selectors.EVENT_WRITE:
             try:
                 if not data.is_secure:
-                    self.log.debug("Sending to ADB-Client...")
+                    if self._trace:
+                        self.log.debug("Sending to ADB-Client...")
                     sent = sock.send(self._inbound_data)  # Should be ready to write
                     self._inbound_data = self._inbound_data[sent:]
 
                 else:
-                    self.log.debug("Sending to TCP relay...")
+                    if self._trace:
+                        self.log.debug("Sending to TCP relay...")
                     sent = sock.send(self._outbound_data)  # Should be ready to write
                     self._outbound_data = self._outbound_data[sent:]
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                pass
             except OSError:
                 raise MediatorShutdown("Shutdown initiated from EVENT_WRITE")
 
@@ -164,6 +186,16 @@ class Mediator(object):
                 self.log.info("Caught keyboard interrupt, exiting...")
 
         except MediatorShutdown as mexc:
+            # Deliver what was read from one end before the other closed
+            for sock, pending in ((self._insecure_connection, self._inbound_data),
+                                  (self._secure_connection, self._outbound_data)):
+                if sock and pending:
+                    try:
+                        sock.setblocking(True)
+                        sock.sendall(pending)
+                    except OSError:
+                        pass
+
             for index, sock in enumerate([self._insecure_connection, self._secure_connection]):
                 try:
                     self.log.debug(f"Closing socket #{index + 1}...")
@@ -1,4 +1,4 @@
-import requests
+from esper.ext.api_client import get_session, get_api_host
 
 
 class APIException(Exception):
@@ -18,7 +18,7 @@ def get_pipeline_url(environment: str,
     :return: Url
     """
 
-    url = f'https://{environment}-api.esper.cloud/api/v1/enterprise/{enterprise_id}/pipeline/'
+    url = f'{get_api_host(environment)}/api/v1/enterprise/{enterprise_id}/pipeline/'
 
     if pipeline_id:
         url += f'{pipeline_id}/'
@@ -41,7 +41,7 @@ def get_pipeline_execute_url(environment: str,
     :return: Url
     """
 
-    url = f'https://{environment}-api.esper.cloud/api/v1/enterprise/{enterprise_id}/pipeline/{pipeline_id}/execute/'
+    url = f'{get_api_host(environment)}/api/v1/enterprise/{enterprise_id}/pipeline/{pipeline_id}/execute/'
 
     if execute_id:
         url = f"{url}{execute_id}/"
@@ -111,7 +111,7 @@ def get_group_command_url(environment: str,
     :param group_id:
     :return: Url
     """
-    url = f'https://{environment}-api.esper.cloud/api/enterprise/{enterprise_id}/devicegroup/{group_id}/command/'
+    url = f'{get_api_host(environment)}/api/enterprise/{enterprise_id}/devicegroup/{group_id}/command/'
     return url
 
 
@@ -124,7 +124,7 @@ def create_pipeline(url, api_key, pipeline_name, pipeline_desc=None, trigger=Non
         if trigger:
             data["trigger"] = trigger
 
-        response = requests.post(
+        response = get_session().post(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -144,7 +144,7 @@ def create_stage(url, api_key, stage_name, stage_order, stage_desc=None):
         if stage_desc:
             data["description"] = stage_desc
 
-        response = requests.post(
+        response = get_session().post(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -158,6 +158,27 @@ def create_stage(url, api_key, stage_name, stage_order, stage_desc=None):
     return response
 
 
+def group_command_args(api_key, operation_action, group_url):
+    """Action arguments of an operation that fires a group command"""
+    if operation_action == "APP_INSTALL":
+        command = "INSTALL"
+    if operation_action == "APP_UNINSTALL":
+        command = "UNINSTALL"
+    if operation_action == "REBOOT":
+        command = "REBOOT"
+
+    return {
+        "method": "POST",
+        "url": group_url,
+        "body": {
+            "command": command,
+        },
+        "headers": {
+            'Authorization': f'Bearer {api_key}'
+        }
+    }
+
+
 def create_operation(url, api_key, operation_name, operation_action, operation_desc=None, group_url=None):
     try:
         data = {
@@ -168,26 +189,9 @@ def create_operation(url, api_key, operation_name, operation_action, operation_d
             data["description"] = operation_desc
 
         if group_url:
+            data["action_args"] = group_command_args(api_key, operation_action, group_url)
 
-            if operation_action == "APP_INSTALL":
-                command = "INSTALL"
-            if operation_action == "APP_UNINSTALL":
-                command = "UNINSTALL"
-            if operation_action == "REBOOT":
-                command = "REBOOT"
-
-            data["action_args"] = {
-                "method": "POST",
-                "url": group_url,
-                "body": {
-                    "command": command,
-                },
-                "headers": {
-                    'Authorization': f'Bearer {api_key}'
-                }
-            }
-
-        response = requests.post(
+        response = get_session().post(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -208,8 +212,10 @@ def edit_pipeline(url, api_key, pipeline_name=None, pipeline_desc=None, trigger=
             data["name"] = pipeline_name
         if pipeline_desc:
             data["description"] = pipeline_desc
+        if trigger:
+            data["trigger"] = trigger
 
-        response = requests.patch(
+        response = get_session().patch(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -233,7 +239,7 @@ def edit_stage(url, api_key, stage_name=None, stage_order=None, stage_desc=None)
         if stage_desc:
             data["description"] = stage_desc
 
-        response = requests.patch(
+        response = get_session().patch(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -247,7 +253,7 @@ def edit_stage(url, api_key, stage_name=None, stage_order=None, stage_desc=None)
     return response
 
 
-def edit_operation(url, api_key, operation_name=None, operation_action=None, operation_desc=None):
+def edit_operation(url, api_key, operation_name=None, operation_action=None, operation_desc=None, group_url=None):
     try:
         data = {}
         if operation_name:
@@ -256,13 +262,15 @@ def edit_operation(url, api_key, operation_name=None, operation_action=None, ope
             data["action"] = operation_action
         if operation_desc:
             data["description"] = operation_desc
+        if group_url and operation_action:
+            data["action_args"] = group_command_args(api_key, operation_action, group_url)
 
-        response = requests.patch(
+        response = get_session().patch(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
             },
-            data=data
+            json=data
         )
 
     except Exception as exc:
@@ -271,10 +279,11 @@ def edit_operation(url, api_key, operation_name=None, operation_action=None, ope
     return response
 
 
-def list_pipelines(url, api_key):
+def list_pipelines(url, api_key, params=None):
     try:
-        response = requests.get(
+        response = get_session().get(
             url,
+            params=params,
             headers={
                 'Authorization': f'Bearer {api_key}'
             }
@@ -288,7 +297,7 @@ def list_pipelines(url, api_key):
 
 def list_stages(url, api_key):
     try:
-        response = requests.get(
+        response = get_session().get(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -303,7 +312,7 @@ def list_stages(url, api_key):
 
 def fetch_pipelines(url, api_key):
     try:
-        response = requests.get(
+        response = get_session().get(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -318,7 +327,7 @@ def fetch_pipelines(url, api_key):
 
 def fetch_stages(url, api_key):
     try:
-        response = requests.get(
+        response = get_session().get(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -333,7 +342,7 @@ def fetch_stages(url, api_key):
 
 def delete_api(url, api_key):
     try:
-        response = requests.delete(
+        response = get_session().delete(
             url,
             headers={
                 'Authorization': f'Bearer {api_key}'
@@ -361,7 +370,7 @@ def render_single_dict(data):
 
 def execute_pipeline(url, api_key, data=None):
     try:
-        response = requests.post(
+        response = get_session().post(
             url,
             data=data,
             headers={
@@ -376,7 +385,7 @@ def execute_pipeline(url, api_key, data=None):
 
 def list_execute_pipeline(url, api_key, params=None):
     try:
-        response = requests.get(
+        response = get_session().get(
             url,
             params=params,
             headers={
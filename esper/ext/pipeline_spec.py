@@ -0,0 +1,221 @@
+import sys
+from typing import Iterable, List, Optional
+
+import yaml
+
+NEW_APP_VERSION_EVENT = 'NewAppVersionEvent'
+
+# Changes run in phases; the changes of one phase are independent of each other and are sent concurrently.
+# 0: the pipeline itself, stages need its id
+# 1: deleted stages, operations of kept stages, and kept stages moving to a temporary ordering
+# 2: created stages and kept stages with their final ordering
+# 3: operations of created stages
+PHASES = 4
+
+
+class SpecError(Exception):
+    pass
+
+
+class Change(object):
+    """One API call of a pipeline apply"""
+
+    def __init__(self, phase: int, action: str, kind: str, name: str, id: str = None, stage: str = None,
+                 data: dict = None):
+        """
+        :param phase: Phase the change runs in, see PHASES
+        :param action: create, update or delete
+        :param kind: pipeline, stage or operation
+        :param name: Name of the pipeline, stage or operation
+        :param id: Id of an existing object
+        :param stage: Stage name of an operation
+        :param data: Fields to send
+        """
+        self.phase = phase
+        self.action = action
+        self.kind = kind
+        self.name = name
+        self.id = id
+        self.stage = stage
+        self.data = data or {}
+
+    def __repr__(self):
+        return f'Change({self.action} {self.kind} {self.name!r})'
+
+
+def _require(value, message):
+    if not value:
+        raise SpecError(message)
+    return value
+
+
+def _unique_names(items: Iterable[dict], what: str) -> None:
+    names = [item['name'] for item in items]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise SpecError(f"{what} names must be unique: {', '.join(duplicates)}")
+
+
+def normalize_trigger(trigger) -> Optional[dict]:
+    """
+    Trigger of a spec, either in the API's form or as the pre-conditions of a new app version trigger
+    (`application_name`, `package_name`)
+    """
+    if not trigger:
+        return None
+    if not isinstance(trigger, dict):
+        raise SpecError('trigger must be a mapping')
+    if 'trigger_event' in trigger:
+        return trigger
+    return {'trigger_event': NEW_APP_VERSION_EVENT, 'pre_conditions': dict(trigger)}
+
+
+def load_spec(path: str, actions: Iterable[str]) -> dict:
+    """
+    Read and validate a pipeline spec:
+
+        name: Kiosk rollout
+        description: Optional
+        trigger: {application_name: Kiosk, package_name: io.esper.kiosk}
+        stages:
+          - name: Canary
+            operations:
+              - name: Install
+                action: APP_INSTALL
+                group: Canary devices
+
+    Stages run in the order they are listed; names identify stages within the pipeline and operations within
+    a stage.
+    :param path: YAML file, '-' for stdin
+    :param actions: Valid operation actions
+    :return: Spec with every stage's `ordering` set
+    """
+    try:
+        if path == '-':
+            spec = yaml.safe_load(sys.stdin)
+        else:
+            with open(path) as f:
+                spec = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise SpecError(f'Invalid YAML: {e}')
+
+    if not isinstance(spec, dict):
+        raise SpecError('The spec must be a mapping with a pipeline name and stages')
+
+    _require(spec.get('name'), 'The pipeline needs a name')
+    spec['trigger'] = normalize_trigger(spec.get('trigger'))
+
+    stages = spec.setdefault('stages', []) or []
+    spec['stages'] = stages
+    for ordering, stage in enumerate(stages, start=1):
+        _require(isinstance(stage, dict) and stage.get('name'), f'Stage {ordering} needs a name')
+        stage['ordering'] = ordering
+
+        operations = stage.setdefault('operations', []) or []
+        stage['operations'] = operations
+        for operation in operations:
+            _require(isinstance(operation, dict) and operation.get('name'),
+                     f"Every operation of stage {stage['name']!r} needs a name")
+            if operation.get('action') not in actions:
+                raise SpecError(f"Operation {operation['name']!r} of stage {stage['name']!r} needs an action, "
+                                f"one of {', '.join(actions)}")
+        _unique_names(operations, f"Operation (stage {stage['name']!r})")
+    _unique_names(stages, 'Stage')
+
+    return spec
+
+
+def spec_groups(spec: dict) -> List[str]:
+    """Names of the groups the operations of a spec fire commands at"""
+    return list(dict.fromkeys(operation['group'] for stage in spec['stages'] for operation in stage['operations']
+                              if operation.get('group')))
+
+
+def _changed(desired: dict, current: dict, keys: Iterable[str]) -> dict:
+    """Keys of `desired` that are set and differ from `current`"""
+    return {key: desired[key] for key in keys if desired.get(key) is not None and desired[key] != current.get(key)}
+
+
+def _operation_changes(phase: int, stage: dict, current: dict, group_urls: dict) -> list:
+    changes = []
+    existing = {operation['name']: operation for operation in current.get('operations') or []}
+    for operation in stage['operations']:
+        desired = {key: operation.get(key) for key in ('name', 'description', 'action')}
+        group_url = group_urls.get(operation.get('group'))
+
+        found = existing.pop(operation['name'], None)
+        if found is None:
+            changes.append(Change(phase, 'create', 'operation', operation['name'], stage=stage['name'],
+                                  data=dict(desired, group_url=group_url)))
+            continue
+
+        data = _changed(desired, found, ('description', 'action'))
+        current_url = (found.get('action_args') or {}).get('url')
+        # The action arguments carry the group command, so they are rebuilt whenever the action or group changes
+        if (group_url and group_url != current_url) or ('action' in data and (group_url or current_url)):
+            data['group_url'] = group_url or current_url
+            data.setdefault('action', operation['action'])
+        if data:
+            changes.append(Change(phase, 'update', 'operation', operation['name'], id=found['id'],
+                                  stage=stage['name'], data=data))
+
+    for name, operation in existing.items():
+        changes.append(Change(phase, 'delete', 'operation', name, id=operation['id'], stage=stage['name']))
+
+    return changes
+
+
+def diff_pipeline(spec: dict, current: Optional[dict], group_urls: dict) -> List[Change]:
+    """
+    Minimal changes that turn the current pipeline into the spec
+    :param spec: Spec from `load_spec`
+    :param current: Current pipeline with its stages and their operations, None if it does not exist yet
+    :param group_urls: Group command URL by group name
+    :return: Changes, sorted by phase
+    """
+    changes = []
+    current = current or {}
+
+    if not current:
+        changes.append(Change(0, 'create', 'pipeline', spec['name'],
+                              data={'name': spec['name'], 'description': spec.get('description'),
+                                    'trigger': spec.get('trigger')}))
+    else:
+        data = _changed(spec, current, ('name', 'description', 'trigger'))
+        if data:
+            changes.append(Change(0, 'update', 'pipeline', spec['name'], id=current['id'], data=data))
+
+    existing = {stage['name']: stage for stage in current.get('stages') or []}
+    kept = [(stage, existing[stage['name']]) for stage in spec['stages'] if stage['name'] in existing]
+    removed = [stage for name, stage in existing.items() if name not in {s['name'] for s in spec['stages']}]
+
+    # Orderings are unique within a pipeline: stages that move park on free orderings first, so that no
+    # update or create has to wait for another one to vacate its place
+    moved = {stage['name']: found for stage, found in kept if int(found.get('ordering') or 0) != stage['ordering']}
+    parking = max([int(s.get('ordering') or 0) for s in existing.values()] + [len(spec['stages'])])
+
+    for stage in removed:
+        changes.append(Change(1, 'delete', 'stage', stage['name'], id=stage['id']))
+
+    for stage, found in kept:
+        if stage['name'] not in moved:
+            continue
+        changes.append(Change(1, 'update', 'stage', stage['name'], id=found['id'],
+                              data={'ordering': parking + stage['ordering']}))
+
+    for stage, found in kept:
+        data = _changed(stage, found, ('description', 'ordering'))
+        if stage['name'] in moved:
+            data['ordering'] = stage['ordering']
+        if data:
+            changes.append(Change(2, 'update', 'stage', stage['name'], id=found['id'], data=data))
+        changes.extend(_operation_changes(1, stage, found, group_urls))
+
+    for stage in spec['stages']:
+        if stage['name'] not in existing:
+            changes.append(Change(2, 'create', 'stage', stage['name'],
+                                  data={'name': stage['name'], 'ordering': stage['ordering'],
+                                        'description': stage.get('description')}))
+            changes.extend(_operation_changes(3, stage, {}, group_urls))
+
+    return sorted(changes, key=lambda change: change.phase)
@@ -0,0 +1,126 @@
+import time
+from typing import Optional
+
+# Command state buckets reported in group command `details`. Devices that acknowledged or were sent the
+# command, or whose delivery timed out and will be retried, are all still in progress.
+IN_PROGRESS_DETAILS = ('acknowledge', 'initiate', 'in_progress', 'timeout')
+FINAL_DETAILS = ('success', 'failed', 'inactive')
+
+# Pipeline execution states that end a watch. A stopped execution waits for `pipeline execute continue`.
+EXECUTION_FAILED_STATES = ('FAILED', 'TERMINATED')
+EXECUTION_FAILED_STATUSES = ('FAILURE', 'FAILED')
+
+
+class AdaptivePoller(object):
+    """
+    Sleep between polls of a long running operation. The first polls are quick so short operations return
+    promptly, then the interval grows geometrically up to `maximum` while nothing changes. Whenever a poll
+    sees progress the interval shrinks again, so an active rollout is followed closely and an idle one costs
+    few requests.
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 8.0, factor: float = 1.5,
+                 timeout: Optional[float] = None):
+        """
+        :param initial: First and smallest interval, in seconds
+        :param maximum: Largest interval, in seconds
+        :param factor: Growth of the interval after a poll without progress
+        :param timeout: Seconds from now after which `wait` gives up, None to wait forever
+        """
+        self.initial = initial
+        self.maximum = max(initial, maximum)
+        self.factor = factor
+        self.interval = initial
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def next_interval(self, changed: bool) -> float:
+        """
+        Interval before the next poll
+        :param changed: Whether the last poll saw any progress
+        """
+        interval = self.interval
+        if changed:
+            self.interval = max(self.initial, self.interval / self.factor)
+        else:
+            self.interval = min(self.maximum, self.interval * self.factor)
+        return interval
+
+    def wait(self, changed: bool = False) -> bool:
+        """
+        Sleep until the next poll is due
+        :param changed: Whether the last poll saw any progress
+        :return: False when the timeout has passed and polling should stop
+        """
+        interval = self.next_interval(changed)
+        remaining = self.remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                return False
+            interval = min(interval, remaining)
+
+        time.sleep(interval)
+        return True
+
+
+def group_command_states(details: Optional[dict]) -> dict:
+    """
+    Flatten the `details` of a group command into a state per device
+    :param details: Parsed `details` of a group command
+    :return: Device name to one of success, failed, inactive or in_progress
+    """
+    states = {}
+    if not details:
+        return states
+
+    for key in IN_PROGRESS_DETAILS:
+        for device in details.get(key) or []:
+            states[device.get('name')] = 'in_progress'
+
+    for key in FINAL_DETAILS:
+        for device in details.get(key) or []:
+            states[device.get('name')] = key
+
+    return states
+
+
+def execution_states(execution: dict) -> dict:
+    """
+    Flatten a pipeline execution into a state per part: the execution itself, each stage run and, when the
+    server reports them, each operation run of a stage
+    :param execution: Execution as returned by the API
+    :return: Part name ('stage <name>', 'operation <stage>/<name>' or 'execution') to state, in stage order with
+        the execution last
+    """
+    states = {}
+    stage_runs = sorted(execution.get('stage_runs') or [], key=lambda run: run.get('ordering') or 0)
+    for stage_run in stage_runs:
+        stage = stage_run.get('name') or stage_run.get('stage')
+        states[f'stage {stage}'] = stage_run.get('state')
+        for operation_run in stage_run.get('operation_runs') or []:
+            operation = operation_run.get('name') or operation_run.get('operation')
+            states[f'operation {stage}/{operation}'] = operation_run.get('state')
+
+    states['execution'] = execution.get('state')
+    return states
+
+
+def execution_outcome(execution: dict) -> Optional[str]:
+    """
+    :param execution: Execution as returned by the API
+    :return: success, failed or stopped once the execution no longer runs, None while it does
+    """
+    state = (execution.get('state') or '').upper()
+    status = (execution.get('status') or '').upper()
+
+    if state in EXECUTION_FAILED_STATES:
+        return 'failed'
+    if state == 'STOPPED':
+        return 'stopped'
+    if state == 'COMPLETED':
+        return 'failed' if status in EXECUTION_FAILED_STATUSES else 'success'
+    return None
@@ -1,10 +1,40 @@
 import random
 import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
-from typing import Tuple
+from typing import Callable, Tuple
 
 from esper.ext.forwarder import TCPForwarder
 
+RELAY_MODES = ('bulk', 'latency')
+
+# Bytes read at a time: a TLS record carries up to 16 KB, and recv returns what is available without waiting for more,
+# so large reads cost small packets nothing and save push/pull many syscalls
+CHUNK_SIZE = 64 * 1024
+
+# Socket buffers of the local ADB client leg in latency mode. Loopback runs at full speed with small buffers, and small
+# buffers keep keystrokes from queueing behind bulk data. The relay leg keeps the kernel's auto-tuned buffers, which
+# push/pull need over long round trips.
+LATENCY_BUFFER_SIZE = 128 * 1024
+
+
+def tune_socket(sock: socket.socket, mode: str, buffer_size: int = None) -> None:
+    """
+    Apply the socket settings of a relay mode to one leg of the relay
+    :param sock: Connected socket
+    :param mode: bulk keeps the kernel defaults; latency disables Nagle's algorithm, so that small writes are sent at
+    once instead of waiting for the ACK of the previous one
+    :param buffer_size: SO_SNDBUF/SO_RCVBUF in latency mode, None to keep the kernel's
+    """
+    if mode != 'latency':
+        return
+
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if buffer_size:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+
 
 class Relay(object):
     """
@@ -35,12 +65,17 @@ class Relay(object):
     def __init__(self,
                  relay_conn: socket.socket = None,
                  relay_addr: Tuple[str, int] = (None, None),
-                 log: Logger = None):
+                 log: Logger = None,
+                 mode: str = 'bulk'):
 
         self.log = log
+        self.mode = mode
         self.outbound_conn = relay_conn
         self.outbound_addr = relay_addr
 
+        if relay_conn:
+            tune_socket(relay_conn, mode)
+
         self.setup_listener()
 
     def get_listener_address(self) -> Tuple[str, int]:
@@ -71,11 +106,19 @@ class Relay(object):
         self.log.debug(f"Closing Listener on Port : {self.listener_port}")
         self._listener_server.close()
 
+        tune_socket(conn, self.mode, LATENCY_BUFFER_SIZE)
+        self.log.debug(f"Relay mode: {self.mode}")
+
         self.inbound_conn = conn
         self.inbound_addr = addr
 
         return conn, addr
 
+    @property
+    def directions(self) -> dict:
+        """Forwarder of each direction, None until the relay has started"""
+        return {'to_device': self.forward, 'from_device': self.reverse}
+
     def gather_metrics(self):
         metrics = {
             "started": None,
@@ -110,11 +153,13 @@ class Relay(object):
 
         # Starting forward traffic
         self.forward = TCPForwarder(inbound_conn=self.inbound_conn, inbound_address=self.inbound_addr,
-                                    outbound_conn=self.outbound_conn, outbound_address=self.outbound_addr, log=self.log)
+                                    outbound_conn=self.outbound_conn, outbound_address=self.outbound_addr, log=self.log,
+                                    bufsize=CHUNK_SIZE)
 
         # Starting reverse traffic
         self.reverse = TCPForwarder(inbound_conn=self.outbound_conn, inbound_address=self.outbound_addr,
-                                    outbound_conn=self.inbound_conn, outbound_address=self.inbound_addr, log=self.log)
+                                    outbound_conn=self.inbound_conn, outbound_address=self.inbound_addr, log=self.log,
+                                    bufsize=CHUNK_SIZE)
 
         self.forward.start()
         self.reverse.start()
@@ -160,3 +205,122 @@ class Relay(object):
             self.gather_metrics()
 
             self.cleanup_connections()
+
+
+class ReconnectingRelay(Relay):
+    """
+    A Local TCP relay that outlives its TCP relay connections. The listener keeps its port for the whole run, and
+    whenever a session ends (the TLS relay connection dropped, or the ADB client disconnected), a new relay connection
+    is negotiated in the background, so that the ADB client can reconnect to the same endpoint.
+    """
+
+    # Accept polls at this interval, to notice stop_relay
+    accept_interval = 1
+
+    # Seconds between negotiation attempts, doubling up to the maximum
+    retry_delay = 1.0
+    max_retry_delay = 30.0
+
+    def __init__(self,
+                 negotiate: Callable[[], socket.socket],
+                 relay_conn: socket.socket = None,
+                 log: Logger = None,
+                 mode: str = 'bulk'):
+        """
+        :param negotiate: Returns a new connection to the TCP relay, raises if it cannot
+        :param relay_conn: Connection of the first session, negotiated by the caller
+        """
+        self.negotiate = negotiate
+        self.sessions = 0
+        self._stopping = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Relay negotiation')
+        self._next = None
+
+        super(ReconnectingRelay, self).__init__(relay_conn=relay_conn,
+                                                relay_addr=relay_conn.getsockname() if relay_conn else (None, None),
+                                                log=log, mode=mode)
+
+    def _negotiate(self):
+        delay = self.retry_delay
+        while not self._stopping.is_set():
+            try:
+                conn = self.negotiate()
+                tune_socket(conn, self.mode)
+                return conn
+            except Exception as exc:
+                self.log.warning(f"Failed to reconnect to the TCP relay, retrying in {delay:.0f}s: {exc}")
+                self._stopping.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def accept_connection(self) -> Tuple[socket.socket, Tuple[str, int]]:
+        # Unlike Relay, keep the listener open for the next session
+        self._listener_server.settimeout(self.accept_interval)
+        while True:
+            if self._stopping.is_set():
+                return None, None
+            try:
+                conn, addr = self._listener_server.accept()
+                break
+            except socket.timeout:
+                continue
+            except OSError:
+                # The listener was closed by stop_relay
+                if self._stopping.is_set():
+                    return None, None
+                raise
+
+        self.log.debug(f"Connection accepted from ADB Client: {addr[0]}:{addr[1]}")
+        tune_socket(conn, self.mode, LATENCY_BUFFER_SIZE)
+
+        self.inbound_conn = conn
+        self.inbound_addr = addr
+        return conn, addr
+
+    def serve_forever(self) -> None:
+        """Relay one session after the other, until stop_relay"""
+        if self.outbound_conn is None:
+            self._next = self._executor.submit(self._negotiate)
+
+        while not self._stopping.is_set():
+            conn, _ = self.accept_connection()
+            if conn is None:
+                break
+
+            if self.outbound_conn is None:
+                self.log.info("Waiting for the TCP relay connection...")
+                self.outbound_conn = self._next.result()
+                if self.outbound_conn is None:
+                    break
+                self.outbound_addr = self.outbound_conn.getsockname()
+
+            self.sessions += 1
+            self.log.debug(f"Relay session #{self.sessions} started")
+            self.start_relay()
+            self.cleanup_connections()
+            self.outbound_conn = None
+
+            if not self._stopping.is_set():
+                self.log.info(f"Relay session #{self.sessions} ended, reconnecting. "
+                              f"ADB clients can reconnect to {self.listener_host}:{self.listener_port}")
+                self._next = self._executor.submit(self._negotiate)
+
+    def stop_relay(self):
+        self._stopping.set()
+        super(ReconnectingRelay, self).stop_relay()
+
+        self._listener_server.close()
+        if self._next is not None:
+            # A negotiation still queued never starts; one in progress stops retrying, and whatever it negotiates
+            # is closed once it ends
+            self._next.cancel()
+            self._next.add_done_callback(self._close_unused)
+        self._executor.shutdown(wait=False)
+
+    def _close_unused(self, future) -> None:
+        """Close a connection negotiated for a session that will not come"""
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        conn = future.result()
+        if conn is not None and conn is not self.outbound_conn:
+            conn.close()
@@ -0,0 +1,230 @@
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, TextIO
+
+from cement.utils import fs
+
+COUNTERS = ('bytes', 'packets', 'stalls', 'stalled_seconds')
+DIRECTION_LABELS = {'to_device': 'up', 'from_device': 'down'}
+
+
+def send_queue(sock: socket.socket) -> Optional[int]:
+    """
+    Bytes written to a socket that the peer has not acknowledged yet (Linux only)
+    :return: Queue size, None where the platform does not report it
+    """
+    try:
+        import fcntl
+        import termios
+        return struct.unpack('i', fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, b'\0' * 4))[0]
+    except (ImportError, AttributeError, OSError, ValueError):
+        return None
+
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024.0
+    return f'{size:.1f} GB'
+
+
+class RelayStats(object):
+    """
+    Live per-direction counters of a relay session. Every `sample` adds the throughput since the previous sample and
+    keeps its peak, next to the forwarder totals and how much data is buffered on the way.
+    """
+
+    def __init__(self, relay):
+        self.relay = relay
+        self.started = time.time()
+        self._previous = {}
+        self._peaks = {}
+        self._lock = threading.Lock()
+        self.latest = self._empty()
+
+    def _empty(self) -> dict:
+        return {'uptime': 0.0, 'directions': {
+            name: dict({counter: 0 for counter in COUNTERS}, throughput=0.0, peak_throughput=0.0, in_flight=0,
+                       send_queue=None)
+            for name in DIRECTION_LABELS}}
+
+    def sample(self) -> dict:
+        """
+        :return: Sample with `uptime` and, per direction, the counters, `throughput` and `peak_throughput` in bytes
+        per second, `in_flight` bytes and the kernel `send_queue` of the outbound socket
+        """
+        now = time.perf_counter()
+        sample = self._empty()
+        sample['uptime'] = round(time.time() - self.started, 3)
+
+        with self._lock:
+            for name, forwarder in self.relay.directions.items():
+                if forwarder is None:
+                    continue
+
+                stats = sample['directions'][name]
+                for counter in COUNTERS:
+                    stats[counter] = getattr(forwarder, counter)
+                stats['in_flight'] = forwarder.in_flight
+                stats['send_queue'] = send_queue(forwarder.outbound_connection.connection)
+
+                previous = self._previous.get(name)
+                if previous and now > previous[0]:
+                    # Counters start over with every session of a reconnecting relay
+                    relayed = stats['bytes'] - previous[1] if stats['bytes'] >= previous[1] else stats['bytes']
+                    stats['throughput'] = relayed / (now - previous[0])
+                self._previous[name] = (now, stats['bytes'])
+                self._peaks[name] = stats['peak_throughput'] = max(self._peaks.get(name, 0.0), stats['throughput'])
+
+            self.latest = sample
+        return sample
+
+    @staticmethod
+    def status_line(sample: dict) -> str:
+        parts = []
+        for name, label in DIRECTION_LABELS.items():
+            stats = sample['directions'][name]
+            queued = stats['in_flight'] + (stats['send_queue'] or 0)
+            parts.append(f"{label} {format_bytes(stats['throughput'])}/s (peak {format_bytes(stats['peak_throughput'])}/s) "
+                         f"{format_bytes(stats['bytes'])} {stats['packets']} pkts, "
+                         f"queued {format_bytes(queued)}, stalls {stats['stalls']}")
+        return ' | '.join(parts)
+
+    @staticmethod
+    def prometheus(sample: dict) -> str:
+        """Sample in the Prometheus text exposition format"""
+        metrics = (
+            ('bytes_total', 'counter', 'bytes', 'Bytes relayed'),
+            ('packets_total', 'counter', 'packets', 'Chunks relayed'),
+            ('stalls_total', 'counter', 'stalls', 'Writes blocked by backpressure'),
+            ('stalled_seconds_total', 'counter', 'stalled_seconds', 'Time writes were blocked by backpressure'),
+            ('throughput_bytes_per_second', 'gauge', 'throughput', 'Throughput since the previous sample'),
+            ('peak_throughput_bytes_per_second', 'gauge', 'peak_throughput', 'Highest sampled throughput'),
+            ('in_flight_bytes', 'gauge', 'in_flight', 'Bytes read but not written yet'),
+            ('send_queue_bytes', 'gauge', 'send_queue', 'Bytes written but not acknowledged by the peer'),
+        )
+
+        lines = []
+        for name, kind, key, description in metrics:
+            lines.append(f'# HELP espercli_relay_{name} {description}')
+            lines.append(f'# TYPE espercli_relay_{name} {kind}')
+            for direction, stats in sample['directions'].items():
+                if stats[key] is not None:
+                    lines.append(f'espercli_relay_{name}{{direction="{direction}"}} {stats[key]}')
+
+        lines.append('# HELP espercli_relay_uptime_seconds Time since the session started')
+        lines.append('# TYPE espercli_relay_uptime_seconds gauge')
+        lines.append(f"espercli_relay_uptime_seconds {sample['uptime']}")
+        return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path: str, content: str) -> None:
+    """Replace a file atomically, so that a collector never reads half of it"""
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+class StatsReporter(threading.Thread):
+    """
+    Samples a relay session periodically, and publishes every sample on a stderr status line, to a Prometheus
+    textfile and on a local HTTP endpoint, each one optional:
+
+        GET /         sample as JSON
+        GET /metrics  sample in the Prometheus text format
+    """
+
+    def __init__(self, relay, interval: float = 1.0, status: bool = False, textfile: str = None, port: int = None,
+                 stream: TextIO = None):
+        super(StatsReporter, self).__init__(name='Relay stats', daemon=True)
+        self.stats = RelayStats(relay)
+        self.interval = interval
+        self.status = status
+        self.textfile = fs.abspath(textfile) if textfile else None
+        self.stream = stream or sys.stderr
+        self.server = self._serve(port) if port is not None else None
+        self._done = threading.Event()
+
+        if self.textfile:
+            fs.ensure_parent_dir_exists(self.textfile)
+
+    @property
+    def address(self):
+        """Host and port of the stats endpoint, None without one"""
+        return self.server.server_address if self.server else None
+
+    def _serve(self, port: int) -> ThreadingHTTPServer:
+        stats = self.stats
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = RelayStats.prometheus(stats.latest), 'text/plain; version=0.0.4'
+                elif self.path == '/':
+                    body, content_type = json.dumps(stats.latest), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+
+                body = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='Relay stats endpoint', daemon=True).start()
+        return server
+
+    def publish(self) -> dict:
+        sample = self.stats.sample()
+
+        if self.status:
+            line = RelayStats.status_line(sample)
+            if self.stream.isatty():
+                self.stream.write(f'\r\033[K{line}')
+            else:
+                self.stream.write(f'{line}\n')
+            self.stream.flush()
+
+        if self.textfile:
+            try:
+                write_textfile(self.textfile, RelayStats.prometheus(sample))
+            except OSError:
+                pass
+
+        return sample
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.publish()
+
+    def stop(self) -> dict:
+        """Stop reporting, after publishing the final sample"""
+        self._done.set()
+        if self.is_alive():
+            self.join(timeout=self.interval + 1)
+
+        sample = self.publish()
+        if self.status and self.stream.isatty():
+            self.stream.write('\n')
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        return sample
@@ -2,7 +2,7 @@ import time
 from logging import Logger
 from typing import Tuple
 
-import requests
+from esper.ext.api_client import get_session, get_api_host
 
 
 class RemoteADBError(Exception):
@@ -23,7 +23,7 @@ def get_remoteadb_url(environment: str,
     :return:
     """
 
-    host = f'https://{environment}-api.esper.cloud'
+    host = get_api_host(environment)
     url = f'{host}/api/v0/enterprise/{enterprise_id}/device/{device_id}/remoteadb/'
 
     if remoteadb_id:
@@ -58,7 +58,7 @@ def get_remoteadb_connection_details(environment: str,
     if log:
         log.debug("[remoteadb-connect] Fetching remoteadb session details...")
 
-    response = requests.get(
+    response = get_session().get(
         url,
         headers={
             'Authorization': f'Bearer {api_key}'
@@ -190,7 +190,7 @@ def initiate_remoteadb_connection(environment: str,
     log.debug("Initiating RemoteADB connection...")
     log.debug(f"Creating RemoteADB session at {url}")
 
-    response = requests.post(
+    response = get_session().post(
         url,
         json={
             'client_certificate': client_cert
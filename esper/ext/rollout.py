@@ -0,0 +1,171 @@
+import hashlib
+import math
+from typing import Callable, List
+
+from esper.controllers.enums import DeviceCommandState
+from esper.ext.bulk import run_concurrently
+from esper.ext.polling import AdaptivePoller
+
+DEFAULT_WAVES = '1,10,50,100'
+
+FINAL_STATES = (DeviceCommandState.SUCCESS.value, DeviceCommandState.FAILURE.value,
+                DeviceCommandState.TIMEOUT.value)
+
+
+def parse_waves(value: str) -> List[float]:
+    """
+    Parse cumulative wave sizes such as '1,10,50,100'
+    :param value: Comma separated percentages of the target devices covered once each wave is done
+    :return: Percentages, strictly increasing and within (0, 100]
+    """
+    try:
+        waves = [float(item.strip().rstrip('%')) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise ValueError(f"waves must be comma separated percentages, got '{value}'")
+
+    if not waves:
+        raise ValueError('waves cannot be empty')
+    if any(wave <= 0 or wave > 100 for wave in waves):
+        raise ValueError('waves must be between 0 and 100')
+    if any(later <= earlier for earlier, later in zip(waves, waves[1:])):
+        raise ValueError('waves must be increasing')
+
+    return waves
+
+
+def plan_waves(device_ids: List[str], waves: List[float]) -> List[List[str]]:
+    """
+    Split devices into waves. Devices are ordered by a hash of their id, so a wave is a spread-out sample of
+    the fleet and a re-run of the same rollout picks the same canaries.
+    :param device_ids: Target devices
+    :param waves: Cumulative percentages from `parse_waves`
+    :return: Device ids per wave; every wave has at least one device and empty waves are dropped
+    """
+    ordered = sorted(device_ids, key=lambda device_id: hashlib.sha1(device_id.encode()).hexdigest())
+
+    plan = []
+    start = 0
+    for wave in waves:
+        end = min(len(ordered), max(start + 1, math.ceil(len(ordered) * wave / 100)))
+        if end > start:
+            plan.append(ordered[start:end])
+        start = end
+
+    return plan
+
+
+class WaveResult(object):
+    """Outcome of one wave"""
+
+    def __init__(self, index: int, device_ids: List[str]):
+        self.index = index
+        self.device_ids = device_ids
+        self.commands = {}
+        self.states = {}
+        # Devices the command could not be fired on, with the error
+        self.errors = {}
+
+    def count(self, state: str) -> int:
+        return sum(1 for value in self.states.values() if value == state)
+
+    @property
+    def success(self) -> int:
+        return self.count(DeviceCommandState.SUCCESS.value)
+
+    @property
+    def failed(self) -> int:
+        return (self.count(DeviceCommandState.FAILURE.value) + self.count(DeviceCommandState.TIMEOUT.value) +
+                len(self.errors))
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for value in self.states.values() if value not in FINAL_STATES)
+
+    def to_dict(self) -> dict:
+        return {
+            'wave': self.index,
+            'devices': len(self.device_ids),
+            'success': self.success,
+            'failed': self.failed,
+            'pending': self.pending
+        }
+
+
+class Rollout(object):
+    """
+    Fire a command on waves of devices. Each wave is fired with bounded parallelism, then polled until every
+    command finished or the wave timed out. The rollout halts before the next wave once the failure rate so far
+    is above the threshold; a command still pending when its wave timed out counts as failed, so a wave that
+    never finishes cannot let a larger one start.
+    """
+
+    def __init__(self, fire: Callable[[str], str], poll: Callable[[str, str], str], max_failure_rate: float,
+                 wave_timeout: float, workers: int = None, on_wave: Callable[[WaveResult, float], None] = None):
+        """
+        :param fire: Called with a device id, fires the command and returns its id
+        :param poll: Called with a device id and command id, returns the command state
+        :param max_failure_rate: Highest acceptable fraction of failed commands, 0 to 1
+        :param wave_timeout: Seconds to wait for the commands of a wave to finish
+        :param workers: Requests in flight, defaults to `max_concurrency`
+        :param on_wave: Called with each finished wave and the failure rate so far
+        """
+        self.fire = fire
+        self.poll = poll
+        self.max_failure_rate = max_failure_rate
+        self.wave_timeout = wave_timeout
+        self.workers = workers
+        self.on_wave = on_wave
+
+        self.results = []
+        self.halted = False
+
+    def failure_rate(self) -> float:
+        """Fraction of the devices of the waves so far whose command failed, could not be fired or timed out"""
+        failed = sum(result.failed + result.pending for result in self.results)
+        devices = sum(len(result.device_ids) for result in self.results)
+        return failed / devices if devices else 0.0
+
+    def run_wave(self, result: WaveResult):
+        for device_id, command_id, error in run_concurrently(self.fire, result.device_ids, self.workers):
+            if error is not None:
+                result.errors[device_id] = error
+            else:
+                result.commands[device_id] = command_id
+                result.states[device_id] = DeviceCommandState.INITIATE.value
+
+        poller = AdaptivePoller(timeout=self.wave_timeout)
+        pending = dict(result.commands)
+        changed = False
+        while pending and poller.wait(changed=changed):
+            changed = False
+            for (device_id, command_id), state, error in run_concurrently(lambda item: self.poll(*item),
+                                                                            pending.items(), self.workers):
+                # A failed poll is retried on the next round
+                if error is not None or state == result.states[device_id]:
+                    continue
+
+                result.states[device_id] = state
+                changed = True
+                if state in FINAL_STATES:
+                    del pending[device_id]
+
+    def run(self, plan: List[List[str]]) -> List[WaveResult]:
+        """
+        Run the waves in order
+        :param plan: Device ids per wave, from `plan_waves`
+        :return: Results of the waves that ran; `halted` tells whether the rollout stopped early
+        """
+        for index, device_ids in enumerate(plan, start=1):
+            result = WaveResult(index, device_ids)
+            self.run_wave(result)
+            self.results.append(result)
+
+            rate = self.failure_rate()
+            if self.on_wave:
+                self.on_wave(result, rate)
+
+            if rate > self.max_failure_rate and index < len(plan):
+                self.halted = True
+                break
+
+        return self.results
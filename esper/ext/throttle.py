@@ -0,0 +1,219 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Optional, Tuple
+
+import requests
+import urllib3
+from esperclient.rest import ApiException
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+# Statuses worth another attempt. 429 means the request was rejected before doing anything, so it is
+# retried for every method; the rest only for idempotent ones
+THROTTLED_STATUS = 429
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+TRANSPORT_ERRORS = (urllib3.exceptions.HTTPError, requests.ConnectionError, requests.Timeout, ConnectionError)
+
+
+class ThrottleSettings(object):
+    """Limits shared by every API call of the process, loaded from `esper.yml` by `init_throttle`"""
+
+    def __init__(self):
+        # Requests per second per environment, 0 for no limit
+        self.rate_limit = 0.0
+        self.rate_burst = 10
+        # Requests in flight per environment
+        self.max_concurrency = 8
+        # Extra attempts after the first one
+        self.retries = 3
+        self.backoff_base = 0.5
+        self.backoff_max = 30.0
+
+
+settings = ThrottleSettings()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait according to a `Retry-After` header, which is either a number of seconds or an HTTP date
+    :param value: Header value
+    :return: Seconds, or None if absent or unparseable
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def response_status(outcome) -> Tuple[Optional[int], Optional[float]]:
+    """
+    HTTP status and `Retry-After` of a response or an exception raised while making a request
+    :param outcome: requests Response, esperclient RESTResponse, ApiException or any other exception
+    :return: Status (None for transport errors) and Retry-After seconds
+    """
+    status = getattr(outcome, 'status_code', None) or getattr(outcome, 'status', None)
+    headers = getattr(outcome, 'headers', None)
+
+    retry_after = None
+    if headers is not None:
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+
+    return status or None, retry_after
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket. A rate of 0 disables limiting."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller back for a while, e.g. after the server answered 429"""
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.resume_at - now
+
+                if wait <= 0 and self.rate > 0:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                elif wait <= 0:
+                    return
+
+            time.sleep(wait)
+
+
+class Throttle(object):
+    """Rate limit, concurrency cap and retry policy for one environment"""
+
+    def __init__(self, rate_limit: float, rate_burst: int, max_concurrency: int, retries: int,
+                 backoff_base: float, backoff_max: float):
+        self.bucket = TokenBucket(rate_limit, rate_burst)
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = time.sleep
+
+    @property
+    def retry_budget(self) -> float:
+        """Longest time all retries of a request may wait"""
+        return self.retries * self.backoff_max
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Exponential backoff with full jitter, never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def should_retry(self, method: str, status: Optional[int], error: Optional[Exception], attempt: int) -> bool:
+        if attempt >= self.retries:
+            return False
+
+        if status == THROTTLED_STATUS:
+            return True
+
+        if method.upper() not in IDEMPOTENT_METHODS:
+            return False
+
+        if status in RETRYABLE_STATUSES:
+            return True
+
+        # esperclient reports SSL failures as an ApiException with status 0
+        if isinstance(error, ApiException):
+            return not error.status
+        return isinstance(error, TRANSPORT_ERRORS)
+
+    def call(self, method: str, send: Callable[[], Any], retries: int = None) -> Any:
+        """
+        Make a request through the limiter, retrying transient failures
+        :param method: HTTP method, used to decide whether a failure is safe to retry
+        :param send: Makes one attempt and returns the response, or raises
+        :param retries: Retries of this request instead of the configured ones, 0 when the caller retries itself
+        :return: The response of the last attempt; the exception of the last attempt is re-raised
+        """
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+
+            error = None
+            with self.slots:
+                try:
+                    result = send()
+                except Exception as e:
+                    result, error = None, e
+
+            status, retry_after = response_status(error if error is not None else result)
+            # A server asking for a longer wait than every retry together may take is not retried
+            if attempt >= retries or not self.should_retry(method, status, error, attempt) or \
+                    (retry_after or 0) > self.retry_budget:
+                if error is not None:
+                    raise error
+                return result
+
+            if result is not None and hasattr(result, 'close'):
+                result.close()
+
+            delay = self.backoff(attempt, retry_after)
+            if status == THROTTLED_STATUS:
+                self.bucket.pause(delay)
+
+            attempt += 1
+            self.sleep(delay)
+
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+def get_throttle(host: str) -> Throttle:
+    """
+    Throttle shared by all calls to one API host, i.e. one environment
+    :param host: Network location of the API, e.g. `foo-api.esper.cloud`
+    :return:
+    """
+    with _throttles_lock:
+        if host not in _throttles:
+            _throttles[host] = Throttle(settings.rate_limit, settings.rate_burst, settings.max_concurrency,
+                                        settings.retries, settings.backoff_base, settings.backoff_max)
+        return _throttles[host]
+
+
+def init_throttle(app):
+    """Load the rate, concurrency and retry limits from the `esper` config section"""
+    for key in ('rate_limit', 'backoff_base', 'backoff_max'):
+        setattr(settings, key, float(app.config.get('esper', key)))
+    for key in ('rate_burst', 'max_concurrency', 'retries'):
+        setattr(settings, key, int(app.config.get('esper', key)))
+
+    app.log.debug(f"[init_throttle] rate_limit={settings.rate_limit}/s burst={settings.rate_burst} "
+                  f"max_concurrency={settings.max_concurrency} retries={settings.retries}")
+
+    with _throttles_lock:
+        _throttles.clear()
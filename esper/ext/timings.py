@@ -0,0 +1,223 @@
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from cement.utils import fs
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from esper.controllers.enums import OutputFormat
+
+# Per-thread scratch space filled in by the timed connection classes while a request is in flight
+_state = threading.local()
+
+UUID_SEGMENT = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+NUMERIC_SEGMENT = re.compile(r'^\d+$')
+
+
+def url_template(url: str) -> str:
+    """
+    Reduce a concrete request URL to its path template, so that calls against different
+    devices, groups or pipelines are aggregated together
+    :param url: Absolute request URL
+    :return: Path with ids replaced by `{id}` and the query string dropped
+    """
+    segments = []
+    for segment in urlparse(url).path.split('/'):
+        if UUID_SEGMENT.match(segment) or NUMERIC_SEGMENT.match(segment):
+            segment = '{id}'
+        segments.append(segment)
+
+    return '/'.join(segments)
+
+
+class _TimedConnectionMixin(object):
+    """Records connect (TCP + TLS handshake) and time-to-first-byte on the calling thread"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super(_TimedConnectionMixin, self).connect()
+        _state.connect = getattr(_state, 'connect', 0.0) + (time.perf_counter() - start)
+
+    def getresponse(self, *args, **kwargs):
+        response = super(_TimedConnectionMixin, self).getresponse(*args, **kwargs)
+        _state.first_byte = time.perf_counter()
+        return response
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def instrument_pool_manager(pool_manager) -> None:
+    """Make a urllib3 PoolManager open connections that report their timings"""
+    pool_manager.pool_classes_by_scheme = {
+        'http': TimedHTTPConnectionPool,
+        'https': TimedHTTPSConnectionPool
+    }
+
+
+class TimingRecorder(object):
+    """
+    Process wide collector of outbound HTTP request timings. Disabled by default, in which case
+    `start` and `record` are no-ops.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._records = []
+        self._trace = None
+        self._lock = threading.Lock()
+
+    def enable(self, trace_file: str = None) -> None:
+        self.enabled = True
+        if trace_file:
+            fs.ensure_parent_dir_exists(trace_file)
+            self._trace = open(trace_file, 'a')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace:
+                self._trace.close()
+                self._trace = None
+
+        self.enabled = False
+        self._records = []
+
+    def start(self) -> float:
+        """Reset the per-thread counters and return the request start timestamp"""
+        _state.connect = 0.0
+        _state.first_byte = None
+        return time.perf_counter()
+
+    def record(self, method: str, template: str, status: int, started: float, size: int) -> None:
+        if not self.enabled or started is None:
+            return
+
+        finished = time.perf_counter()
+        first_byte = getattr(_state, 'first_byte', None)
+
+        record = {
+            'ts': time.time(),
+            'method': method.upper(),
+            'url': template,
+            'status': status,
+            'connect_ms': round(getattr(_state, 'connect', 0.0) * 1000, 3),
+            'ttfb_ms': round(((first_byte or finished) - started) * 1000, 3),
+            'total_ms': round((finished - started) * 1000, 3),
+            'bytes': size or 0
+        }
+
+        with self._lock:
+            self._records.append(record)
+            if self._trace:
+                self._trace.write(json.dumps(record) + '\n')
+                self._trace.flush()
+
+    @property
+    def records(self):
+        return list(self._records)
+
+    def summary(self):
+        """Aggregate the recorded requests per method and URL template"""
+        groups = {}
+        for record in self.records:
+            groups.setdefault((record['method'], record['url']), []).append(record)
+
+        rows = []
+        for (method, template), records in sorted(groups.items(), key=lambda item: item[0][1]):
+            totals = sorted(record['total_ms'] for record in records)
+            count = len(records)
+            rows.append({
+                'METHOD': method,
+                'URL': template,
+                'CALLS': count,
+                'ERRORS': len([r for r in records if not r['status'] or r['status'] >= 400]),
+                'CONNECT MS': round(sum(r['connect_ms'] for r in records) / count, 1),
+                'TTFB MS': round(sum(r['ttfb_ms'] for r in records) / count, 1),
+                'AVG MS': round(sum(totals) / count, 1),
+                'P95 MS': round(totals[min(count - 1, int(count * 0.95))], 1),
+                'MAX MS': round(totals[-1], 1),
+                'BYTES': sum(r['bytes'] for r in records)
+            })
+
+        return rows
+
+
+recorder = TimingRecorder()
+
+
+class PhaseTimer(object):
+    """Wall time of the named phases of a workflow, which may run concurrently on different threads"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = (start - self.started, time.perf_counter() - start)
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """Phases in the order they started, with their start offset and duration in seconds"""
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda item: item[1][0])
+
+        return [{'PHASE': name, 'START S': round(start, 3), 'DURATION S': round(duration, 3)}
+                for name, (start, duration) in phases]
+
+
+def init_timings(app):
+    timings = getattr(app.pargs, 'timings', False)
+    trace_file = getattr(app.pargs, 'timings_file', None)
+
+    if not timings and not trace_file:
+        return
+
+    if trace_file:
+        trace_file = fs.abspath(trace_file)
+        app.log.debug(f"[init_timings] Appending request traces to {trace_file}")
+
+    recorder.enable(trace_file=trace_file)
+
+
+def report_timings(app):
+    if not recorder.enabled:
+        return
+
+    if getattr(app.pargs, 'timings', False):
+        rows = recorder.summary()
+        if rows:
+            sys.stderr.write("\nHTTP request timings:\n")
+            app.render(rows, format=OutputFormat.TABULATED.value, headers="keys", tablefmt="plain", out=sys.stderr)
+            sys.stderr.write("\n")
+        else:
+            sys.stderr.write("\nHTTP request timings: no requests were made\n")
+
+    recorder.close()
@@ -0,0 +1,113 @@
+import glob
+import mimetypes
+import os
+import uuid
+from typing import Callable, List
+
+from esper.ext.api_client import get_session, get_api_host
+
+CHUNK_SIZE = 256 * 1024
+
+
+class APIException(Exception):
+    def __init__(self, message: str, status: int = None):
+        super(APIException, self).__init__(message)
+        self.status = status
+
+
+class MultipartFile(object):
+    """
+    multipart/form-data body with a single file field, streamed from disk in chunks instead of being read into
+    memory. The length is known up front so requests sends a Content-Length, and every iteration starts from
+    the beginning of the file so the body can be re-sent when a request is retried.
+    """
+
+    def __init__(self, field: str, path: str, on_progress: Callable[[int], None] = None):
+        """
+        :param field: Form field name
+        :param path: File to send
+        :param on_progress: Called with the bytes of the file sent so far in the current attempt
+        """
+        self.path = path
+        self.on_progress = on_progress
+        self.boundary = uuid.uuid4().hex
+
+        filename = os.path.basename(path).replace('"', '')
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.preamble = (f'--{self.boundary}\r\n'
+                         f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                         f'Content-Type: {mimetype}\r\n\r\n').encode('utf-8')
+        self.epilogue = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.size = os.path.getsize(path)
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self.preamble) + self.size + len(self.epilogue)
+
+    def __iter__(self):
+        sent = 0
+        if self.on_progress:
+            self.on_progress(sent)
+
+        yield self.preamble
+        with open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                yield chunk
+                sent += len(chunk)
+                if self.on_progress:
+                    self.on_progress(sent)
+        yield self.epilogue
+
+
+def upload_application(environment: str, enterprise_id: str, api_key: str, path: str,
+                       on_progress: Callable[[int], None] = None) -> dict:
+    """
+    Upload an application file, streaming it from disk
+    :param environment: Esper environment
+    :param enterprise_id: Enterprise id
+    :param api_key: API key
+    :param path: Application file
+    :param on_progress: Called with the bytes sent so far
+    :return: Upload response, with the application and its uploaded version
+    """
+    url = f'{get_api_host(environment)}/api/enterprise/{enterprise_id}/application/upload/'
+    body = MultipartFile('app_file', path, on_progress)
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': body.content_type,
+        'Content-Length': str(len(body))
+    }
+
+    # Not retried here: an upload is only safe to repeat after checking it did not go through, see `app upload`
+    response = get_session().post(url, data=body, headers=headers, retries=0)
+    if not response.ok:
+        try:
+            message = response.json().get('message') or response.reason
+        except ValueError:
+            message = response.reason
+        raise APIException(message, response.status_code)
+
+    return response.json()
+
+
+def find_application_files(sources: List[str], pattern: str = '*.apk') -> List[str]:
+    """
+    Expand files, directories and glob patterns into application files
+    :param sources: File paths, directories (searched for `pattern`, not recursively) or glob patterns
+        (`**` matches subdirectories)
+    :param pattern: File pattern within directories
+    :return: Unique file paths, in order
+    """
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files.extend(sorted(glob.glob(os.path.join(source, pattern))))
+        elif glob.has_magic(source):
+            files.extend(sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path)))
+        else:
+            files.append(source)
+
+    return list(dict.fromkeys(files))
@@ -40,3 +40,15 @@ def parse_error_message(app, exception):
     except ValueError:
         app.log.error(f'[parse_error_message] Decoding JSON has failed, exception body: {exception.body}')
         return exception.reason
+
+
+def format_age(seconds: float) -> str:
+    """Human readable duration such as '45s', '12m' or '3h 5m'"""
+    seconds = int(max(0, seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    return f"{seconds // 86400}d {seconds % 86400 // 3600}h"
@@ -4,11 +4,15 @@ from cement.core.exc import CaughtSignal
 from esper.controllers.application.application import Application
 from esper.controllers.application.version import ApplicationVersion
 from esper.controllers.base import Base
+from esper.controllers.batch import Batch
+from esper.controllers.completion import Completion
 from esper.controllers.configure import Configure
+from esper.controllers.daemon import Daemon
 from esper.controllers.device.command import DeviceCommand
 from esper.controllers.device.device import Device
 from esper.controllers.device.group_command import GroupCommand
 from esper.controllers.device.install import AppInstall
+from esper.controllers.device.rollout import AppRollout
 from esper.controllers.device.status import DeviceStatus
 from esper.controllers.enterprise.enterprise import Enterprise
 from esper.controllers.enterprise.group import EnterpriseGroup
@@ -20,8 +24,13 @@ from esper.controllers.secureadb.secureadb import SecureADB
 from esper.controllers.telemetry.telemetry import Telemetry
 from esper.controllers.token.token import Token
 from esper.core.exc import EsperError
+from esper.core.log_handler import EsperLogHandler
 from esper.core.output_handler import EsperOutputHandler
 from esper.ext.certs import init_certs
+from esper.ext.download_cache import init_download_cache
+from esper.ext.http_cache import init_http_cache, report_cache_age
+from esper.ext.throttle import init_throttle
+from esper.ext.timings import init_timings, report_timings
 from esper.ext.utils import extend_tinydb
 
 # configuration defaults
@@ -32,6 +41,19 @@ CONFIG['esper']['certs_folder'] = '~/.esper/certs'
 CONFIG['esper']['local_key'] = '~/.esper/certs/local.key'
 CONFIG['esper']['local_cert'] = '~/.esper/certs/local.pem'
 CONFIG['esper']['device_cert'] = '~/.esper/certs/device.pem'
+CONFIG['esper']['rate_limit'] = 0
+CONFIG['esper']['rate_burst'] = 10
+CONFIG['esper']['max_concurrency'] = 8
+CONFIG['esper']['retries'] = 3
+CONFIG['esper']['backoff_base'] = 0.5
+CONFIG['esper']['backoff_max'] = 30
+CONFIG['esper']['cache_dir'] = '~/.esper/cache/http'
+CONFIG['esper']['cache_max_bytes'] = 50 * 1024 * 1024
+CONFIG['esper']['cache_ttls'] = {}
+CONFIG['esper']['offline_cache'] = False
+CONFIG['esper']['inventory_file'] = '~/.esper/db/inventory.sqlite3'
+CONFIG['esper']['download_cache_dir'] = '~/.esper/cache/apk'
+CONFIG['esper']['download_cache_max_bytes'] = 2 * 1024 * 1024 * 1024
 
 # meta defaults
 META = init_defaults('log.colorlog')
@@ -83,7 +105,6 @@ class Esper(App):
         extensions = [
             'yaml',
             'json',
-            'colorlog',
             'jinja2',
             'tabulate'
         ]
@@ -95,6 +116,7 @@ class Esper(App):
         # register handlers
         handlers = [
             EsperOutputHandler,
+            EsperLogHandler,
             Base,
             Configure,
             Device,
@@ -106,19 +128,29 @@ class Esper(App):
             Enterprise,
             EnterpriseGroup,
             GroupCommand,
+            AppRollout,
             SecureADB,
             Token,
             Telemetry,
             Pipeline,
             Stage,
             Operation,
-            Execution
+            Execution,
+            Batch,
+            Daemon,
+            Completion
         ]
 
         # hooks
         hooks = [
             ('post_setup', extend_tinydb),
             ('post_setup', init_certs),
+            ('post_setup', init_throttle),
+            ('post_argument_parsing', init_timings),
+            ('post_argument_parsing', init_http_cache),
+            ('post_argument_parsing', init_download_cache),
+            ('pre_close', report_timings),
+            ('pre_close', report_cache_age),
         ]
 
 
@@ -130,6 +162,19 @@ TEST_CONFIG['esper']['certs_folder'] = '~/.esper/certs'
 TEST_CONFIG['esper']['local_key'] = '~/.esper/certs/local.key'
 TEST_CONFIG['esper']['local_cert'] = '~/.esper/certs/local.pem'
 TEST_CONFIG['esper']['device_cert'] = '~/.esper/certs/device.pem'
+TEST_CONFIG['esper']['rate_limit'] = 0
+TEST_CONFIG['esper']['rate_burst'] = 10
+TEST_CONFIG['esper']['max_concurrency'] = 8
+TEST_CONFIG['esper']['retries'] = 3
+TEST_CONFIG['esper']['backoff_base'] = 0.5
+TEST_CONFIG['esper']['backoff_max'] = 30
+TEST_CONFIG['esper']['cache_dir'] = '~/.esper/cache/http'
+TEST_CONFIG['esper']['cache_max_bytes'] = 0
+TEST_CONFIG['esper']['cache_ttls'] = {}
+TEST_CONFIG['esper']['offline_cache'] = False
+TEST_CONFIG['esper']['inventory_file'] = 'inventory.sqlite3'
+TEST_CONFIG['esper']['download_cache_dir'] = '~/.esper/cache/apk'
+TEST_CONFIG['esper']['download_cache_max_bytes'] = 0
 
 
 class EsperTest(TestApp, Esper):
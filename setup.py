@@ -18,12 +18,12 @@ setup(
     author_email='developer@esper.io',
     url='https://github.com/BindyaBhaskar/esper-cli/',
     license='Apache 2.0',
-    packages=find_packages(exclude=['ez_setup', 'tests*']),
+    packages=find_packages(exclude=['ez_setup', 'tests*', 'benchmarks*']),
     package_data={'esper': ['templates/*']},
     include_package_data=True,
     entry_points="""
         [console_scripts]
-        espercli = esper.main:main
+        espercli = esper.cli:main
     """,
     install_requires=[
         'cement==3.0.2',
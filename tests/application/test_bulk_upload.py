@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+from unittest import mock
+
+from esper.ext.upload import APIException, find_application_files, upload_application
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+APK = os.path.join(os.path.dirname(__file__), 'Tiny Notepad Simple Small_v1.0_apkpure.com.apk')
+
+
+class BulkUploadTest(MockApiTestCase):
+    fleet_options = {'devices': 10, 'groups': 1, 'applications': 1}
+
+    def setUp(self) -> None:
+        super(BulkUploadTest, self).setUp()
+        # Files without a manifest are uploaded by the mock as new applications
+        os.makedirs('build/nested')
+        for i in range(6):
+            with open(f'build/app{i}.apk', 'wb') as f:
+                f.write(os.urandom(64 * 1024))
+        shutil.copy(APK, 'build/notepad.apk')
+        shutil.copy(APK, 'build/nested/notepad-copy.apk')
+
+    def uploads(self):
+        return self.api.requests_by_route.get('POST upload_application', 0)
+
+    def test_find_application_files(self):
+        assert len(find_application_files(['build'])) == 7
+        assert len(find_application_files(['build/**/*.apk'])) == 8
+        assert find_application_files(['build/app0.apk', 'build/app0.apk']) == ['build/app0.apk']
+
+    def test_bulk_upload_writes_manifest(self):
+        argv = ['app', 'upload', 'build/**/*.apk', '--manifest', 'manifest.json', '-w', '4', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert app.exit_code == 0
+
+        with open('manifest.json') as f:
+            manifest = json.load(f)
+
+        assert manifest == data
+        assert len(manifest) == 8
+        assert all(entry['version_id'] for entry in manifest.values())
+        # The copy of the notepad APK is not uploaded a second time
+        assert manifest['build/nested/notepad-copy.apk']['version_id'] == manifest['build/notepad.apk']['version_id']
+        assert [manifest['build/nested/notepad-copy.apk']['uploaded'], manifest['build/notepad.apk']['uploaded']] \
+            == [True, False]
+        assert self.uploads() == 7
+
+        # Everything is known now
+        argv = ['app', 'upload', 'build', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert not any(entry['uploaded'] for entry in data.values())
+        assert self.uploads() == 7
+
+    def test_failed_uploads_are_retried(self):
+        calls = []
+
+        def flaky(*args, **kwargs):
+            calls.append(args[3])
+            if calls.count(args[3]) == 1:
+                raise APIException('Service Unavailable', 503)
+            return upload_application(*args, **kwargs)
+
+        argv = ['app', 'upload', 'build', '--force', '-j']
+        with mock.patch('esper.controllers.application.application.upload_application', flaky), \
+                mock.patch('esper.controllers.application.application.time.sleep'), \
+                EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert app.exit_code == 0
+            assert all(entry['uploaded'] for entry in data.values())
+            assert len(calls) == 14
+
+    def test_upload_streams_file_with_progress(self):
+        progress = []
+        response = upload_application('bench', self.fleet.enterprise_id, 'bench-token', APK, progress.append)
+
+        assert response['application']['package_name'] == 'com.robot15.tiny.notepad'
+        assert progress[0] == 0
+        assert progress[-1] == os.path.getsize(APK)
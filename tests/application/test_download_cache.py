@@ -0,0 +1,96 @@
+import os
+
+from esper.ext.download_cache import DownloadCache
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class DownloadCacheTest(MockApiTestCase):
+    fleet_options = {'devices': 10, 'groups': 1, 'applications': 0}
+
+    def setUp(self) -> None:
+        super(DownloadCacheTest, self).setUp()
+        self.application = self.fleet.add_application('Bench', 'io.esper.bench.download', [])
+        self.versions = [self.fleet.add_version(self.application, str(code), size=size)['id']
+                         for code, size in ((1, 300 * 1024), (2, 400 * 1024), (3, 500 * 1024))]
+        self.set_config(download_cache_dir='apk-cache', download_cache_max_bytes=1024 * 1024)
+
+    def download(self, version_id, destination, *args):
+        argv = [*args, 'app', 'download', version_id, '--app', self.application['id'], '--dest', destination]
+        with EsperTest(argv=argv) as app:
+            app.run()
+            return app.last_rendered
+
+    def downloads(self):
+        return self.api.requests_by_route.get('GET download_file', 0)
+
+    def objects(self):
+        return [os.path.join('apk-cache', 'objects', name) for name in os.listdir(os.path.join('apk-cache', 'objects'))]
+
+    def test_second_download_is_served_from_cache(self):
+        self.download(self.versions[0], 'first.apk')
+        data, output = self.download(self.versions[0], 'second.apk')
+
+        assert data == 'Served second.apk from the download cache\n'
+        assert self.downloads() == 1
+        assert os.path.getsize('second.apk') == 300 * 1024
+        # Served by a copy, editing it leaves the cached file alone
+        assert os.stat('second.apk').st_ino != os.stat(self.objects()[0]).st_ino
+        with open('second.apk', 'r+b') as f:
+            f.write(b'edited')
+        data, output = self.download(self.versions[0], 'fourth.apk')
+        assert data == 'Served fourth.apk from the download cache\n'
+        with open('fourth.apk', 'rb') as f:
+            assert f.read() == b'\0' * 300 * 1024
+
+        self.download(self.versions[0], 'third.apk', '--refresh')
+        assert self.downloads() == 2
+
+    def test_corrupt_entry_is_downloaded_again(self):
+        self.download(self.versions[0], 'first.apk')
+        with open(self.objects()[0], 'r+b') as f:
+            f.write(b'corrupt')
+
+        self.download(self.versions[0], 'second.apk')
+        assert self.downloads() == 2
+        with open('second.apk', 'rb') as f:
+            assert f.read() == b'\0' * 300 * 1024
+
+    def test_least_recently_used_files_are_evicted(self):
+        self.download(self.versions[0], 'first.apk')
+        self.download(self.versions[1], 'second.apk')
+        os.utime(self.objects()[0], (0, 0))
+        os.utime(self.objects()[1], (0, 0))
+        self.download(self.versions[0], 'first.apk')
+
+        # Over the 1 MiB cap: the second version is the least recently used one
+        self.download(self.versions[2], 'third.apk')
+        assert sorted(os.path.getsize(path) for path in self.objects()) == [300 * 1024, 500 * 1024]
+
+        self.download(self.versions[1], 'second.apk')
+        assert self.downloads() == 4
+
+    def test_incomplete_download_is_not_cached(self):
+        cache = DownloadCache()
+        cache.configure('apk-cache', 1024 * 1024)
+
+        with self.assertRaises(IOError):
+            cache.store('version-1', 1024, [b'\0' * 512], expected_size=1024)
+        assert os.listdir(cache.objects) == []
+        assert os.listdir(cache.keys) == []
+
+        with self.assertRaises(IOError):
+            cache.store('version-1', 1024, [b'\0' * 1024], expected_size=1024, sha256='0' * 64)
+        assert cache.lookup('version-1', 1024) is None
+
+        path = cache.store('version-1', 1024, [b'\0' * 1024], expected_size=1024)
+        assert cache.lookup('version-1', 1024) == path
+
+    def test_keys_of_evicted_files_are_removed(self):
+        for version_id in self.versions:
+            self.download(version_id, 'file.apk')
+
+        # The first version was evicted to make room for the third, and its key with it
+        keys = os.listdir(os.path.join('apk-cache', 'keys'))
+        assert len(keys) == 2
+        assert not any(name.startswith(self.versions[0]) for name in keys)
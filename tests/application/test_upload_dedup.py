@@ -0,0 +1,80 @@
+import os
+from unittest import mock
+
+import requests
+from tinydb import TinyDB
+
+from esper.ext.apk import read_manifest, sha256_file
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+APK = os.path.join(os.path.dirname(__file__), 'Tiny Notepad Simple Small_v1.0_apkpure.com.apk')
+
+
+class UploadDedupTest(MockApiTestCase):
+    fleet_options = {'devices': 10, 'groups': 1, 'applications': 1}
+
+    def upload(self, *args):
+        with EsperTest(argv=['app', 'upload', APK, '-j', *args]) as app:
+            app.run()
+            data, output = app.last_rendered
+            return data
+
+    def uploads(self):
+        return self.api.requests_by_route.get('POST upload_application', 0)
+
+    def test_read_manifest(self):
+        assert read_manifest(APK) == {'package': 'com.robot15.tiny.notepad', 'version_code': '1',
+                                      'version_name': '1.0'}
+        assert read_manifest(__file__) is None
+        assert sha256_file(APK) == '971285fe9376d6a4765445b1a3ddc633a752aa58ebe706a78b2da5649579713e'
+
+    def test_same_apk_is_uploaded_once(self):
+        first = self.upload()
+        assert first['uploaded'] is True
+        assert first['package_name'] == 'com.robot15.tiny.notepad'
+
+        second = self.upload()
+        assert second['uploaded'] is False
+        assert second['version_id'] == first['version_id']
+        assert self.uploads() == 1
+
+    def test_known_version_is_found_without_index(self):
+        first = self.upload()
+        assert first['version_id'] in self.fleet.versions
+        TinyDB('creds.json').purge_table('uploads')
+
+        second = self.upload()
+        assert second['uploaded'] is False
+        assert second['version_id'] == first['version_id']
+        assert self.uploads() == 1
+
+    def test_stale_index_entry_and_force(self):
+        first = self.upload()
+        del self.fleet.applications[first['id']]
+
+        second = self.upload()
+        assert second['uploaded'] is True
+        assert self.uploads() == 2
+
+        third = self.upload('--force')
+        assert third['uploaded'] is True
+        assert self.uploads() == 3
+
+    def test_throttled_upload_is_retried_once_per_attempt(self):
+        self.set_config(backoff_base=0.01)
+        posts = []
+
+        def throttled(session, template, method, url, *args, **kwargs):
+            posts.append(url)
+            response = requests.Response()
+            response.status_code = 429
+            response.reason = 'Too Many Requests'
+            return response
+
+        with mock.patch('esper.ext.api_client.EsperSession._timed_request', throttled):
+            data = self.upload('--retries', '1')
+
+        assert data == 'ERROR: Too Many Requests\n'
+        # The upload loop retries, the throttle does not retry each of its attempts again
+        assert len(posts) == 2
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from esper.ext.polling import AdaptivePoller, group_command_states
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class GroupCommandWatchTest(MockApiTestCase):
+    fleet_options = {'devices': 200, 'groups': 2, 'applications': 1, 'command_duration': 1.0, 'failure_rate': 0}
+
+    def test_poller_backs_off_and_speeds_up(self):
+        poller = AdaptivePoller(initial=0.5, maximum=2.0, factor=2)
+        assert [poller.next_interval(False) for _ in range(4)] == [0.5, 1.0, 2.0, 2.0]
+        assert poller.next_interval(True) == 2.0
+        assert poller.next_interval(True) == 1.0
+
+        poller = AdaptivePoller(initial=0.01, timeout=0)
+        assert poller.wait() is False
+
+    def test_group_command_states(self):
+        details = {'success': [{'name': 'a'}], 'acknowledge': [{'name': 'b'}], 'inactive': [{'name': 'c'}]}
+        assert group_command_states(details) == {'a': 'success', 'b': 'in_progress', 'c': 'inactive'}
+
+    def test_ping_wait(self):
+        argv = ['group-command', 'ping', '-g', 'Group 1', '--wait', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert data['state'] == 'Command Success'
+            assert data['in_progress'] == []
+            members = self.fleet.groups[list(self.fleet.groups)[1]]['members']
+            assert len(data['success']) + len(data['inactive']) == len(members)
+            assert app.exit_code == 0
+
+        # Adaptive polling: far fewer polls than a fixed fast interval would need
+        assert self.api.requests_by_route['GET get_group_command'] < 8
+
+    def test_watch_prints_changed_states_once(self):
+        argv = ['group-command', 'ping', '-g', 'Group 1']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            command_id = data[0]['DETAILS']
+
+        argv = ['group-command', 'watch', command_id, '-g', 'Group 1']
+        with mock.patch('sys.stdout') as stdout, EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+        printed = ''.join(call.args[0] for call in stdout.write.call_args_list)
+        success = [line for line in printed.splitlines() if line.endswith('\tsuccess')]
+        assert len(success) == len(set(success))
+        assert {'TITLE': 'state', 'DETAILS': 'Command Success'} in data
+
+    def test_watch_timeout(self):
+        self.fleet.command_duration = 60
+        argv = ['group-command', 'ping', '-g', 'Group 1', '--wait', '--timeout', '0.5', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert data['state'] == 'Command Initiated'
+            assert app.exit_code == 2
+
+    def test_watch_empty_group(self):
+        self.fleet.add_group('Empty')
+        argv = ['group-command', 'ping', '-g', 'Empty', '--wait', '--timeout', '30', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert data['success'] == data['in_progress'] == []
+            assert app.exit_code == 0
+
+        assert self.api.requests_by_route['GET get_group_command'] == 1
@@ -0,0 +1,72 @@
+from esper.ext.inventory import version_key
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class InstallsInventoryTest(MockApiTestCase):
+    fleet_options = {'devices': 300, 'groups': 2, 'applications': 3, 'versions': 3}
+
+    def installed_versions(self, package):
+        """Version code of the package per device name, straight from the fleet"""
+        versions = {}
+        for i in range(self.fleet.device_count):
+            for install in self.fleet.installs(i, {'package_name': package}):
+                versions[self.fleet.device_name(i)] = install['application']['version']['version_code']
+        return versions
+
+    def test_version_key(self):
+        assert version_key('1.10.2') > version_key('1.9')
+        assert version_key('210') > version_key('30')
+        assert version_key('2.0-beta') < version_key('2.0.1')
+
+    def test_collect_and_query(self):
+        argv = ['installs', 'collect', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert app.exit_code == 0
+            assert data['devices'] == self.fleet.device_count
+            assert data['failed'] == []
+
+        package = 'io.esper.bench.app1'
+        expected = self.installed_versions(package)
+
+        argv = ['installs', 'compliance', '-p', package, '--below', '102', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert sorted(row['device_name'] for row in data) == \
+                sorted(name for name, version in expected.items() if int(version) < 102)
+
+        argv = ['installs', 'compliance', '-p', package, '--missing', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert len(data) == self.fleet.device_count - len(expected)
+
+        argv = ['installs', 'compliance', '-p', package, '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert sum(row['devices'] for row in data) == len(expected)
+            assert [row['version_code'] for row in data] == sorted((row['version_code'] for row in data),
+                                                                   reverse=True)
+
+        # Queries are answered from the inventory alone
+        requests = self.api.request_count
+        argv = ['installs', 'compliance', '-p', package, '--below', '101']
+        with EsperTest(argv=argv) as app:
+            app.run()
+        assert self.api.request_count == requests
+
+    def test_compliance_without_inventory(self):
+        argv = ['installs', 'compliance', '-p', 'io.esper.bench.app1']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert data == 'No installs collected yet, run `espercli installs collect` first.\n'
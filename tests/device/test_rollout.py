@@ -0,0 +1,64 @@
+from esper.ext.rollout import parse_waves, plan_waves
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class RolloutTest(MockApiTestCase):
+    fleet_options = {'devices': 400, 'groups': 2, 'applications': 1, 'command_duration': 0.5, 'failure_rate': 0}
+
+    def setUp(self) -> None:
+        super(RolloutTest, self).setUp()
+        self.version_id = list(self.fleet.versions)[0]
+
+    def test_plan_waves(self):
+        assert parse_waves('1, 10%,50,100') == [1, 10, 50, 100]
+        with self.assertRaises(ValueError):
+            parse_waves('10,5')
+
+        device_ids = [f'device-{i}' for i in range(1000)]
+        plan = plan_waves(device_ids, [1, 10, 50, 100])
+        assert [len(wave) for wave in plan] == [10, 90, 400, 500]
+        assert sorted(sum(plan, [])) == sorted(device_ids)
+        assert plan == plan_waves(list(reversed(device_ids)), [1, 10, 50, 100])
+
+        # Small targets still get a canary of one device, and no empty waves
+        assert [len(wave) for wave in plan_waves(device_ids[:3], [1, 10, 50, 100])] == [1, 1, 1]
+
+    def test_rollout_completes(self):
+        argv = ['rollout', 'install', '-V', self.version_id, '-g', 'Group 1', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert app.exit_code == 0
+            assert data['halted'] is False
+            assert len(data['waves']) == 4
+            assert sum(wave['success'] for wave in data['waves']) == sum(wave['devices'] for wave in data['waves'])
+
+        assert self.api.requests_by_route['POST run_command'] == sum(wave['devices'] for wave in data['waves'])
+
+    def test_rollout_halts_on_failures(self):
+        self.fleet.failure_rate = 1
+        argv = ['rollout', 'install', '-V', self.version_id, '-g', 'Group 1', '--max-failure-rate', '20', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert app.exit_code == 1
+            assert data['halted'] is True
+            assert len(data['waves']) == 1
+            assert data['waves'][0]['failed'] == data['waves'][0]['devices']
+
+        assert self.api.requests_by_route['POST run_command'] == data['waves'][0]['devices']
+
+    def test_rollout_halts_on_a_wave_that_never_finishes(self):
+        self.fleet.command_duration = 3600
+        argv = ['rollout', 'install', '-V', self.version_id, '-g', 'Group 1', '--wave-timeout', '0.5', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+
+            assert app.exit_code == 1
+            assert data['halted'] is True
+            assert data['failure_rate'] == 1
+            assert [wave['pending'] for wave in data['waves']] == [data['waves'][0]['devices']]
@@ -0,0 +1,54 @@
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class GroupDevicesTest(MockApiTestCase):
+    fleet_options = {'devices': 1000, 'groups': 2, 'applications': 1}
+
+    def setUp(self) -> None:
+        super(GroupDevicesTest, self).setUp()
+        self.group_id = list(self.fleet.groups)[1]
+
+    def members(self):
+        return self.fleet.groups[self.group_id]['members']
+
+    def test_add_from_file(self):
+        # Group 1 holds the even devices; add a mix of members and non-members
+        names = [self.fleet.device_name(i) for i in range(0, 40)]
+        with open('devices.txt', 'w') as f:
+            f.write('# devices to add\n' + '\n'.join(names[:20]) + '\n' + ','.join(names[20:]) + '\n')
+
+        before = len(self.members())
+        argv = ['group', 'add', '-g', 'Group 1', '--devices-file', 'devices.txt', '-d', names[0], '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert data['device_count'] == before + 20
+
+        assert set(range(0, 40)) <= self.members()
+        # 1 group lookup, 40 name lookups, 5 membership pages, 1 update
+        assert self.api.request_count == 47
+
+    def test_remove(self):
+        argv = ['group', 'remove', '-g', 'Group 1', '-d', self.fleet.device_name(0), self.fleet.device_name(1), '-j']
+        before = len(self.members())
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert data['device_count'] == before - 1
+
+        assert 0 not in self.members()
+
+    def test_unknown_devices_are_reported_together(self):
+        argv = ['group', 'add', '-g', 'Group 1', '-d', 'nope-1', self.fleet.device_name(1), 'nope-2']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert 'nope-1' in output and 'nope-2' in output
+
+    def test_no_change_skips_update(self):
+        argv = ['group', 'add', '-g', 'Group 1', '-d', self.fleet.device_name(0)]
+        with EsperTest(argv=argv) as app:
+            app.run()
+
+        assert 'PATCH update_group' not in self.api.requests_by_route
@@ -0,0 +1,78 @@
+from unittest import mock
+
+from benchmarks.fleet import Fleet
+from esper.ext.polling import AdaptivePoller, execution_outcome
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class ExecutionWatchTest(MockApiTestCase):
+    fleet_options = {'devices': 10, 'groups': 1, 'applications': 1, 'command_duration': 60}
+
+    def setUp(self) -> None:
+        super(ExecutionWatchTest, self).setUp()
+        self.pipeline_id = '00000000-0000-4000-8000-000000000001'
+        self.fleet.pipelines[self.pipeline_id] = {'id': self.pipeline_id, 'name': 'Rollout', 'description': None,
+                                                  'trigger': None, 'version': 1,
+                                                  'enterprise': self.fleet.enterprise_id}
+        for ordering, name in enumerate(('Canary', 'Fleet'), start=1):
+            stage_id = f'00000000-0000-4000-8000-00000000001{ordering}'
+            self.fleet.stages[stage_id] = {'id': stage_id, 'name': name, 'description': None, 'ordering': ordering,
+                                           'version': 1, 'pipeline': self.pipeline_id}
+
+    def start(self):
+        with EsperTest(argv=['pipeline', 'execute', 'start', '-p', self.pipeline_id]) as app:
+            app.run()
+        return next(iter(self.fleet.executions))
+
+    def watch(self, execution_id, *args):
+        argv = ['pipeline', 'execute', 'watch', '-p', self.pipeline_id, '-e', execution_id, '-j', *args]
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            return app.exit_code, data
+
+    def test_execution_outcome(self):
+        assert execution_outcome({'state': 'RUNNING', 'status': 'IN_PROGRESS'}) is None
+        assert execution_outcome({'state': 'COMPLETED', 'status': 'SUCCESS'}) == 'success'
+        assert execution_outcome({'state': 'COMPLETED', 'status': 'FAILURE'}) == 'failed'
+        assert execution_outcome({'state': 'TERMINATED', 'status': 'FAILURE'}) == 'failed'
+        assert execution_outcome({'state': 'STOPPED', 'status': 'FAILURE'}) == 'stopped'
+
+    def test_watch_until_completed(self):
+        execution_id = self.start()
+
+        # Every wait between polls lets the mock execution finish one stage, without any real time passing
+        def next_stage(poller, changed=False):
+            self.fleet.executions[execution_id]['created'] -= self.fleet.command_duration
+            return True
+
+        with mock.patch.object(AdaptivePoller, 'wait', next_stage):
+            exit_code, data = self.watch(execution_id)
+
+        assert exit_code == 0
+        assert data['outcome'] == 'success'
+        changes = [(t['part'], t['from'], t['to']) for t in data['transitions']]
+        assert ('stage Canary', 'RUNNING', 'COMPLETED') in changes
+        assert ('stage Fleet', 'PENDING', 'RUNNING') in changes
+        assert ('stage Fleet', 'RUNNING', 'COMPLETED') in changes
+        assert changes[-1] == ('execution', 'RUNNING', 'COMPLETED')
+        # One poll per stage, then the completed execution
+        assert self.api.requests_by_route['GET get_execution'] == 3
+
+    def test_stopped_and_timed_out(self):
+        execution_id = self.start()
+        self.fleet.executions[execution_id]['state'] = 'STOPPED'
+        exit_code, data = self.watch(execution_id)
+        assert exit_code == 3
+        assert data['outcome'] == 'stopped'
+
+        self.fleet.executions[execution_id]['state'] = 'RUNNING'
+        self.fleet.command_duration = 60
+        exit_code, data = self.watch(execution_id, '--timeout', '0.2')
+        assert exit_code == 2
+        assert data['outcome'] == 'timeout'
+
+        self.fleet.executions[execution_id]['state'] = 'TERMINATED'
+        exit_code, data = self.watch(execution_id)
+        assert exit_code == 1
@@ -0,0 +1,139 @@
+import os
+
+import yaml
+
+from benchmarks.fleet import Fleet
+from esper.ext.http_cache import cache
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+SPEC = {
+    'name': 'Kiosk rollout',
+    'description': 'Canary then everyone',
+    'trigger': {'application_name': 'Kiosk', 'package_name': 'io.esper.kiosk'},
+    'stages': [
+        {'name': 'Canary', 'operations': [
+            {'name': 'Install', 'action': 'APP_INSTALL', 'group': 'Group 1'},
+            {'name': 'Reboot', 'action': 'REBOOT', 'group': 'Group 1'}
+        ]},
+        {'name': 'Fleet', 'description': 'Everyone else', 'operations': [
+            {'name': 'Install', 'action': 'APP_INSTALL', 'group': 'Group 2'}
+        ]}
+    ]
+}
+
+
+class PipelineApplyTest(MockApiTestCase):
+    fleet_options = {'devices': 10, 'groups': 3, 'applications': 1}
+
+    def apply(self, spec, *args):
+        with open('pipeline.yml', 'w') as f:
+            yaml.safe_dump(spec, f)
+
+        with EsperTest(argv=['pipeline', 'apply', '-f', 'pipeline.yml', '-j', *args]) as app:
+            app.run()
+            data, output = app.last_rendered
+            return app.exit_code, data
+
+    def writes(self):
+        return sum(count for route, count in self.api.requests_by_route.items() if not route.startswith('GET'))
+
+    def stages(self, pipeline_id):
+        stages = sorted((s for s in self.fleet.stages.values() if s['pipeline'] == pipeline_id),
+                        key=lambda s: s['ordering'])
+        return [(s['name'], s['ordering'], sorted(o['name'] for o in self.fleet.operations.values()
+                                                  if o['stage'] == s['id'])) for s in stages]
+
+    def test_create_then_noop(self):
+        exit_code, data = self.apply(SPEC)
+        pipeline_id = data['pipeline_id']
+
+        assert exit_code == 0
+        assert [(row['action'], row['kind']) for row in data['changes']].count(('create', 'operation')) == 3
+        assert all(row['result'] == 'ok' for row in data['changes'])
+        assert self.fleet.pipelines[pipeline_id]['trigger']['pre_conditions']['package_name'] == 'io.esper.kiosk'
+        assert self.stages(pipeline_id) == [('Canary', 1, ['Install', 'Reboot']), ('Fleet', 2, ['Install'])]
+
+        writes = self.writes()
+        exit_code, data = self.apply(SPEC)
+        assert data == {'pipeline_id': pipeline_id, 'changes': []}
+        assert self.writes() == writes
+
+    def test_minimal_diff(self):
+        exit_code, data = self.apply(SPEC)
+        pipeline_id = data['pipeline_id']
+        canary_install = next(o['id'] for o in self.fleet.operations.values() if o['name'] == 'Install'
+                              and self.fleet.stages[o['stage']]['name'] == 'Canary')
+
+        spec = yaml.safe_load(yaml.safe_dump(SPEC))
+        # Swap the stages, drop the reboot, retarget the fleet install and add a stage
+        spec['stages'] = [spec['stages'][1], spec['stages'][0], {'name': 'Cleanup', 'operations': [
+            {'name': 'Uninstall', 'action': 'APP_UNINSTALL', 'group': 'Group 3'}]}]
+        spec['stages'][1]['operations'].pop()
+        spec['stages'][0]['operations'][0]['group'] = 'Group 3'
+
+        exit_code, data = self.apply(spec, '--dry-run')
+        assert all(row['result'] == 'planned' for row in data['changes'])
+        assert self.stages(pipeline_id) == [('Canary', 1, ['Install', 'Reboot']), ('Fleet', 2, ['Install'])]
+
+        exit_code, data = self.apply(spec)
+        assert exit_code == 0
+        assert sorted((row['action'], row['kind'], row['name']) for row in data['changes']) == [
+            ('create', 'operation', 'Uninstall'),
+            ('create', 'stage', 'Cleanup'),
+            ('delete', 'operation', 'Reboot'),
+            ('update', 'operation', 'Install'),
+            ('update', 'stage', 'Canary'),
+            ('update', 'stage', 'Fleet'),
+        ]
+        assert self.stages(pipeline_id) == [('Fleet', 1, ['Install']), ('Canary', 2, ['Install']),
+                                            ('Cleanup', 3, ['Uninstall'])]
+        # Unchanged operations keep their id
+        assert canary_install in self.fleet.operations
+
+        group_3 = next(g for g in self.fleet.groups.values() if g['name'] == 'Group 3')
+        fleet_install = next(o for o in self.fleet.operations.values()
+                             if self.fleet.stages[o['stage']]['name'] == 'Fleet')
+        assert group_3['id'] in fleet_install['action_args']['url']
+
+    def test_action_change_rebuilds_the_group_command(self):
+        exit_code, data = self.apply(SPEC)
+
+        spec = yaml.safe_load(yaml.safe_dump(SPEC))
+        spec['stages'][1]['operations'][0]['action'] = 'REBOOT'
+        del spec['stages'][1]['operations'][0]['group']
+        exit_code, data = self.apply(spec)
+        assert exit_code == 0
+        assert [(row['action'], row['name']) for row in data['changes']] == [('update', 'Install')]
+
+        group_2 = next(g for g in self.fleet.groups.values() if g['name'] == 'Group 2')
+        fleet_install = next(o for o in self.fleet.operations.values()
+                             if self.fleet.stages[o['stage']]['name'] == 'Fleet')
+        assert fleet_install['action'] == 'REBOOT'
+        assert fleet_install['action_args']['body']['command'] == 'REBOOT'
+        assert group_2['id'] in fleet_install['action_args']['url']
+
+    def test_reads_bypass_the_cache(self):
+        self.set_config(cache_dir=os.path.abspath('http'), cache_max_bytes=1024 * 1024)
+        self.addCleanup(cache.configure, cache.directory, 0)
+
+        exit_code, data = self.apply(SPEC)
+        pipeline_id = data['pipeline_id']
+        self.apply(SPEC)
+
+        # Edited elsewhere while the previous reads are still cached
+        self.fleet.pipelines[pipeline_id]['description'] = 'Edited in the console'
+        exit_code, data = self.apply(SPEC)
+        assert [(row['action'], row['kind']) for row in data['changes']] == [('update', 'pipeline')]
+        assert self.fleet.pipelines[pipeline_id]['description'] == 'Canary then everyone'
+
+    def test_invalid_spec(self):
+        exit_code, data = self.apply({'name': 'Broken', 'stages': [{'name': 'A', 'operations': [
+            {'name': 'Install', 'action': 'NOPE'}]}]})
+        assert exit_code == 1
+        assert data.startswith("ERROR: Operation 'Install' of stage 'A' needs an action")
+
+        exit_code, data = self.apply({'name': 'Missing group', 'stages': [{'name': 'A', 'operations': [
+            {'name': 'Install', 'action': 'REBOOT', 'group': 'Nope'}]}]})
+        assert data == 'ERROR: No such group: Nope\n'
+        assert self.writes() == 0
@@ -0,0 +1,35 @@
+from esper.ext.dispatch import run_command
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class BatchTest(MockApiTestCase):
+    fleet_options = {'devices': 50, 'groups': 2, 'applications': 2}
+
+    def test_run_command_captures_output(self):
+        with EsperTest(argv=['token', 'show']) as app:
+            app.run()
+
+            code, output = run_command(app, ['group', 'list', '-j'], capture=True)
+            assert code == 0
+            assert 'Group 1' in output
+
+            code, output = run_command(app, ['device', 'show', self.fleet.device_name(3), '-j'], capture=True)
+            assert code == 0
+            assert self.fleet.device_ids[3] in output
+
+            code, output = run_command(app, ['no-such-command'], capture=True)
+            assert code == 2
+
+            code, output = run_command(app, ['batch', '-'], capture=True)
+            assert code == 1
+
+    def test_batch_file(self):
+        with open('commands.txt', 'w') as f:
+            f.write("# warm process\ngroup list\n\ndevice list -l 5\nno-such-command\n")
+
+        with EsperTest(argv=['batch', 'commands.txt', '--jsonl']) as app:
+            app.run()
+            assert app.exit_code == 1
+
+        assert self.api.request_count == 2
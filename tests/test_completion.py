@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import time
+from unittest import mock
+
+from esper.ext import completion
+from esper.ext.completion import complete, lookup, refresh_in_background, write_names
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class CompletionTest(MockApiTestCase):
+    fleet_options = {'devices': 250, 'groups': 3, 'applications': 2}
+
+    def setUp(self) -> None:
+        super(CompletionTest, self).setUp()
+        self.fleet.pipelines['p1'] = {'id': 'p1', 'name': 'Kiosk rollout'}
+
+        self.index = os.path.abspath('names')
+        self.set_env(ESPER_NAME_INDEX=self.index)
+
+    def refresh(self):
+        with EsperTest(argv=['completion', 'refresh']) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert app.exit_code == 0
+        return {row['KIND']: row['NAMES'] for row in data}
+
+    def test_lookup_bisects_sorted_names(self):
+        write_names('group', ['beta', 'alpha', 'alps', 'alpha', 'gamma', ''], self.index)
+
+        assert lookup('group', 'al', self.index) == ['alpha', 'alps']
+        assert lookup('group', '', self.index) == ['alpha', 'alps', 'beta', 'gamma']
+        assert lookup('group', 'x', self.index) == []
+        assert lookup('device', 'a', self.index) == []
+
+    def test_refresh_indexes_names_and_commands(self):
+        counts = self.refresh()
+        assert counts == {'device': 250, 'group': 4, 'application': 2, 'pipeline': 1}
+
+        assert complete(['device', 'show', 'ESR-BNC-00024'], self.index) == \
+            ['ESR-BNC-000240', 'ESR-BNC-000241', 'ESR-BNC-000242', 'ESR-BNC-000243', 'ESR-BNC-000244',
+             'ESR-BNC-000245', 'ESR-BNC-000246', 'ESR-BNC-000247', 'ESR-BNC-000248', 'ESR-BNC-000249']
+        assert complete(['group', 'add', '-g', 'Gr'], self.index) == ['Group 1', 'Group 2', 'Group 3']
+        assert complete(['group', 'add', '-g', 'All devices', '--devices', 'ESR-BNC-000001', 'ESR-BNC-00000'],
+                        self.index)[:2] == ['ESR-BNC-000000', 'ESR-BNC-000001']
+        assert complete(['app', 'list', '--name', 'Bench'], self.index) == ['Bench App 1', 'Bench App 2']
+        assert complete(['-D', 'pipeline', 'edit', '-n', 'Ki'], self.index) == ['Kiosk rollout']
+
+        assert 'completion' in complete([''], self.index)
+        assert complete(['grou'], self.index) == ['group', 'group-command']
+        assert complete(['device', 'list', '--st'], self.index) == ['--state']
+        assert complete(['device', 'list', '--limit', ''], self.index) == []
+
+    def test_complete_command_is_light(self):
+        self.refresh()
+        os.utime(os.path.join(self.index, completion.REFRESHED_FILE))
+
+        script = ("import sys\n"
+                  "from esper.cli import main\n"
+                  "sys.argv = ['espercli', '__complete', '--', 'group', 'show', 'Group 3']\n"
+                  "try:\n"
+                  "    main()\n"
+                  "except SystemExit:\n"
+                  "    pass\n"
+                  "sys.stderr.write(' '.join(m for m in ('cement', 'esperclient') if m in sys.modules))\n")
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', script], cwd=self.cwd, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+
+        assert result.stdout == 'Group 3\n'
+        assert result.stderr == ''
+        # Interpreter startup included, well within what a keypress can wait for
+        assert elapsed < 1.0
+
+    def test_stale_index_is_refreshed_in_background(self):
+        with mock.patch('subprocess.Popen') as popen:
+            assert refresh_in_background(self.index)
+            assert not refresh_in_background(self.index)
+            assert popen.call_count == 1
+            assert popen.call_args[0][0][-3:] == ['completion', 'refresh', '--quiet']
+
+            # A refreshed index is left alone, a stale one is refreshed once the previous attempt is old enough
+            completion.mark_refreshed(self.index)
+            os.utime(os.path.join(self.index, completion.ATTEMPT_FILE), (0, 0))
+            assert not refresh_in_background(self.index)
+
+            os.utime(os.path.join(self.index, completion.REFRESHED_FILE), (0, 0))
+            assert refresh_in_background(self.index)
+            assert popen.call_count == 2
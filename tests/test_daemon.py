@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+from esper.ext.daemon import control, forward, is_forwardable, serve
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class DaemonTest(MockApiTestCase):
+    fleet_options = {'devices': 20, 'groups': 2, 'applications': 1}
+
+    def setUp(self) -> None:
+        super(DaemonTest, self).setUp()
+        self.socket = os.path.join(self.tmp, 'run', 'espercli.sock')
+
+    def test_is_forwardable(self):
+        assert is_forwardable(['device', 'list'])
+        assert not is_forwardable([])
+        assert not is_forwardable(['configure'])
+        assert not is_forwardable(['--debug', 'device', 'list'])
+        assert not is_forwardable(['--timings-file=x.jsonl', 'group', 'list'])
+
+    def test_commands_reading_stdin_run_locally(self):
+        assert not is_forwardable(['group', 'add', '-g', 'Group 1', '-f', '-'])
+        assert not is_forwardable(['rollout', 'install', '--file=-'])
+        assert not is_forwardable(['pipeline', 'apply', '-f', '-'])
+        assert is_forwardable(['pipeline', 'apply', '-f', 'pipeline.yml'])
+
+    def test_prompting_commands_run_locally(self):
+        assert not is_forwardable(['pipeline', 'create'])
+        assert not is_forwardable(['pipeline', 'stage', 'edit', '-p', 'p1'])
+        assert not is_forwardable(['pipeline', 'stage', 'operation', 'create'])
+        assert not is_forwardable(['--refresh', 'pipeline', 'execute', 'stop'])
+
+    def test_watch_commands_run_locally(self):
+        assert not is_forwardable(['group-command', 'watch', 'c1'])
+        assert not is_forwardable(['group-command', 'reboot', '-g', 'Group 1', '--wait'])
+        assert not is_forwardable(['pipeline', 'execute', 'watch', '-p', 'p1', '-e', 'e1'])
+        assert not is_forwardable(['rollout', 'install', '-V', 'v1', '-g', 'Group 1'])
+        assert is_forwardable(['group-command', 'show', 'c1'])
+        assert is_forwardable(['app', 'upload', 'build', '-w', '4'])
+
+    def test_forward_to_daemon(self):
+        assert forward(['group', 'list'], self.socket) is None
+
+        with EsperTest(argv=['token', 'show']) as app:
+            app.run()
+
+            thread = threading.Thread(target=serve, args=(app, self.socket), daemon=True)
+            thread.start()
+            for _ in range(50):
+                if control('ping', self.socket):
+                    break
+                time.sleep(0.05)
+
+            reply = forward(['group', 'list', '-j'], self.socket)
+            assert reply['exit_code'] == 0
+            assert 'Group 2' in reply['stdout']
+
+            reply = forward(['no-such-command'], self.socket)
+            assert reply['exit_code'] == 2
+            assert 'invalid choice' in reply['stderr']
+
+            assert control('ping', self.socket)['served'] == 2
+            assert control('stop', self.socket) == {'stopping': True}
+            thread.join(5)
+
+        assert not os.path.exists(self.socket)
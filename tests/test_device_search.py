@@ -0,0 +1,114 @@
+import io
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from esper.ext.device_search import DeviceIndex, choose_device
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+RECORDS = [
+    ('id-0', 'ESR-BNC-000001', 'Front desk', 'SN0001', ('350000000000001',), ('lobby', 'kiosk')),
+    ('id-1', 'ESR-BNC-000002', '', 'SN0002', ('350000000000002',), ('warehouse',)),
+    ('id-2', 'ESR-BNC-000120', '', 'SN0120', (), ('warehouse',)),
+    ('id-3', 'Pixel tablet', 'Back office', 'R52N', (), ()),
+]
+
+
+class DeviceIndexTest(TestCase):
+
+    def setUp(self) -> None:
+        self.index = DeviceIndex(RECORDS)
+
+    def names(self, query):
+        return [match.device[1] for match in self.index.search(query)]
+
+    def test_exact_matches_on_any_field(self):
+        for query in ('esr-bnc-000002', 'SN0002', '350000000000002'):
+            match = self.index.search(query)[0]
+            assert (match.device[0], match.score) == ('id-1', 1.0)
+
+        assert [match.field for match in self.index.search('front desk')][:1] == ['alias']
+        assert sorted(self.names('warehouse')) == ['ESR-BNC-000002', 'ESR-BNC-000120']
+
+    def test_partial_and_misspelled_queries_rank_closest_first(self):
+        assert self.names('ESR-BNC-0000') == ['ESR-BNC-000001', 'ESR-BNC-000002', 'ESR-BNC-000120']
+        assert self.names('tablet') == ['Pixel tablet']
+        assert self.names('pixle tablet') == ['Pixel tablet']
+        assert self.names('ESR-BCN-000120')[0] == 'ESR-BNC-000120'
+        assert self.names('backofice') == ['Pixel tablet']
+        assert self.names('zzzz') == []
+
+    def test_only_an_exact_match_is_chosen_without_asking(self):
+        app = mock.Mock()
+        with mock.patch('esper.ext.device_search.sys.stdin') as stdin, mock.patch('sys.stderr', new=io.StringIO()):
+            stdin.isatty.return_value = False
+            assert choose_device(app, 'sn0002', self.index.search('sn0002')).device[0] == 'id-1'
+            # A unique prefix or tag still names the wrong device too easily
+            assert choose_device(app, 'pixel', self.index.search('pixel')) is None
+            assert choose_device(app, 'lobby', self.index.search('lobby')) is None
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        assert DeviceIndex.load(directory) is None
+
+        self.index.save(directory)
+        assert self.names('kiosk') == [match.device[1] for match in DeviceIndex.load(directory).search('kiosk')]
+
+
+class DeviceResolutionTest(MockApiTestCase):
+    fleet_options = {'devices': 300, 'groups': 2, 'applications': 1}
+
+    def setUp(self) -> None:
+        super(DeviceResolutionTest, self).setUp()
+        self.set_env(ESPER_NAME_INDEX=os.path.abspath('names'))
+
+        with EsperTest(argv=['completion', 'refresh', '-q']) as app:
+            app.run()
+            assert app.exit_code == 0
+
+    def test_device_resolved_by_serial(self):
+        with EsperTest(argv=['device', 'show', 'SN00000042']) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert data[1]["DETAILS"] == 'ESR-BNC-000042'
+
+    def test_misspelled_device_is_offered_on_a_terminal(self):
+        argv = ['installs', 'list', '-d', 'ESR-BCN-000042']
+        with mock.patch('esper.ext.device_search.sys.stdin') as stdin, \
+                mock.patch('esper.ext.device_search.prompt.options') as options:
+            options.side_effect = lambda text, choices: choices[0]['return']
+
+            stdin.isatty.return_value = False
+            with EsperTest(argv=argv) as app:
+                app.run()
+                data, output = app.last_rendered
+                assert data == 'Device does not exist with name ESR-BCN-000042\n'
+                assert not options.called
+
+            stdin.isatty.return_value = True
+            with EsperTest(argv=argv) as app:
+                app.run()
+                assert options.call_args[0][1][0]['prompt'] == 'ESR-BNC-000042'
+                assert self.api.requests_by_route['GET get_device'] == 1
+                assert self.api.requests_by_route['GET list_installs'] == 1
+
+    def test_partial_match_is_not_acted_on_without_a_terminal(self):
+        argv = ['device-command', 'reboot', '-d', 'BNC-000042']
+        with mock.patch('esper.ext.device_search.sys.stdin') as stdin, \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            stdin.isatty.return_value = False
+            with EsperTest(argv=argv) as app:
+                app.run()
+                data, output = app.last_rendered
+
+        assert data == 'Device does not exist with name BNC-000042\n'
+        assert "No device is named 'BNC-000042', closest matches:\n  ESR-BNC-000042\n" in stderr.getvalue()
+        assert 'POST run_command' not in self.api.requests_by_route
+
+    def test_search_command(self):
+        with EsperTest(argv=['device', 'search', 'esr-bnc-00029', '-l', '3', '-j']) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert [device['name'] for device in data] == ['ESR-BNC-000290', 'ESR-BNC-000291', 'ESR-BNC-000292']
+            assert all(device['field'] == 'name' for device in data)
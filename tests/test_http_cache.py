@@ -0,0 +1,95 @@
+import os
+import time
+from unittest import mock
+
+from esperclient import DeviceGroup
+
+from esper.ext.api_client import APIClient, EsperSession
+from esper.ext.http_cache import cache, resource_scope
+from tests.utils import MockApiTestCase
+
+
+class HttpCacheTest(MockApiTestCase):
+    fleet_options = {'devices': 10, 'groups': 2, 'applications': 1}
+
+    def setUp(self) -> None:
+        super(HttpCacheTest, self).setUp()
+        self.directory = os.path.join(self.tmp, 'http')
+        cache.configure(self.directory, 1024 * 1024)
+
+        client = APIClient({'api_key': 'bench-token', 'environment': 'bench'})
+        client.config.host = f'{self.server.url}/api'
+        self.group_client = client.get_group_api_client()
+
+    def tearDown(self) -> None:
+        cache.configure(self.directory, 0)
+        cache.refresh = False
+
+    def test_resource_scope(self):
+        assert resource_scope('https://foo-api.esper.cloud/api/enterprise/e1/devicegroup/g1/command/') == \
+               '/api/enterprise/e1/devicegroup'
+        assert resource_scope('https://foo-api.esper.cloud/api/v1/enterprise/e1/pipeline/p1/stage/') == \
+               '/api/v1/enterprise/e1/pipeline'
+        assert resource_scope('https://foo-api.esper.cloud/api/v1/token-info/') == '/api/v1'
+
+    def test_get_is_cached_and_writes_invalidate(self):
+        first = self.group_client.get_all_groups(self.fleet.enterprise_id)
+        second = self.group_client.get_all_groups(self.fleet.enterprise_id)
+        assert self.api.request_count == 1
+        assert second.count == first.count == 3
+
+        self.group_client.create_group(self.fleet.enterprise_id, DeviceGroup(name='New group'))
+        third = self.group_client.get_all_groups(self.fleet.enterprise_id)
+        assert self.api.request_count == 3
+        assert third.count == 4
+
+        cache.refresh = True
+        self.group_client.get_all_groups(self.fleet.enterprise_id)
+        assert self.api.request_count == 4
+
+    def test_stale_entries_are_revalidated(self):
+        cache.configure(self.directory, 1024 * 1024, {'/api/enterprise/{id}/devicegroup/': 0.2})
+
+        self.group_client.get_all_groups(self.fleet.enterprise_id)
+        time.sleep(0.3)
+        response = self.group_client.get_all_groups(self.fleet.enterprise_id)
+        assert response.count == 3
+        assert self.api.request_count == 2
+
+        # The 304 restarted the TTL
+        self.group_client.get_all_groups(self.fleet.enterprise_id)
+        assert self.api.request_count == 2
+
+    def test_session_responses_are_cached(self):
+        session = EsperSession()
+        url = f'{self.server.url}/api/v1/token-info/'
+        headers = {'Authorization': 'Bearer bench-token'}
+
+        assert session.get(url, headers=headers).json()['enterprise'] == self.fleet.enterprise_id
+        assert session.get(url, headers=headers).json()['enterprise'] == self.fleet.enterprise_id
+        session.get(url, headers={'Authorization': 'Bearer other-token'})
+        assert self.api.request_count == 2
+
+    def test_lru_eviction(self):
+        cache.configure(self.directory, 4096)
+        for i in range(20):
+            cache.put(f'k{i}', f'https://foo/{i}', b'x' * 500, 60)
+
+        assert sum(os.path.getsize(os.path.join(self.directory, f)) for f in os.listdir(self.directory)) <= 4096
+        assert cache.get('k19') is not None
+        assert cache.get('k0') is None
+
+    def test_eviction_scans_only_when_over_the_limit(self):
+        cache.configure(self.directory, 4096)
+        with mock.patch.object(cache, 'evict', wraps=cache.evict) as evict:
+            for i in range(6):
+                cache.put(f'k{i}', f'https://foo/{i}', b'x' * 500, 60)
+            # One scan to learn the size of the directory, none while it stays under the limit
+            assert evict.call_count == 1
+
+            for i in range(6):
+                cache.put(f'k{i}', f'https://foo/{i}', b'x' * 500, 60)
+            assert evict.call_count == 1
+
+            cache.put('k6', 'https://foo/6', b'x' * 1500, 60)
+            assert evict.call_count == 2
@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from tabulate import tabulate
+
+from esper.controllers.enums import DeviceState
+from esper.ext.listing import DEVICES, INSTALLS
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+DEVICE = {
+    'id': 'id-1',
+    'device_name': 'ESR-BNC-000001',
+    'alias_name': 'Front desk',
+    'status': 1,
+    'tags': ['lobby', 'kiosk'],
+    'hardwareInfo': {'manufacturer': 'Esper', 'serialNumber': 'SN0001'},
+    'networkInfo': {'imei1': '350000000000001'},
+}
+
+
+class ListingTest(TestCase):
+
+    def test_default_and_chosen_fields(self):
+        assert [column.field for column in DEVICES.select()] == ['id', 'name', 'model', 'state', 'tags']
+        assert [column.field for column in DEVICES.select('serial, id,serial')] == ['serial', 'id']
+
+        with self.assertRaises(ValueError) as error:
+            DEVICES.select('id,colour')
+        assert 'colour' in str(error.exception)
+
+    def test_rows_read_only_chosen_fields(self):
+        row, = DEVICES.rows([DEVICE], DEVICES.select())
+        assert row["NAME"] == 'Front desk'
+        assert row["CURRENT STATE"] == 'ACTIVE'
+        assert row["TAGS"] == 'lobby, kiosk'
+        assert not hasattr(row, '__dict__')
+        assert 'NAME  ' in tabulate([row], headers="keys", tablefmt="plain")
+
+        row, = DEVICES.rows([DEVICE], DEVICES.select('imei,tags'), json_keys=True)
+        assert row.as_dict() == {'imei': '350000000000001', 'tags': ['lobby', 'kiosk']}
+
+    def test_missing_nested_values(self):
+        row, = INSTALLS.rows([{'id': 'install-1', 'install_state': 'INSTALL_SUCCESS'}], INSTALLS.select())
+        assert list(row.values()) == ['install-1', None, None, None, 'INSTALL_SUCCESS']
+
+
+class ListCommandTest(MockApiTestCase):
+    fleet_options = {'devices': 150, 'groups': 2, 'applications': 3}
+
+    def test_device_list_fields(self):
+        with EsperTest(argv=['device', 'list', '-l', '100', '--fields', 'id,name,state', '-j']) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert len(data) == 100
+            assert data[0] == {'id': self.fleet.device_ids[0], 'device': 'ESR-BNC-000000',
+                               'state': DeviceState(self.fleet.device_status(0)).name}
+
+    def test_unknown_field(self):
+        with EsperTest(argv=['app', 'list', '--fields', 'name,size']) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert data.startswith('ERROR: Unknown fields size')
+            assert 'GET list_applications' not in self.api.requests_by_route
@@ -0,0 +1,53 @@
+import logging
+import os
+import queue
+import shutil
+import tempfile
+from unittest import TestCase
+
+from esper.core.log_handler import DeferredQueueHandler, EsperLogHandler
+from esper.main import EsperTest
+
+
+class LogHandlerTest(TestCase):
+
+    def setUp(self) -> None:
+        # EsperTest opens `./creds.json`, keep it out of the checkout
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, self.cwd)
+
+    def test_file_is_written_in_the_background_at_its_own_level(self):
+        path = os.path.join(self.tmp, 'logs', 'esper.log')
+
+        with EsperTest(argv=[]) as app:
+            app.config.set('log.colorlog', 'file', path)
+            app.config.set('log.colorlog', 'file_level', 'debug')
+            app.log.set_level('info')
+
+            assert isinstance(app.log, EsperLogHandler)
+            levels = {type(handler).__name__: handler.level for handler in app.log.backend.handlers}
+            assert levels['DeferredQueueHandler'] == logging.DEBUG
+            # The console keeps its level
+            assert levels['StreamHandler'] == logging.INFO
+
+            app.log.debug('per-packet detail')
+            app.log.info('session started')
+            app.log.stop()
+
+        with open(path) as f:
+            assert [line.split(' : ')[-1] for line in f.read().splitlines()] == ['per-packet detail', 'session started']
+
+    def test_records_are_formatted_on_the_writer_thread(self):
+        records = queue.SimpleQueue()
+        logger = logging.getLogger('test-deferred')
+        logger.propagate = False
+        logger.addHandler(DeferredQueueHandler(records))
+        self.addCleanup(logger.handlers.clear)
+
+        logger.warning('%d bytes relayed', 1024)
+
+        record = records.get_nowait()
+        assert not hasattr(record, 'message') and record.args == (1024,)
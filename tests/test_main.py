@@ -1,6 +1,14 @@
+import pytest
+
 from esper.main import EsperTest
 
 
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # EsperTest opens `./creds.json`, keep it out of the checkout
+    monkeypatch.chdir(tmp_path)
+
+
 def test_esper():
     # test esper without any subcommands or arguments
     with EsperTest() as app:
@@ -0,0 +1,23 @@
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class MockApiTest(MockApiTestCase):
+    fleet_options = {'devices': 250, 'groups': 4, 'applications': 3}
+
+    def test_device_list(self):
+        argv = ['device', 'list', '-l', '100', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert len(data) == 100
+            assert data[0]['device'] == self.fleet.device_name(0)
+
+        assert self.api.request_count == 1
+
+    def test_group_devices(self):
+        argv = ['group', 'devices', '-g', 'Group 1', '-l', '200', '-j']
+        with EsperTest(argv=argv) as app:
+            app.run()
+            data, output = app.last_rendered
+            assert len(data) == len(self.fleet.filter_devices({'group': list(self.fleet.groups)[1]}))
@@ -0,0 +1,79 @@
+import io
+import os
+from unittest import mock
+
+from esperclient.rest import ApiException
+
+from esper.ext.http_cache import cache
+from esper.main import EsperTest
+from tests.utils import MockApiTestCase
+
+
+class OfflineTest(MockApiTestCase):
+    fleet_options = {'devices': 60, 'groups': 2, 'applications': 2}
+
+    def setUp(self) -> None:
+        super(OfflineTest, self).setUp()
+        self.set_config(cache_dir=os.path.abspath('http'), cache_max_bytes=1024 * 1024, retries=0, offline_cache=True)
+
+    def tearDown(self) -> None:
+        cache.configure(cache.directory, 0)
+        cache.offline = cache.stale_ok = False
+
+    def run_command(self, *argv):
+        with EsperTest(argv=list(argv)) as app:
+            app.run()
+            data, output = app.last_rendered
+        return data
+
+    def test_reads_are_answered_from_the_cache(self):
+        devices = self.run_command('device', 'list', '-l', '50', '-j')
+        groups = self.run_command('group', 'list', '-j')
+        device = self.run_command('device', 'show', 'ESR-BNC-000003', '-j')
+        requests = self.api.request_count
+
+        assert self.run_command('--offline', 'device', 'list', '-l', '50', '-j') == devices
+        assert self.run_command('--offline', 'group', 'list', '-j') == groups
+        assert self.run_command('--offline', 'device', 'show', 'ESR-BNC-000003', '-j') == device
+        assert self.api.request_count == requests
+        assert len(cache.served_ages) == 1
+
+        data = self.run_command('--offline', 'device', 'list', '-l', '10')
+        assert data.startswith('ERROR: Offline mode, there is no cached response')
+        assert self.api.request_count == requests
+
+    def test_writes_fail_without_a_request(self):
+        self.run_command('group', 'list')
+        requests = self.api.request_count
+
+        data = self.run_command('--offline', 'group', 'create', '-n', 'Offline group')
+        assert data.startswith('ERROR: Offline mode, POST /api/enterprise/{id}/devicegroup/ needs the API')
+        assert self.api.request_count == requests
+        assert len(self.fleet.groups) == 3
+
+    def test_stale_responses_when_the_api_is_down(self):
+        devices = self.run_command('device', 'list', '-l', '50', '-j')
+        groups = self.run_command('group', 'list', '-j')
+
+        unavailable = mock.patch('esper.ext.api_client.EsperApiClient._timed_request',
+                                 side_effect=ApiException(status=503, reason='Service Unavailable'))
+        with unavailable, mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            data = self.run_command('device', 'list', '-l', '50', '-j')
+            assert data == 'ERROR: Service Unavailable\n'
+
+            assert self.run_command('--stale-ok', 'device', 'list', '-l', '50', '-j') == devices
+            assert self.run_command('--refresh', '--stale-ok', 'group', 'list', '-j') == groups
+
+        assert 'Served from the local cache (API unavailable), data up to 0s old' in stderr.getvalue()
+
+    def test_device_reads_are_only_stored_when_opted_in(self):
+        self.set_config(offline_cache=False)
+        self.run_command('device', 'list', '-l', '50', '-j')
+        self.run_command('device', 'show', 'ESR-BNC-000003', '-j')
+        assert os.listdir('http') == []
+
+        data = self.run_command('--offline', 'device', 'list', '-l', '50', '-j')
+        assert data.startswith('ERROR: Offline mode, there is no cached response')
+
+        devices = self.run_command('--stale-ok', 'device', 'list', '-l', '50', '-j')
+        assert self.run_command('--offline', 'device', 'list', '-l', '50', '-j') == devices
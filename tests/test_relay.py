@@ -0,0 +1,136 @@
+import logging
+import queue
+import socket
+import threading
+import time
+from unittest import TestCase
+
+from esper.ext.relay import LATENCY_BUFFER_SIZE, ReconnectingRelay, Relay
+
+
+class RelayTest(TestCase):
+
+    def connect(self, mode):
+        server = socket.create_server(('127.0.0.1', 0))
+        relay_leg = socket.create_connection(server.getsockname())
+        device_end, _ = server.accept()
+        server.close()
+
+        relay = Relay(relay_conn=relay_leg, relay_addr=relay_leg.getsockname(), log=logging.getLogger('test'),
+                      mode=mode)
+        client = socket.create_connection(relay.get_listener_address())
+        relay.accept_connection()
+        self.addCleanup(client.close)
+        self.addCleanup(device_end.close)
+        self.addCleanup(relay.cleanup_connections)
+        return relay
+
+    @staticmethod
+    def nodelay(sock):
+        return sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+
+    def test_latency_mode_sends_small_writes_at_once(self):
+        relay = self.connect('latency')
+
+        assert self.nodelay(relay.inbound_conn) and self.nodelay(relay.outbound_conn)
+        # Linux reports twice the requested size
+        assert LATENCY_BUFFER_SIZE <= relay.inbound_conn.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) \
+            <= 2 * LATENCY_BUFFER_SIZE
+
+    def test_bulk_mode_keeps_kernel_defaults(self):
+        relay = self.connect('bulk')
+
+        assert not self.nodelay(relay.inbound_conn) and not self.nodelay(relay.outbound_conn)
+
+
+class ReconnectingRelayTest(TestCase):
+
+    def setUp(self) -> None:
+        # Stands in for the TCP relay: every negotiation connects to it, and its end of each connection is queued
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.devices = queue.Queue()
+        self.negotiations = 0
+        self.failures = 0
+
+        relay = ReconnectingRelay(negotiate=self.negotiate, log=logging.getLogger('test'))
+        relay.retry_delay = 0.01
+        self.relay = relay
+        self.address = relay.get_listener_address()
+        self.thread = threading.Thread(target=relay.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.relay.stop_relay()
+        self.relay.cleanup_connections()
+        self.thread.join(timeout=5)
+        self.server.close()
+
+    def negotiate(self):
+        self.negotiations += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('relay not ready')
+
+        conn = socket.create_connection(self.server.getsockname())
+        self.devices.put(self.server.accept()[0])
+        return conn
+
+    def session(self):
+        client = socket.create_connection(self.address)
+        device = self.devices.get(timeout=5)
+        client.sendall(b'ping')
+        assert device.recv(4) == b'ping'
+        device.sendall(b'pong')
+        assert client.recv(4) == b'pong'
+        return client, device
+
+    def test_clients_reconnect_to_the_same_port_after_the_relay_drops(self):
+        client, device = self.session()
+
+        # The TCP relay drops the session: the ADB client is disconnected, the listener stays. Renegotiating
+        # fails twice before it connects again.
+        self.failures = 2
+        device.close()
+        assert client.recv(4) == b''
+        client.close()
+
+        client, device = self.session()
+        assert self.relay.get_listener_address() == self.address
+        assert self.relay.sessions == 2
+        assert self.negotiations == 4
+
+        client.close()
+        device.close()
+
+    def test_stop_while_negotiating(self):
+        def unreachable():
+            raise ConnectionError('relay not ready')
+
+        relay = ReconnectingRelay(negotiate=unreachable, log=logging.getLogger('test'))
+        relay.retry_delay = 0.01
+        relay.accept_interval = 0.05
+        thread = threading.Thread(target=relay.serve_forever, daemon=True)
+        thread.start()
+        while relay._next is None:
+            time.sleep(0.01)
+
+        # The negotiation ends without a connection, there is nothing to close
+        relay.stop_relay()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        assert relay._next.result(timeout=5) is None
+
+    def test_stop_closes_an_unused_negotiated_connection(self):
+        client, device = self.session()
+        client.close()
+        device.close()
+
+        # The next session was negotiated but no ADB client came
+        for _ in range(100):
+            if self.relay._next is not None and self.relay._next.done() and self.relay.sessions == 1:
+                break
+            time.sleep(0.05)
+        unused = self.relay._next.result()
+
+        self.relay.stop_relay()
+        assert unused.fileno() == -1
@@ -0,0 +1,24 @@
+from unittest import TestCase
+
+from benchmarks.relay_bench import IMPLEMENTATIONS, regressions, run_benchmarks
+
+
+class RelayBenchTest(TestCase):
+
+    def test_every_relay_moves_data_through_tls(self):
+        results = run_benchmarks(IMPLEMENTATIONS, size_mb=1, pings=20)
+
+        assert [result['relay'] for result in results] == list(IMPLEMENTATIONS)
+        for result in results:
+            assert result['upload_mb_s'] > 0
+            assert result['download_mb_s'] > 0
+            assert 0 < result['rtt_p50_ms'] <= result['rtt_p99_ms']
+
+    def test_regressions(self):
+        baseline = [{'relay': 'relay', 'upload_mb_s': 100, 'download_mb_s': 100, 'rtt_p50_ms': 0.1,
+                     'rtt_p99_ms': 0.2, 'cpu_s_per_gb': 5}]
+        current = [dict(baseline[0], upload_mb_s=70, rtt_p99_ms=0.22)]
+
+        assert regressions(current, baseline, 0.2) == ['relay upload_mb_s: 70 < 100']
+        assert regressions(current, baseline, 0.4) == []
+        assert regressions([dict(current[0], relay='mediator')], baseline, 0.2) == []
@@ -0,0 +1,77 @@
+import io
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from urllib.request import urlopen
+
+from esper.ext.relay import Relay
+from esper.ext.relay_metrics import StatsReporter
+
+
+class RelayMetricsTest(TestCase):
+
+    def setUp(self) -> None:
+        server = socket.create_server(('127.0.0.1', 0))
+        relay_leg = socket.create_connection(server.getsockname())
+        self.device, _ = server.accept()
+        server.close()
+
+        self.relay = Relay(relay_conn=relay_leg, relay_addr=relay_leg.getsockname(), log=logging.getLogger('test'))
+        self.client = socket.create_connection(self.relay.get_listener_address())
+        self.relay.accept_connection()
+        self.thread = threading.Thread(target=self.relay.start_relay, daemon=True)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.device.close()
+        self.thread.join(timeout=5)
+        self.relay.cleanup_connections()
+
+    def relay_traffic(self):
+        self.client.sendall(b'x' * 100000)
+        received = 0
+        while received < 100000:
+            received += len(self.device.recv(65536))
+
+        self.device.sendall(b'ok')
+        assert self.client.recv(2) == b'ok'
+
+        # Either end can read a chunk before its forwarder has counted it
+        deadline = time.time() + 5
+        while (self.relay.forward.in_flight or self.relay.reverse.in_flight) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_stats_are_published_while_the_session_runs(self):
+        stream = io.StringIO()
+        textfile = os.path.join(tempfile.mkdtemp(), 'metrics', 'espercli.prom')
+        reporter = StatsReporter(self.relay, interval=60, status=True, textfile=textfile, port=0, stream=stream)
+
+        self.relay_traffic()
+        sample = reporter.publish()
+
+        up, down = sample['directions']['to_device'], sample['directions']['from_device']
+        assert up['bytes'] == 100000 and up['packets'] >= 2
+        assert down['bytes'] == 2 and down['packets'] == 1
+        assert up['peak_throughput'] == 0 and up['stalls'] == 0
+
+        assert stream.getvalue().startswith('up ') and ' | down ' in stream.getvalue()
+        with open(textfile) as f:
+            assert 'espercli_relay_bytes_total{direction="to_device"} 100000\n' in f.read()
+
+        host, port = reporter.address
+        with urlopen(f'http://{host}:{port}/') as response:
+            assert json.load(response)['directions']['from_device']['bytes'] == 2
+        with urlopen(f'http://{host}:{port}/metrics') as response:
+            assert b'espercli_relay_packets_total{direction="from_device"} 1\n' in response.read()
+
+        # The second sample has a throughput to compare with
+        self.relay_traffic()
+        sample = reporter.stop()
+        assert sample['directions']['to_device']['bytes'] == 200000
+        assert sample['directions']['to_device']['peak_throughput'] > 0
@@ -0,0 +1,91 @@
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from tinydb import TinyDB
+
+from esper.controllers.secureadb.secureadb import SecureADB
+from esper.ext.certs import create_self_signed_cert_root
+from esper.ext.db_wrapper import DBWrapper
+from esper.ext.timings import PhaseTimer
+from esper.main import EsperTest, TEST_CONFIG
+
+MODULE = 'esper.controllers.secureadb.secureadb'
+
+
+class SecureADBNegotiationTest(TestCase):
+
+    def setUp(self) -> None:
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        DBWrapper(TinyDB('creds.json')).set_configure({
+            'environment': 'bench',
+            'api_key': 'bench-token',
+            'enterprise_id': 'enterprise'
+        })
+
+        self.config = mock.patch.dict(TEST_CONFIG['esper'], {
+            'certs_folder': self.directory,
+            'local_key': os.path.join(self.directory, 'local.key'),
+            'local_cert': os.path.join(self.directory, 'local.pem'),
+            'device_cert': os.path.join(self.directory, 'device.pem')
+        })
+        self.config.start()
+
+        # Stands in for the TCP relay, with the device's certificate
+        self.device_cert, self.device_key = 'endpoint.pem', 'endpoint.key'
+        create_self_signed_cert_root(self.device_cert, self.device_key)
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.accepted = []
+
+    def tearDown(self) -> None:
+        self.server.close()
+        self.config.stop()
+        os.chdir(self.cwd)
+
+    def serve(self, app):
+        conn, _ = self.server.accept()
+        self.accepted.append(time.perf_counter())
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.load_verify_locations(cafile=app.local_cert)
+        context.load_cert_chain(certfile=self.device_cert, keyfile=self.device_key)
+        with context.wrap_socket(conn, server_side=True) as secure:
+            secure.sendall(secure.recv(4))
+
+    def test_relay_is_connected_while_the_device_certificate_is_polled(self):
+        with open(self.device_cert) as f:
+            device_cert = f.read()
+        fetched = []
+
+        def fetch_device_certificate(**kwargs):
+            time.sleep(0.3)
+            fetched.append(time.perf_counter())
+            return device_cert
+
+        with EsperTest(argv=[]) as app, \
+                mock.patch(f'{MODULE}.initiate_remoteadb_connection', return_value='session-id') as initiate, \
+                mock.patch(f'{MODULE}.fetch_relay_endpoint', return_value=self.server.getsockname()), \
+                mock.patch(f'{MODULE}.fetch_device_certificate', fetch_device_certificate):
+            controller = SecureADB()
+            controller._setup(app)
+            phases = PhaseTimer()
+            controller._create_certs(phases)
+
+            server = threading.Thread(target=self.serve, args=(app,), daemon=True)
+            server.start()
+            with controller._negotiate_session('enterprise', 'device', phases) as secure_sock:
+                secure_sock.sendall(b'ping')
+                assert secure_sock.recv(4) == b'ping'
+            server.join(timeout=5)
+
+        assert initiate.call_args[1]['device_id'] == 'device'
+        assert self.accepted[0] < fetched[0]
+        assert {row['PHASE'] for row in phases.summary()} == \
+            {'certificates', 'session', 'device certificate', 'relay endpoint', 'relay connect', 'tls handshake'}
@@ -0,0 +1,95 @@
+import time
+from unittest import TestCase, mock
+
+from esperclient.rest import ApiException
+
+from benchmarks.fleet import Fleet
+from benchmarks.mock_api import MockEsperAPI, MockServer
+from esper.ext import api_client
+from esper.ext.api_client import APIClient, EsperSession, get_session
+from esper.ext.bulk import run_concurrently
+from esper.ext.throttle import Throttle, TokenBucket, parse_retry_after, _throttles
+
+
+class ThrottleTest(TestCase):
+
+    def setUp(self) -> None:
+        _throttles.clear()
+
+    def tearDown(self) -> None:
+        _throttles.clear()
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after('3') == 3.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after('soon') is None
+        assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+    def test_token_bucket_rate(self):
+        bucket = TokenBucket(rate=50, burst=5)
+        started = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+
+        # 5 from the burst, then 10 at 50/s
+        assert time.monotonic() - started >= 0.18
+
+    def test_retry_policy(self):
+        throttle = Throttle(0, 10, 4, retries=2, backoff_base=0.1, backoff_max=1)
+        assert throttle.should_retry('POST', 429, None, 0)
+        assert not throttle.should_retry('POST', 503, None, 0)
+        assert throttle.should_retry('GET', 503, None, 1)
+        assert not throttle.should_retry('GET', 503, None, 2)
+        assert not throttle.should_retry('GET', 404, ApiException(status=404), 0)
+        assert throttle.should_retry('GET', None, ConnectionResetError(), 0)
+        assert not throttle.should_retry('GET', None, ValueError(), 0)
+        assert throttle.backoff(0, retry_after=0.7) >= 0.7
+
+    def test_retry_after_is_a_minimum(self):
+        class Throttled(object):
+            def __init__(self, retry_after, status_code=429):
+                self.status_code = status_code
+                self.headers = {'Retry-After': retry_after}
+
+        throttle = Throttle(0, 10, 4, retries=2, backoff_base=0.1, backoff_max=1)
+        slept = []
+        throttle.sleep = slept.append
+        throttle.bucket.pause = lambda seconds: None
+
+        responses = iter([Throttled('1.5'), Throttled(None, 200)])
+        assert throttle.call('GET', lambda: next(responses)).status_code == 200
+        assert slept[0] == 1.5
+
+        # Longer than both retries may wait: given up without waiting
+        slept.clear()
+        assert throttle.call('GET', lambda: Throttled('5')).status_code == 429
+        assert slept == []
+
+    def test_throttled_requests_are_retried(self):
+        fleet = Fleet(devices=10, groups=1, applications=1)
+        api = MockEsperAPI(fleet, rate_limit=2)
+
+        with MockServer(api) as server:
+            session = EsperSession()
+            statuses = [session.get(f'{server.url}/api/v1/token-info/').status_code for _ in range(4)]
+            assert statuses == [200] * 4
+            assert api.throttled_count >= 1
+
+            client = APIClient({'api_key': 'bench-token', 'environment': 'bench'})
+            client.config.host = f'{server.url}/api'
+            group_client = client.get_group_api_client()
+            for _ in range(3):
+                response = group_client.get_all_groups(fleet.enterprise_id)
+                assert response.count == 2
+
+    def test_one_session_is_shared_by_threads(self):
+        init = EsperSession.__init__
+
+        def slow_init(session):
+            time.sleep(0.05)
+            init(session)
+
+        with mock.patch.object(api_client, '_session', None), mock.patch.object(EsperSession, '__init__', slow_init):
+            results = run_concurrently(lambda _: get_session(), range(8))
+        assert not any(error for _, _, error in results)
+        assert len({id(session) for _, session, _ in results}) == 1
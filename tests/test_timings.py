@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from esper.ext.api_client import EsperSession
+from esper.ext.timings import recorder, url_template
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'{"results": []}'
+        self.send_response(404 if 'missing' in self.path else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TimingsTest(TestCase):
+
+    def setUp(self) -> None:
+        self.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+        self.trace_file = os.path.join(tempfile.mkdtemp(), 'traces.jsonl')
+        recorder.enable(trace_file=self.trace_file)
+
+    def tearDown(self) -> None:
+        recorder.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_url_template(self):
+        url = 'https://foo-api.esper.cloud/api/v1/enterprise/0b6a5d92-f9d4-4d21-9c4c-cc9e3b2f1b8a/pipeline/?limit=10'
+        assert url_template(url) == '/api/v1/enterprise/{id}/pipeline/'
+        assert url_template('https://foo-api.esper.cloud/api/graph/battery/level/') == '/api/graph/battery/level/'
+
+    def test_session_records_requests(self):
+        session = EsperSession()
+        session.get(f"{self.base_url}/api/enterprise/0b6a5d92-f9d4-4d21-9c4c-cc9e3b2f1b8a/device/")
+        session.get(f"{self.base_url}/api/enterprise/7e0ac2d0-4b3e-4cf6-9b7e-0b0d8f3b6b11/device/")
+        session.get(f"{self.base_url}/api/missing/")
+
+        records = recorder.records
+        assert len(records) == 3
+        assert records[0]['url'] == '/api/enterprise/{id}/device/'
+        assert records[0]['status'] == 200
+        assert records[0]['bytes'] == len(b'{"results": []}')
+        assert records[0]['connect_ms'] > 0
+        assert records[0]['total_ms'] >= records[0]['ttfb_ms']
+        assert records[2]['status'] == 404
+
+        with open(self.trace_file) as f:
+            traces = [json.loads(line) for line in f]
+        assert len(traces) == 3
+
+    def test_summary_aggregates_by_template(self):
+        session = EsperSession()
+        for _ in range(3):
+            session.get(f"{self.base_url}/api/enterprise/0b6a5d92-f9d4-4d21-9c4c-cc9e3b2f1b8a/device/")
+        session.get(f"{self.base_url}/api/missing/")
+
+        rows = {row['URL']: row for row in recorder.summary()}
+        assert rows['/api/enterprise/{id}/device/']['CALLS'] == 3
+        assert rows['/api/enterprise/{id}/device/']['ERRORS'] == 0
+        assert rows['/api/missing/']['ERRORS'] == 1
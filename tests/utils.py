@@ -1,9 +1,16 @@
 import os
+import shutil
+import tempfile
 from os import path
+from unittest import TestCase, mock
 
 from clint.textui import prompt
+from tinydb import TinyDB
 
-from esper.main import EsperTest
+from benchmarks.fleet import Fleet
+from benchmarks.mock_api import MockEsperAPI, MockServer
+from esper.ext.db_wrapper import DBWrapper
+from esper.main import EsperTest, TEST_CONFIG
 
 
 def get_esper_credentials():
@@ -45,3 +52,49 @@ def set_configure(monkeypatch):
 def teardown():
     if path.exists('creds.json'):
         os.remove('creds.json')
+
+
+class MockApiTestCase(TestCase):
+    """
+    Runs each test against a local mock Esper API (see `benchmarks.mock_api`), from a temporary working directory
+    holding the credentials EsperTest reads from `./creds.json`. The server, directory and environment are torn
+    down after every test.
+    """
+
+    # Keyword arguments of the Fleet served by the mock API
+    fleet_options = {}
+
+    def create_fleet(self) -> Fleet:
+        return Fleet(**self.fleet_options)
+
+    def setUp(self) -> None:
+        self.fleet = self.create_fleet()
+        self.api = MockEsperAPI(self.fleet)
+        self.server = MockServer(self.api).start()
+        self.addCleanup(self.server.stop)
+
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        os.chdir(self.tmp)
+        self.addCleanup(os.chdir, self.cwd)
+
+        DBWrapper(TinyDB('creds.json')).set_configure({
+            'environment': 'bench',
+            'api_key': 'bench-token',
+            'enterprise_id': self.fleet.enterprise_id
+        })
+
+        self.set_env(ESPER_API_HOST=self.server.url)
+
+    def set_env(self, **values) -> None:
+        """Set environment variables until the end of the test"""
+        patch = mock.patch.dict(os.environ, values)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def set_config(self, **values) -> None:
+        """Override `esper` config settings of the EsperTest apps created until the end of the test"""
+        patch = mock.patch.dict(TEST_CONFIG['esper'], values)
+        patch.start()
+        self.addCleanup(patch.stop)